@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for :class:`nti.contentlibrary.indexed_data.index.ContainedObjectCatalog`
+queries against a synthetic catalog.
+
+Usage: python bench_contained_catalog.py [number of assets]
+
+The default is a million assets spread across a handful of sites,
+types and namespaces, and many containers, which is roughly the shape
+of a production catalog. One container holds half of the assets, as
+the containers of a large package do.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import time
+
+from nti.contentlibrary.indexed_data.index import to_iterable
+from nti.contentlibrary.indexed_data.index import ContainedObjectCatalog
+
+from nti.zope_catalog.index import ValueIndex as RawValueIndex
+
+SITES = 5
+TYPES = 8
+NAMESPACES = 500
+CONTAINERS = 50000
+
+
+def fixed_order_references(catalog, container_ntiids=None, provided=None,
+                           namespace=None, ntiid=None, sites=None, target=None):
+    """
+    The query strategy used before the planner: every index is applied
+    in a fixed order and intersected.
+    """
+    result = None
+    family = catalog.family
+    for index, value in ((catalog.site_index, sites),
+                         (catalog.ntiid_index, ntiid),
+                         (catalog.type_index, provided),
+                         (catalog.target_index, target),
+                         (catalog.namespace_index, namespace),
+                         (catalog.container_index, container_ntiids)):
+        if value is not None:
+            query = 'all_of' if index is catalog.container_index else 'any_of'
+            ids = index.apply({query: to_iterable(value)}) or family.IF.LFSet()
+            result = ids if result is None else family.IF.intersection(result, ids)
+    return result if result else family.IF.LFSet()
+
+
+def populate(catalog, count):
+    # Index the raw values directly; adapting real assets would
+    # dominate the setup time without changing the index shapes.
+    index_raw = RawValueIndex.index_doc
+    for doc_id in range(count):
+        index_raw(catalog.site_index, doc_id, u'site%d' % (doc_id % SITES))
+        index_raw(catalog.type_index, doc_id, u'type%d' % (doc_id % TYPES))
+        index_raw(catalog.ntiid_index, doc_id, u'tag:asset-%d' % doc_id)
+        catalog.namespace_index.index_doc(doc_id, u'ns%d' % (doc_id % NAMESPACES))
+        containers = (u'c%d' % (doc_id % CONTAINERS),)
+        if doc_id % 2:
+            # A skewed container, holding half of everything
+            containers += (u'hot',)
+        catalog.container_index.index_doc(doc_id, containers)
+
+
+def bench(name, func, repeat=20):
+    start = time.time()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.time() - start) / repeat
+    print('%-45s %10.3f ms %8d results' % (name, elapsed * 1000, len(result)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    catalog = ContainedObjectCatalog()
+    start = time.time()
+    populate(catalog, count)
+    print('Indexed %d assets in %.1fs' % (count, time.time() - start))
+
+    queries = (
+        ('site + type + container',
+         dict(sites=(u'site1',), provided=u'type1', container_ntiids=u'c1')),
+        ('site + ntiid',
+         dict(sites=(u'site1', u'site2'), ntiid=u'tag:asset-6')),
+        ('site + type + namespace',
+         dict(sites=(u'site3',), provided=u'type3', namespace=u'ns3')),
+        ('site + type + hot container',
+         dict(sites=(u'site1',), provided=u'type1', container_ntiids=u'hot')),
+        ('namespace + hot container',
+         dict(namespace=u'ns3', container_ntiids=u'hot')),
+        ('site + missing container',
+         dict(sites=(u'site1',), container_ntiids=u'missing')),
+    )
+    for name, query in queries:
+        bench('fixed order: ' + name,
+              lambda: fixed_order_references(catalog, **query))
+        bench('planned:     ' + name,
+              lambda: catalog.get_references(**query))
+
+
+if __name__ == '__main__':
+    main()
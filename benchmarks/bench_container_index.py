@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the size and query speed of the plain and the interned
+container indexes of
+:class:`nti.contentlibrary.indexed_data.index.ContainedObjectCatalog`.
+
+Usage: python bench_container_index.py [number of assets]
+
+Sizes are those of the pickled index BTrees, which is what ZODB stores.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import time
+
+from six.moves import cPickle as pickle
+
+import BTrees
+
+from nti.contentlibrary.indexed_data.index import KeepSetIndex
+from nti.contentlibrary.indexed_data.index import InternedKeepSetIndex
+
+CONTAINERS = 20000
+CONTAINERS_PER_ASSET = 3
+
+PREFIX = u'tag:nextthought.com,2011-10:NTI-HTML-Book_Of_Many_Sections.chapter_%d.section_%d'
+
+
+def container(i):
+    return PREFIX % (i // 100, i % 100)
+
+
+def populate(index, count):
+    for doc_id in range(count):
+        index.index_doc(doc_id,
+                        [container((doc_id + i * 7) % CONTAINERS)
+                         for i in range(CONTAINERS_PER_ASSET)])
+
+
+def size(index):
+    result = 0
+    for name in ('values_to_documents', 'documents_to_values', '_ids', '_values'):
+        tree = getattr(index, name, None)
+        if tree is not None:
+            result += len(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+    return result
+
+
+def bench(name, func, repeat=1000):
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.time() - start) / repeat
+    print('%-40s %10.3f ms' % (name, elapsed * 1000))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    sys.setrecursionlimit(100000)
+    for factory in (KeepSetIndex, InternedKeepSetIndex):
+        index = factory(family=BTrees.family64)
+        start = time.time()
+        populate(index, count)
+        name = factory.__name__
+        print('%s: indexed %d assets in %.1fs, %.1f MB' %
+              (name, count, time.time() - start, size(index) / 1024 / 1024))
+        single = [container(1)]
+        several = [container(1), container(8), container(15)]
+        bench(name + ' any_of one',
+              lambda: index.apply({'any_of': single}))
+        bench(name + ' any_of three',
+              lambda: index.apply({'any_of': several}))
+        bench(name + ' all_of three',
+              lambda: index.apply({'all_of': several}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares building the content units of a package by parsing its TOC
+XML with building them from the compiled TOC stored by
+:class:`nti.contentlibrary.toc_cache.FilesystemCompiledTOCCache`, on
+synthetic TOCs of increasing size.
+
+Usage: python bench_toc_cache.py
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import marshal
+
+from lxml import etree
+
+from nti.contentlibrary.contentunit import ContentUnit
+from nti.contentlibrary.contentunit import ContentPackage
+
+from nti.contentlibrary.eclipse import _tocItem
+from nti.contentlibrary.eclipse import compile_toc
+from nti.contentlibrary.eclipse import _tocItem_from_compiled
+
+NTIID = u'tag:nextthought.com,2011-10:NTI-HTML-Book_Of_Many_Sections.%s'
+
+
+class TOCEntry(object):
+
+    def make_sibling_key(self, name):
+        return name
+
+
+def toc(chapters, sections):
+    root = etree.Element('toc', ntiid=NTIID % 'book', href='index.html',
+                         label='Book', renderVersion='2')
+    for i in range(chapters):
+        chapter = etree.SubElement(root, 'topic', ntiid=NTIID % i,
+                                   href='chapter_%d.html' % i,
+                                   label='Chapter %d' % i,
+                                   icon='icons/chapter_%d.png' % i)
+        for j in range(sections):
+            name = '%d.%d' % (i, j)
+            section = etree.SubElement(chapter, 'topic', ntiid=NTIID % name,
+                                       href='section_%s.html' % name,
+                                       label='Section %s' % name,
+                                       NTIRelativeScrollHeight='100')
+            etree.SubElement(section, 'object', ntiid=NTIID % (name + '.video'))
+    return etree.tostring(root)
+
+
+def from_xml(data):
+    root = etree.fromstring(data)
+    return _tocItem(root, TOCEntry(),
+                    factory=ContentPackage, child_factory=ContentUnit)
+
+
+def from_compiled(blob):
+    compiled = marshal.loads(blob)
+    return _tocItem_from_compiled(compiled[2], TOCEntry(),
+                                  factory=ContentPackage,
+                                  child_factory=ContentUnit)
+
+
+def bench(name, func, repeat=20):
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.time() - start) / repeat
+    print('%-40s %10.3f ms' % (name, elapsed * 1000))
+
+
+def main():
+    for chapters, sections in ((10, 10), (50, 40), (200, 50)):
+        data = toc(chapters, sections)
+        blob = marshal.dumps(compile_toc(etree.fromstring(data)))
+        units = 1 + chapters + chapters * sections
+        print('%d units: %d bytes of XML, %d bytes compiled' %
+              (units, len(data), len(blob)))
+        bench('parse XML', lambda: etree.fromstring(data))
+        bench('load compiled', lambda: marshal.loads(blob))
+        bench('units from XML', lambda: from_xml(data))
+        bench('units from compiled', lambda: from_compiled(blob))
+
+
+if __name__ == '__main__':
+    main()
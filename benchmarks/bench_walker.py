@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares recursive traversal of content unit trees with the iterative
+walkers of :mod:`nti.contentlibrary.walker` on deep and wide synthetic
+trees.
+
+Usage: python bench_walker.py
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import time
+
+from nti.contentlibrary.walker import walk_pre_order
+from nti.contentlibrary.walker import walk_post_order
+
+
+class Unit(object):
+
+    __slots__ = ('ntiid', 'children')
+
+    def __init__(self, ntiid):
+        self.ntiid = ntiid
+        self.children = []
+
+
+def deep(depth):
+    root = unit = Unit(0)
+    for i in range(1, depth):
+        child = Unit(i)
+        unit.children.append(child)
+        unit = child
+    return root
+
+
+def wide(fanout, levels):
+    root = Unit(0)
+    layer = [root]
+    count = 1
+    for _ in range(levels):
+        next_layer = []
+        for unit in layer:
+            for _ in range(fanout):
+                child = Unit(count)
+                count += 1
+                unit.children.append(child)
+                next_layer.append(child)
+        layer = next_layer
+    return root
+
+
+def recursive_pre_order(unit):
+    result = []
+
+    def _recur(unit):
+        result.append(unit)
+        for child in unit.children:
+            _recur(child)
+    _recur(unit)
+    return result
+
+
+def recursive_post_order(unit):
+    result = {}
+
+    def _recur(unit):
+        for child in unit.children:
+            _recur(child)
+        result[unit.ntiid] = unit
+    _recur(unit)
+    return result
+
+
+def bench(name, func, repeat=10):
+    start = time.time()
+    try:
+        for _ in range(repeat):
+            func()
+    except RuntimeError as e:  # recursion limit
+        print('%-40s %s' % (name, type(e).__name__))
+        return
+    elapsed = (time.time() - start) / repeat
+    print('%-40s %10.3f ms' % (name, elapsed * 1000))
+
+
+def main():
+    print('recursion limit: %s' % sys.getrecursionlimit())
+    trees = (('wide (10^5 units)', wide(10, 5)),
+             ('deep (900 levels)', deep(900)),
+             ('deep (50000 levels)', deep(50000)))
+    for name, tree in trees:
+        bench('recursive pre-order, ' + name,
+              lambda: recursive_pre_order(tree))
+        bench('iterative pre-order, ' + name,
+              lambda: list(walk_pre_order(tree)))
+        bench('recursive post-order map, ' + name,
+              lambda: recursive_post_order(tree))
+        bench('iterative post-order map, ' + name,
+              lambda: {x.ntiid: x for x in walk_post_order(tree)})
+
+
+if __name__ == '__main__':
+    main()
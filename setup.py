@@ -4,6 +4,9 @@ from setuptools import setup, find_packages
 entry_points = {
     'console_scripts': [
         "nti_s3put = nti.contentlibrary.nti_s3put:main",
+        "nti_precompress = nti.contentlibrary.precompress:main",
+        "nti_pack = nti.contentlibrary.packed:main",
+        "nti_library_memory = nti.contentlibrary.preload:main",
     ]
 }
 
@@ -80,6 +83,7 @@ setup(
         'PyYAML',
         'repoze.lru',
         'six',
+        'transaction',
         'WebOb',
         'zc.catalog',
         'ZODB',
@@ -110,6 +114,9 @@ setup(
             'repoze.sphinx.autointerface',
             'sphinx_rtd_theme',
         ],
+        'brotli': [
+            'brotli',
+        ],
     },
     entry_points=entry_points,
 )
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`asyncio` access to content.
+
+The hierarchy entry API (:class:`.IDelimitedHierarchyEntry`) blocks on
+the filesystem or the network. :class:`AsyncHierarchyEntry` offers the
+same reads as awaitables for code running in an event loop. The
+blocking calls are made in a thread pool whose size bounds the number
+of reads in progress at once, however many are awaited; contents can
+also be streamed in chunks with :meth:`AsyncHierarchyEntry.iter_contents`.
+
+Keys stored in ZODB are read in the event loop thread instead, since
+a connection must not be used from other threads; their contents are
+in memory (or one object load away) anyway. An entry stored in ZODB
+whose key is not, such as a persistent filesystem content unit, only
+has its key looked up in the loop thread; the key is read in the pool.
+
+This module needs Python 3, but does not use the ``async`` syntax so
+that it can be imported (and not used) under Python 2.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import zlib
+import threading
+
+from six import BytesIO
+
+from persistent import Persistent
+
+from nti.contentlibrary.interfaces import IS3Key
+from nti.contentlibrary.interfaces import IDelimitedHierarchyEntry
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+#: The default number of reads in progress at once
+DEFAULT_CONCURRENCY = 16
+
+#: The default size of the chunks of streamed contents
+STREAM_CHUNK_SIZE = 64 * 1024
+
+logger = __import__('logging').getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def default_executor():
+    """
+    The thread pool shared by entries that are not given one, of
+    :data:`DEFAULT_CONCURRENCY` threads.
+    """
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(DEFAULT_CONCURRENCY,
+                                               'nti.contentlibrary.aio')
+    return _executor
+
+
+def _is_thread_safe(obj):
+    return not isinstance(obj, Persistent)
+
+
+def _running_loop():
+    # asyncio.get_running_loop is new in Python 3.7
+    get_running_loop = getattr(asyncio, 'get_running_loop', None)
+    if get_running_loop is None:  # pragma: no cover
+        return asyncio.get_event_loop()
+    return get_running_loop()
+
+
+def _call_s3(key, name, *args):
+    """
+    Call the entry method `name` on a key of our own: boto keys hold
+    the response of their last request, so the pool threads must not
+    share one. Each request takes a connection of its own from the
+    pool of the bucket's connection.
+    """
+    entry = IDelimitedHierarchyEntry(key.bucket.new_key(key.name))
+    return getattr(entry, name)(*args)
+
+
+class _Stream(object):
+    """
+    Blocking chunked reads of a key.
+    """
+
+    def __init__(self, key, chunk_size):
+        self.key = key
+        self.chunk_size = chunk_size
+        self._read = None
+        self._close = None
+
+    def _open(self):
+        key = self.key
+        path = getattr(key, 'absolute_path', None)
+        if path is not None:
+            f = open(path, 'rb')
+            self._read = lambda: f.read(self.chunk_size)
+            self._close = f.close
+        elif IS3Key.providedBy(key):
+            # A key of our own, since boto keys hold the response
+            s3_key = key.bucket.new_key(key.name)
+            s3_key.open_read()
+            decompress = None
+            if s3_key.content_encoding == 'gzip':
+                decompress = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+
+            def read():
+                # Compressed chunks may decompress to nothing
+                while True:
+                    data = s3_key.read(self.chunk_size)
+                    if not data or decompress is None:
+                        return data
+                    data = decompress(data)
+                    if data:
+                        return data
+            self._read = read
+            self._close = s3_key.close
+        else:
+            stream = BytesIO(IDelimitedHierarchyEntry(key).read_contents() or b'')
+            self._read = lambda: stream.read(self.chunk_size)
+            self._close = stream.close
+
+    def read(self):
+        if self._read is None:
+            self._open()
+        data = self._read()
+        if not data:
+            self.close()
+            raise StopAsyncIteration()
+        return data
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+class AsyncContentsIterator(object):
+    """
+    An asynchronous iterator over the contents of a key, in chunks.
+    Use with ``async for``; call :meth:`aclose` when stopping early.
+    """
+
+    def __init__(self, key, chunk_size, run):
+        self._stream = _Stream(key, chunk_size)
+        self._run = run
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._run(self._stream.key, self._stream.read)
+
+    def aclose(self):
+        return self._run(self._stream.key, self._stream.close)
+
+
+class AsyncHierarchyEntry(object):
+    """
+    The asynchronous counterpart of an :class:`.IDelimitedHierarchyEntry`,
+    such as a content unit. Each method returns an awaitable.
+    """
+
+    def __init__(self, entry, executor=None, loop=None):
+        """
+        :param entry: The :class:`.IDelimitedHierarchyEntry` to read.
+        :param executor: The executor making the blocking calls; by
+            default the :func:`default_executor`.
+        :param loop: The event loop; by default the running one when
+            each call is made, which must then be made in a coroutine.
+        """
+        if asyncio is None:  # pragma: no cover
+            raise TypeError("asyncio is not available")
+        self.entry = entry
+        self.executor = executor
+        self.loop = loop
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.entry)
+
+    def _run(self, obj, func, *args):
+        loop = self.loop or _running_loop()
+        if not _is_thread_safe(obj):
+            result = loop.create_future()
+            try:
+                result.set_result(func(*args))
+            except Exception as e:  # pylint: disable=broad-except
+                result.set_exception(e)
+            return result
+        executor = self.executor or default_executor()
+        return loop.run_in_executor(executor, func, *args)
+
+    def _reader(self):
+        """
+        The entry to make the reads of, in this thread: the entry of
+        the key of an entry in ZODB whose key can be read in the pool,
+        otherwise the entry itself.
+        """
+        entry = self.entry
+        if _is_thread_safe(entry):
+            return entry
+        key = getattr(entry, 'key', None)
+        if key is None or not _is_thread_safe(key):
+            return entry
+        return IDelimitedHierarchyEntry(key, None) or entry
+
+    def _call(self, name, *args):
+        reader = self._reader()
+        key = getattr(reader, 'key', None)
+        if _is_thread_safe(reader) and IS3Key.providedBy(key):
+            return self._run(reader, _call_s3, key, name, *args)
+        return self._run(reader, getattr(reader, name), *args)
+
+    def read_contents(self):
+        return self._call('read_contents')
+
+    def read_contents_of_sibling_entry(self, sibling_name):
+        return self._call('read_contents_of_sibling_entry', sibling_name)
+
+    def does_sibling_entry_exist(self, sibling_name):
+        return self._call('does_sibling_entry_exist', sibling_name)
+
+    def read_contents_of_sibling_entries(self, sibling_names):
+        """
+        Read several siblings concurrently.
+
+        :return: An awaitable of the list of their contents, in order.
+        """
+        return asyncio.gather(*[self.read_contents_of_sibling_entry(x)
+                                for x in sibling_names])
+
+    def iter_contents(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Return an :class:`AsyncContentsIterator` over the contents of the
+        key of the entry. Files and S3 keys are read a chunk at a time;
+        other keys are read whole, then handed out in chunks.
+        """
+        key = getattr(self.entry, 'key', self.entry)
+        return AsyncContentsIterator(key, chunk_size, self._run)
+
+    def iter_contents_of_sibling_entry(self, sibling_name,
+                                       chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Like :meth:`iter_contents`, for a sibling of the entry.
+        """
+        key = self._reader().make_sibling_key(sibling_name)
+        return AsyncContentsIterator(key, chunk_size, self._run)
+
+
+def async_entry(context, executor=None, loop=None):
+    """
+    Return an :class:`AsyncHierarchyEntry` for `context`, an entry or
+    a key that can be adapted to one.
+    """
+    entry = IDelimitedHierarchyEntry(context)
+    return AsyncHierarchyEntry(entry, executor=executor, loop=loop)
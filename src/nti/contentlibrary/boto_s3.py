@@ -40,6 +40,9 @@ from nti.contentlibrary import library
 from nti.contentlibrary.contentunit import ContentUnit
 from nti.contentlibrary.contentunit import ContentPackage
 
+from nti.contentlibrary.existence import s3_key_lookup
+from nti.contentlibrary.existence import seed_s3_prefixes
+
 from nti.contentlibrary.interfaces import IS3Key
 from nti.contentlibrary.interfaces import IS3Bucket
 from nti.contentlibrary.interfaces import IS3ContentUnit
@@ -47,6 +50,13 @@ from nti.contentlibrary.interfaces import IS3ContentPackage
 from nti.contentlibrary.interfaces import IDelimitedHierarchyEntry
 from nti.contentlibrary.interfaces import IEclipseContentPackageFactory
 
+from nti.contentlibrary.packed import PACKED_EXTENSION
+
+from nti.contentlibrary.packed import S3PackedArchive
+
+from nti.contentlibrary.packed import packed_bucket
+from nti.contentlibrary.packed import packed_package_factory
+
 # We mark all of the classes declared here as
 # non-pickalable, because we don't have their persistence
 # worked out yet.
@@ -58,6 +68,7 @@ from nti.property.property import alias
 # ILocation like and giving them interfaces
 import boto.s3.key
 import boto.s3.bucket
+from boto.exception import S3ResponseError
 from boto.exception import AWSConnectionError
 
 interface.classImplements(boto.s3.key.Key, IS3Key)
@@ -108,6 +119,14 @@ class NameEqualityKey(boto.s3.key.Key):
     def __hash__(self):
         return hash(self.name) + 37 + hash(self.bucket)
 
+    def readCompressedContents(self, encoding):
+        """
+        Return the stored bytes if this key is stored compressed with
+        `encoding` (as :mod:`.nti_s3put` does), otherwise None.
+        """
+        data, content_encoding = _read_key_encoded(self)
+        return data if content_encoding == encoding else None
+
 
 class NameEqualityBucket(boto.s3.bucket.Bucket):
     """
@@ -158,17 +177,25 @@ def key_last_modified(key):
     return result
 
 
-from nti.contentlibrary.contentunit import _exist_cache
 from nti.contentlibrary.contentunit import _content_cache
 
 
-# first arg is ignored. This caches with the key (key,)
+# This caches with the key (key,). Only the stored bytes are cached,
+# which may be compressed; the contents are derived from them.
 @repoze.lru.lru_cache(None, cache=_content_cache)
+def _read_key_encoded(key):
+    """
+    Return the bytes stored for the key and their content encoding.
+    """
+    data = key.get_contents_as_string()
+    return data, key.content_encoding
+
+
 def _read_key(key):
     data = None
     if key:
-        data = key.get_contents_as_string()
-        if key.content_encoding == 'gzip':
+        data, content_encoding = _read_key_encoded(key)
+        if content_encoding == 'gzip':
             stream = BytesIO(data)
             gzip_stream = gzip.GzipFile(fileobj=stream, mode='rb')
             data = gzip_stream.read()
@@ -204,20 +231,31 @@ class _KeyDelimitedHierarchyEntry(object):
         return _read_key(self.key)
 
     def read_contents_of_sibling_entry(self, sibling_name):
-        new_key = self.does_sibling_entry_exist(sibling_name)
-        return _read_key(new_key)
+        # Not a cached key: reading changes the state of a boto key
+        sib_key = self.make_sibling_key(sibling_name).name
+        return _read_key(self._get_key(sib_key))
+
+    def _get_key(self, name):
+        try:
+            return self.key.bucket.get_key(name)
+        except AttributeError:  # seen when we are not connected
+            raise AWSConnectionError("No connection")
 
     def does_sibling_entry_exist(self, sibling_name):
         """
         :return: Either a Key containing some information about an existing
                 sibling (and which is True) or None for an absent sibling (False).
+                Both are cached in the :mod:`.existence` cache.
         """
-        bucket = self.key.bucket
         sib_key = self.make_sibling_key(sibling_name).name
-        try:
-            return bucket.get_key(sib_key)
-        except AttributeError:  # seen when we are not connected
-            raise AWSConnectionError("No connection")
+        return s3_key_lookup(self.key.bucket, sib_key,
+                             lambda: self._get_key(sib_key))
+
+    def exists_many(self, sibling_names):
+        # Enough names are answered from listings of their prefixes
+        names = [self.make_sibling_key(x).name for x in sibling_names]
+        seed_s3_prefixes(self.key.bucket, names)
+        return {x: self.does_sibling_entry_exist(x) for x in sibling_names}
 
 
 @NoPickle
@@ -280,12 +318,14 @@ class BotoS3ContentUnit(ContentUnit):
             entry = IDelimitedHierarchyEntry(self.key)
             return entry.read_contents_of_sibling_entry(sibling_name)
 
-    # first arg is ignored. This caches with the key (self, sibling_name)
-    @repoze.lru.lru_cache(None, cache=_exist_cache)
     def does_sibling_entry_exist(self, sibling_name):
         entry = IDelimitedHierarchyEntry(self.key)
         return entry.does_sibling_entry_exist(sibling_name)
 
+    def exists_many(self, sibling_names):
+        entry = IDelimitedHierarchyEntry(self.key)
+        return entry.exists_many(sibling_names)
+
 
 @NoPickle
 @interface.implementer(IS3ContentPackage)
@@ -299,6 +339,15 @@ class BotoS3ContentPackage(ContentPackage, BotoS3ContentUnit):
 
 def boto_s3_package_factory(key, _package_factory=None, _unit_factory=None):
 
+    if key.name.endswith(PACKED_EXTENSION):
+        try:
+            archive = S3PackedArchive(key)
+        except (IOError, ValueError, S3ResponseError):
+            logger.exception("Failed to read packed archive %s", key.name)
+            return None
+        name = key.name[:-len(PACKED_EXTENSION)]
+        return packed_package_factory(packed_bucket(archive, None, name))
+
     _unit_factory = _unit_factory or BotoS3ContentUnit
     _package_factory = _package_factory or BotoS3ContentPackage
 
@@ -13,6 +13,7 @@ from __future__ import absolute_import
 import time
 
 from BTrees.OOBTree import OOSet
+from BTrees.OOBTree import OOBTree
 from BTrees.OOBTree import difference as ooset_difference
 
 from ZODB.POSException import ConnectionStateError
@@ -51,6 +52,8 @@ from nti.contentlibrary.interfaces import ContentPackageBundleVendorInfoSynchron
 
 from nti.contentlibrary.presentationresource import DisplayableContentMixin
 
+from nti.contentlibrary.wref import resolve_content_unit_wrefs
+
 from nti.coremetadata.interfaces import SYSTEM_USER_ID
 
 from nti.dublincore.time_mixins import CreatedAndModifiedTimeMixin
@@ -162,12 +165,8 @@ class PersistentContentPackageBundle(ContentPackageBundle,
         self._ContentPackages_wrefs = OOSet(IWeakRef(p) for p in packages)
 
     def _get_ContentPackages(self):
-        result = list()
-        for x in self._ContentPackages_wrefs:
-            x = x()
-            if x is not None:
-                result.append(x)
-        return result
+        packages = resolve_content_unit_wrefs(self._ContentPackages_wrefs)
+        return [x for x in packages if x is not None]
     ContentPackages = property(_get_ContentPackages, _set_ContentPackages)
 
     def add(self, context):
@@ -218,6 +217,10 @@ class ContentPackageBundleLibrary(CheckingLastModifiedBTreeContainer):
 
     __external_can_create__ = False
 
+    #: A map from the name of a bundle bucket to the ``(ntiid, lastModified)``
+    #: of its meta info file, as of the last time it was synced.
+    _bundle_meta_stamps = None
+
     def __repr__(self):
         try:
             return "<%s(%s, %s) at %s>" % (self.__class__.__name__,
@@ -573,17 +576,56 @@ class _ContentPackageBundleLibrarySynchronizer(object):
     def __init__(self, context):
         self.context = context
 
-    def syncFromBucket(self, bucket):
+    def _is_unchanged(self, name, bundle_meta_key, stamps):
+        """
+        Check the recorded stamp of the named bundle bucket. If the meta
+        info file has not been modified since we last synced it, and the
+        bundle is still in our context and at least as recent, we can skip
+        reading and parsing it entirely.
+        """
+        stamp = stamps.get(name) if stamps else None
+        if stamp is None:
+            return False
+        ntiid, last_modified = stamp
+        if last_modified != bundle_meta_key.lastModified:
+            return False
+        # local only, parent libraries are not consulted
+        if ntiid not in self.context:
+            return False
+        return self.context[ntiid].lastModified >= last_modified
+
+    def _record_stamps(self, names, bundle_metas):
+        # pylint: disable=protected-access
+        stamps = self.context._bundle_meta_stamps
+        if stamps is None:
+            stamps = self.context._bundle_meta_stamps = OOBTree()
+        for meta in bundle_metas:
+            name = meta.key.__parent__.__name__
+            stamp = (meta.ntiid, meta.lastModified)
+            # Only write if changed, to avoid conflicts
+            if stamps.get(name) != stamp:
+                stamps[name] = stamp
+        for name in [x for x in stamps if x not in names]:
+            del stamps[name]
+
+    def syncFromBucket(self, bucket, fast=True):
         """
         Sync anything we have on disk, without removing any bundles
         that may have been created through some API.
+
+        :keyword fast: If true (the default), bundle meta info files
+            whose modification time matches the one recorded during
+            the last sync are not read or parsed.
         """
         sm = component.getSiteManager(self.context)
         content_library = sm.getUtility(IContentPackageLibrary)
         _readCurrent(content_library)
         _readCurrent(self.context)
 
+        names = set()
         bundle_meta_keys = list()
+        # pylint: disable=protected-access
+        stamps = self.context._bundle_meta_stamps if fast else None
 
         for child in bucket.enumerateChildren():
             if not IEnumerableDelimitedHierarchyBucket.providedBy(child):
@@ -593,12 +635,16 @@ class _ContentPackageBundleLibrarySynchronizer(object):
             if not IDelimitedHierarchyKey.providedBy(bundle_meta_key):
                 # Not a readable file
                 continue
+            names.add(child.__name__)
+            if self._is_unchanged(child.__name__, bundle_meta_key, stamps):
+                continue
             bundle_meta_keys.append(bundle_meta_key)
 
         need_event = False
 
         bundle_metas = {_ContentBundleMetaInfo(k, content_library)
                         for k in bundle_meta_keys}
+        self._record_stamps(names, bundle_metas)
         # Now determine what to add/update.
         # Order matters here, very much.
         # The __contains__ operation for keys does not take parent
@@ -24,6 +24,8 @@ from nti.contentlibrary.interfaces import IPotentialLegacyCourseConflatedContent
 
 from nti.contentlibrary.presentationresource import DisplayableContentMixin
 
+from nti.contentlibrary.walker import walk_events
+
 from nti.dublincore.time_mixins import DCTimesLastModifiedMixin
 
 from nti.property.property import alias
@@ -93,6 +95,72 @@ class ContentUnit(PermissiveSchemaConfigured,
                 self_dict[str(k)] = v
 
 
+class ContentUnitTable(object):
+    """
+    The units of a content unit tree, listed once and shared by
+    everything that needs to visit them.
+
+    :ivar units: The units, in pre-order.
+    :ivar parents: For each unit, the position in `units` of its
+        parent, or `None` for the root.
+    :ivar by_ntiid: A map from NTIID to unit; for duplicated NTIIDs,
+        the last unit in pre-order wins.
+    :ivar embedded: A map from embedded container NTIID to the
+        positions of the units that embed it.
+    :ivar stamp: The ``index_last_modified`` of the root when
+        the table was built.
+    """
+
+    __slots__ = ('units', 'parents', 'by_ntiid', 'embedded', 'stamp')
+
+    def __init__(self, root, units=None, parents=None):
+        if units is None:
+            # positions of the units on the current path
+            units, parents, path = [], [], []
+            for unit, entering in walk_events(root):
+                if entering:
+                    parents.append(path[-1] if path else None)
+                    path.append(len(units))
+                    units.append(unit)
+                else:
+                    path.pop()
+        self.units = units
+        self.parents = parents
+        self.stamp = getattr(root, 'index_last_modified', None)
+        self.by_ntiid = {unit.ntiid: unit for unit in units}
+        self.embedded = {}
+        for idx, unit in enumerate(units):
+            for ntiid in getattr(unit, 'embeddedContainerNTIIDs', None) or ():
+                self.embedded.setdefault(ntiid, []).append(idx)
+
+    def compact(self):
+        """
+        Replace the lists of the table with tuples, which take less
+        memory and are never written to again, and return the table.
+        """
+        self.units = tuple(self.units)
+        self.parents = tuple(self.parents)
+        self.embedded = {k: tuple(v) for k, v in self.embedded.items()}
+        return self
+
+
+def content_unit_table(unit):
+    """
+    Return the :class:`ContentUnitTable` of the tree under `unit`.
+
+    The table built along with the tree (see
+    :func:`nti.contentlibrary.eclipse.EclipseContentPackage`) is used
+    while the unit's ``index_last_modified`` has not changed;
+    otherwise a fresh table is built and not kept, since trees that
+    can be edited may change without that stamp changing.
+    """
+    table = getattr(unit, '_v_unit_table', None)
+    if      table is not None \
+        and table.stamp == getattr(unit, 'index_last_modified', None):
+        return table
+    return ContentUnitTable(unit)
+
+
 @interface.implementer(IPotentialLegacyCourseConflatedContentPackage)
 class ContentPackage(ContentUnit,
                      DisplayableContentMixin):
@@ -106,6 +174,15 @@ class ContentPackage(ContentUnit,
 
     index_last_modified = -1
 
+    # The digest of the rendered files recorded when the package was
+    # synced in fingerprint mode (see
+    # :func:`nti.contentlibrary.utils.content_package_fingerprint`)
+    contentFingerprint = None
+
+    # The lastModified of newer files found to have the same
+    # fingerprint, so syncs do not compare them again
+    fingerprintLastModified = -1
+
     createFieldProperties(IDisplayableContent,
                           # Omit PPR because of the mixin; otherwise we would
                           # override the mixin
@@ -133,31 +210,18 @@ class ContentPackage(ContentUnit,
 
     @CachedProperty('index_last_modified')
     def _v_references(self):
-        result = {}
-
-        def recur(unit):
-            for child in unit.children or ():
-                recur(child)
-            result[unit.ntiid] = unit
-        recur(self)
-        return result
+        return content_unit_table(self).by_ntiid
 
     def __getitem__(self, ntiid):
         # pylint: disable=unsubscriptable-object
         return self._v_references[ntiid]
 
 
-# We need to do caching of does_sibling_entry_exist and read_contents.
-# does_exist is used by appserver/censor_policies on every object creation/edit
-# which quickly adds up.
-# Right now, our policy for does_exist is a very simple, very dumb cache that we share
-# with all content units, caching questions for 10 minutes.
-# read_contents is not cached
+# We need to do caching of read_contents; does_sibling_entry_exist is
+# cached by the hierarchy entries in nti.contentlibrary.existence.
+# This cache is small because each entry is big.
 import repoze.lru
 
-# this one is big because each entry is small
-_exist_cache = repoze.lru.ExpiringLRUCache(100000, default_timeout=600)
-# this one is smaller because each entry is bigger
 _content_cache = repoze.lru.ExpiringLRUCache(1000, default_timeout=600)
 
 try:
@@ -165,7 +229,4 @@ try:
 except ImportError:  # pragma: no cover
     pass
 else:
-    def _clear_caches():
-        _exist_cache.clear()
-        _content_cache.clear()
-    zope.testing.cleanup.addCleanUp(_clear_caches)
+    zope.testing.cleanup.addCleanUp(_content_cache.clear)
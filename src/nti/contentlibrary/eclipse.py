@@ -12,16 +12,24 @@ from __future__ import absolute_import
 
 # This module is badly named now
 
+import hashlib
+
 from lxml import etree
 
 from six.moves import urllib_parse
 
+from zope import component
 from zope import interface
 
+from nti.contentlibrary.contentunit import ContentUnitTable
+
 from nti.contentlibrary.dublincore import read_dublincore_from_named_key
 
+from nti.contentlibrary.interfaces import ICompiledTOCCache
 from nti.contentlibrary.interfaces import ILegacyCourseConflatedContentPackage
 
+from nti.contentlibrary.walker import walk_events
+
 from nti.ntiids.ntiids import is_valid_ntiid_string
 
 ###
@@ -45,6 +53,13 @@ _toc_item_attrs = ('NTIRelativeScrollHeight', 'label', 'ntiid', 'href')
 # set a 'key' property for BWC
 _toc_item_key_attrs = ('icon', 'thumbnail')
 
+# The attributes of each unit in a compiled TOC, in order
+_compiled_attrs = _toc_item_attrs + ('sharedWith',) + _toc_item_key_attrs
+_shared_with_index = len(_toc_item_attrs)
+
+#: The version of the format produced by :func:`compile_toc`
+COMPILED_TOC_VERSION = 1
+
 logger = __import__('logging').getLogger(__name__)
 
 
@@ -84,17 +99,22 @@ def _href_for_sibling_key(href):
     return path
 
 
-def _tocItem(node, toc_entry, factory=None, child_factory=None):
-    tocItem = factory()
-    # pylint: disable=protected-access
-    tocItem._v_toc_node = node  # for testing and secret stuff
-    for i in _toc_item_attrs:
-        val = _node_get(node, i, i)
-        if val and val is not i:
+def _node_values(node):
+    """
+    The values of the attributes in :data:`_compiled_attrs` of the
+    TOC `node`, None where missing or empty.
+    """
+    return tuple(_node_get(node, i) or None for i in _compiled_attrs)
+
+
+def _toc_item_fill_values(tocItem, values, toc_entry):
+    for i, val in zip(_toc_item_attrs, values):
+        if val:
             setattr(tocItem, str(i), val)
 
-    if node.get('sharedWith', ''):
-        tocItem.sharedWith = _node_get(node, 'sharedWith').split(' ')
+    sharedWith = values[_shared_with_index]
+    if sharedWith:
+        tocItem.sharedWith = sharedWith.split(' ')
 
     # Now the things that should be keys.
     # NOTE: The href may have a fragment in it, but the key is supposed
@@ -104,8 +124,7 @@ def _tocItem(node, toc_entry, factory=None, child_factory=None):
     # about URLs, it is our job to decode them.
     href = tocItem.href
     tocItem.key = toc_entry.make_sibling_key(_href_for_sibling_key(href))
-    for i in _toc_item_key_attrs:
-        val = _node_get(node, i)
+    for i, val in zip(_toc_item_key_attrs, values[_shared_with_index + 1:]):
         if val:
             # We leave it to the toc_entry to decide if/how
             # it needs to deal with multi-level keys, either
@@ -114,19 +133,14 @@ def _tocItem(node, toc_entry, factory=None, child_factory=None):
             setattr(tocItem, str(i),
                     toc_entry.make_sibling_key(_href_for_sibling_key(val)))
 
-    children = tocItem.children_iterable_factory()
-    for ordinal, child in enumerate(node.iterchildren(tag='topic'), 1):
-        child = _tocItem(child,
-                         toc_entry,
-                         factory=child_factory,
-                         child_factory=child_factory)
-        child.__parent__ = tocItem
-        child.ordinal = ordinal
-        child._v_toc_node = child  # for testing and secret stuff
-        children.append(child)
-    if children:
-        tocItem.children = children
 
+def _toc_item_fill(tocItem, node, toc_entry):
+    # pylint: disable=protected-access
+    tocItem._v_toc_node = node  # for testing and secret stuff
+    _toc_item_fill_values(tocItem, _node_values(node), toc_entry)
+
+
+def _node_embedded(node):
     embeddedContainerNTIIDs = list()
     for child in node.iterchildren(tag='object'):
         ntiid = _node_get(child, 'ntiid')
@@ -138,12 +152,145 @@ def _tocItem(node, toc_entry, factory=None, child_factory=None):
 
         if ntiid not in embeddedContainerNTIIDs:
             embeddedContainerNTIIDs.append(ntiid)
+    return tuple(embeddedContainerNTIIDs)
 
+
+def _toc_item_embedded(tocItem, node):
+    embeddedContainerNTIIDs = _node_embedded(node)
     if embeddedContainerNTIIDs:
         # pylint: disable=unused-variable
         __traceback_info__ = embeddedContainerNTIIDs
-        tocItem.embeddedContainerNTIIDs = tuple(embeddedContainerNTIIDs)
-    return tocItem
+        tocItem.embeddedContainerNTIIDs = embeddedContainerNTIIDs
+
+
+def _topics(node):
+    return node.iterchildren(tag='topic')
+
+
+def _tocItem(node, toc_entry, factory=None, child_factory=None,
+             units=None, parents=None):
+    """
+    Build the item tree for the TOC `node`. If given, the `units` and
+    `parents` lists are filled as described by
+    :class:`.ContentUnitTable`.
+    """
+    units = [] if units is None else units
+    parents = [] if parents is None else parents
+    result = None
+    # The (item, children, position) of the path being built
+    stack = []
+    for current, entering in walk_events(node, children=_topics):
+        if entering:
+            tocItem = factory() if not stack else child_factory()
+            _toc_item_fill(tocItem, current, toc_entry)
+            parents.append(stack[-1][2] if stack else None)
+            stack.append((tocItem, tocItem.children_iterable_factory(), len(units)))
+            units.append(tocItem)
+            continue
+
+        tocItem, children, _ = stack.pop()
+        if children:
+            tocItem.children = children
+        _toc_item_embedded(tocItem, current)
+        if stack:
+            parent, siblings, _ = stack[-1]
+            tocItem.__parent__ = parent
+            tocItem.ordinal = len(siblings) + 1
+            siblings.append(tocItem)
+        else:
+            result = tocItem
+    return result
+
+def _tocItem_from_compiled(records, toc_entry, factory=None, child_factory=None,
+                           units=None, parents=None):
+    """
+    Build the item tree from the unit records of a compiled TOC (see
+    :func:`compile_toc`), like :func:`_tocItem`.
+    """
+    units = [] if units is None else units
+    parents = [] if parents is None else parents
+    start = len(units)
+    children = []
+    for parent, values, embedded in records:
+        tocItem = factory() if parent is None else child_factory()
+        _toc_item_fill_values(tocItem, values, toc_entry)
+        if embedded:
+            tocItem.embeddedContainerNTIIDs = tuple(embedded)
+        if parent is not None:
+            siblings = children[parent]
+            tocItem.__parent__ = units[start + parent]
+            tocItem.ordinal = len(siblings) + 1
+            siblings.append(tocItem)
+        children.append(tocItem.children_iterable_factory())
+        parents.append(start + parent if parent is not None else None)
+        units.append(tocItem)
+
+    for tocItem, siblings in zip(units[start:], children):
+        if siblings:
+            tocItem.children = siblings
+    return units[start] if len(units) > start else None
+
+
+def _parse_is_course(isCourse):
+    if isCourse is None:
+        return None
+    if not isCourse:
+        return False
+    return str(isCourse).lower() in ('1', 'true', 'yes', 'y', 't')
+
+
+def _toc_info(root):
+    """
+    The package level data of the TOC `root`.
+    """
+    info = {
+        'renderVersion': _node_get(root, 'renderVersion'),
+        'isCourse': _node_get(root, 'isCourse'),
+        'course': None,
+    }
+    if _parse_is_course(info['isCourse']):
+        courses = root.xpath('/toc/course')
+        if not courses or len(courses) != 1:
+            raise ValueError("Invalid course: 'isCourse' is true, "
+                             "but wrong 'course' node")
+        course = courses[0]
+        # The newest renderings have an <info src="path_to_file.json" />
+        # node in them.
+        info_nodes = course.xpath('info')
+        info['course'] = (_node_get(course, 'label'),
+                          _node_get(course, 'courseName'),
+                          _node_get(info_nodes[0], 'src') if info_nodes else None)
+    return info
+
+
+def compile_toc(root):
+    """
+    Compile the TOC `root` into plain data that can be stored with
+    :mod:`marshal` and turned back into content units without the XML.
+
+    :return: A tuple of the :data:`COMPILED_TOC_VERSION`, a dictionary
+        of the package level data and a list of one ``(parent index,
+        attribute values, embedded container NTIIDs)`` record per unit,
+        in pre-order.
+    """
+    records = []
+    stack = []
+    for current, entering in walk_events(root, children=_topics):
+        if entering:
+            records.append((stack[-1] if stack else None,
+                            _node_values(current),
+                            _node_embedded(current)))
+            stack.append(len(records) - 1)
+        else:
+            stack.pop()
+    return (COMPILED_TOC_VERSION, _toc_info(root), records)
+
+
+def is_compiled_toc(compiled):
+    return isinstance(compiled, tuple) \
+       and len(compiled) == 3 \
+       and compiled[0] == COMPILED_TOC_VERSION
+
 
 # Cache for content packages
 # should be done at a higher level.
@@ -152,6 +299,25 @@ def _tocItem(node, toc_entry, factory=None, child_factory=None):
 etree_Error = getattr(etree, 'Error')
 
 
+def _read_toc(toc_entry, cache):
+    """
+    Return the XML root of the TOC and its compiled form, if `cache`
+    has it, in which case the root is None. Compiled forms are found
+    by the hash of the TOC, so they are shared by identical TOCs and
+    are never stale.
+    """
+    if cache is None:
+        return toc_entry.key.readContentsAsETree(), None, None
+    data = toc_entry.key.readContents()
+    if data is None:
+        raise IOError("No TOC", toc_entry)
+    digest = hashlib.sha1(data).hexdigest()
+    compiled = cache.get(digest)
+    if is_compiled_toc(compiled):
+        return None, compiled, digest
+    return getattr(etree, 'fromstring')(data), None, digest
+
+
 def EclipseContentPackage(toc_entry,
                           package_factory=None,
                           unit_factory=None):
@@ -167,6 +333,10 @@ def EclipseContentPackage(toc_entry,
     no other preference is specified. (See :class:`nti.appserver.interfaces.IContentUnitPreferences`;
     an adapter should be registered.)
 
+    If an :class:`nti.contentlibrary.interfaces.ICompiledTOCCache` is registered, the
+    units are rebuilt from the compiled form of the TOC it holds (see :func:`compile_toc`)
+    instead of parsing the XML, which is compiled and stored in it otherwise.
+
     :param toc_entry: The hierarchy entry we will use to read the XML from. We make certain
             assumptions about the hierarchy this tree came from, notably that it is only one level
             deep (or rather, it is at least two levels deep and we will be able to access it
@@ -175,18 +345,33 @@ def EclipseContentPackage(toc_entry,
     :param unit_factory: A callable of no arguments that cooperates with the `package_factory` and produces
             :class:`.interfaces.IContentUnit` objects that can be part of the content package.
     """
-
+    cache = component.queryUtility(ICompiledTOCCache)
     try:
-        root = toc_entry.key.readContentsAsETree()
+        root, compiled, digest = _read_toc(toc_entry, cache)
     except (IOError, etree_Error):
         logger.debug("Failed to parse TOC at %s", toc_entry, exc_info=True)
         return None
 
     toc_last_modified = toc_entry.lastModified
-    content_package = _tocItem(root,
-                               toc_entry,
-                               factory=package_factory,
-                               child_factory=unit_factory)
+    units, parents = [], []
+    if compiled is not None:
+        info = compiled[1]
+        content_package = _tocItem_from_compiled(compiled[2],
+                                                 toc_entry,
+                                                 factory=package_factory,
+                                                 child_factory=unit_factory,
+                                                 units=units,
+                                                 parents=parents)
+    else:
+        info = _toc_info(root)
+        content_package = _tocItem(root,
+                                   toc_entry,
+                                   factory=package_factory,
+                                   child_factory=unit_factory,
+                                   units=units,
+                                   parents=parents)
+        if cache is not None:
+            cache.set(digest, compile_toc(root))
     # NOTE: assuming only one level of hierarchy (or at least the accessibility given just the parent)
     # root and index should probably be replaced with IDelimitedHierarchyEntry objects.
     # NOTE: IDelimitedHierarchyEntry is specified as '/' delimited. This means that when we are working with
@@ -194,44 +379,34 @@ def EclipseContentPackage(toc_entry,
     content_package.root = toc_entry.get_parent_key()
     content_package.index = toc_entry.key
     content_package.index_last_modified = toc_last_modified
+    # pylint: disable=protected-access
+    content_package._v_unit_table = ContentUnitTable(content_package,
+                                                     units=units,
+                                                     parents=parents)
 
     toc_jsonp = TOC_FILENAME + '.jsonp'
     content_package.index_jsonp = toc_entry.does_sibling_entry_exist(toc_jsonp)
 
-    renderVersion = root.get('renderVersion')
+    renderVersion = info['renderVersion']
     if renderVersion:
         content_package.renderVersion = int(renderVersion)
 
-    isCourse = root.get('isCourse')
-    if isCourse is not None:
-        as_str = str(isCourse).lower()
-        if not isCourse:
-            isCourse = False
-        else:
-            isCourse = as_str in ('1', 'true', 'yes', 'y', 't')
+    isCourse = _parse_is_course(info['isCourse'])
     if isCourse:
         interface.alsoProvides(content_package,
                                ILegacyCourseConflatedContentPackage)
         content_package.isCourse = isCourse
-        courses = root.xpath('/toc/course')
-        if not courses or len(courses) != 1:
-            raise ValueError("Invalid course: 'isCourse' is true, "
-                             "but wrong 'course' node")
-        course = courses[0]
-        courseTitle = _node_get(course, 'label')
-        courseName = _node_get(course, 'courseName')
+        courseTitle, courseName, courseInfoSrc = info['course']
 
         content_package.courseName = courseName
         content_package.courseTitle = courseTitle
 
-        # The newest renderings have an <info src="path_to_file.json" />
-        # node in them. But older renderings may also have a file
-        # just in their root called "course_info.json" (which in
+        # Older renderings may not have an info node, but have a
+        # file just in their root called "course_info.json" (which in
         # practice is also always the value of info[@src].
         # Take whatever we can get.
-        info = course.xpath('info')
-        if info:  # sigh
-            content_package.courseInfoSrc = _node_get(info[0], 'src')
+        if courseInfoSrc:  # sigh
+            content_package.courseInfoSrc = courseInfoSrc
         elif content_package.does_sibling_entry_exist('course_info.json'):
             content_package.courseInfoSrc = u'course_info.json'
 
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A cache of the entries that exist in the content hierarchy.
+
+``does_sibling_entry_exist`` is asked about the same few names of
+every package on every sync, and by the censoring policies of the
+application on every edit. The filesystem and S3 hierarchy entries
+answer from :data:`existence_cache` instead of asking the storage
+each time. Answers that an entry does not exist are cached too.
+
+* A filesystem directory is listed once, and the listing answers for
+  every name in it. It is listed again when the modification time of
+  the directory changes. That time is checked at most every
+  :data:`FILESYSTEM_REVALIDATE` seconds.
+* Listing an S3 prefix may take many requests, so a prefix is only
+  listed for a batch of names (see :func:`exists_many`), or when it
+  is seeded with :meth:`ExistenceCache.seed`. Otherwise each name is
+  looked up on its own. Both kinds of answers are kept for
+  :data:`S3_TIMEOUT` seconds.
+
+The cache is cleared whenever a library syncs.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+
+import repoze.lru
+
+#: How often, in seconds, a filesystem listing is checked against
+#: the modification time of its directory
+FILESYSTEM_REVALIDATE = 2
+
+#: How long, in seconds, S3 listings and lookups are kept
+S3_TIMEOUT = 600
+
+#: The number of names in a batch from which an S3 prefix is listed
+#: rather than each name looked up
+S3_LIST_THRESHOLD = 4
+
+#: The number of directory listings kept
+LISTING_CACHE_SIZE = 10000
+
+#: The number of single lookups kept
+LOOKUP_CACHE_SIZE = 100000
+
+_marker = object()
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class ExistenceCache(object):
+    """
+    Listings of directories, mapping the name of each entry to the
+    value that answers whether it exists, and single lookups.
+    Directories are identified by tuples naming the storage and the
+    path.
+    """
+
+    def __init__(self, listings=LISTING_CACHE_SIZE, lookups=LOOKUP_CACHE_SIZE):
+        self._listings = repoze.lru.LRUCache(listings)
+        self._lookups = repoze.lru.ExpiringLRUCache(lookups,
+                                                    default_timeout=S3_TIMEOUT)
+
+    def seed(self, directory, children, stamp=None):
+        """
+        Record the listing of `directory`: a map from the name of each
+        entry to its value. The `stamp` is compared to detect changes.
+        """
+        self._listings.put(directory, (children, stamp, time.time()))
+
+    def listed(self, directory, max_age, stamper=None):
+        """
+        Return the listing of `directory`, or None if it is not known.
+        Listings older than `max_age` seconds are still current if
+        `stamper` is given and returns their stamp.
+        """
+        entry = self._listings.get(directory)
+        if entry is None:
+            return None
+        children, stamp, checked = entry
+        now = time.time()
+        if now - checked < max_age:
+            return children
+        if stamper is not None and stamper() == stamp:
+            self._listings.put(directory, (children, stamp, now))
+            return children
+        self._listings.invalidate(directory)
+        return None
+
+    def listing(self, directory, lister, max_age, stamper=None):
+        """
+        Return the listing of `directory`, calling `lister` for it if
+        it is not known (see :meth:`listed`).
+        """
+        children = self.listed(directory, max_age, stamper)
+        if children is None:
+            # Stamp first, so that changes while listing are noticed
+            stamp = stamper() if stamper is not None else None
+            children = lister()
+            self.seed(directory, children, stamp)
+        return children
+
+    def lookup(self, path, finder):
+        """
+        Return the value for the single entry at `path`, calling
+        `finder` for it if it is not known.
+        """
+        value = self._lookups.get(path, _marker)
+        if value is _marker:
+            value = finder()
+            self._lookups.put(path, value)
+        return value
+
+    def clear(self):
+        self._listings.clear()
+        self._lookups.clear()
+
+
+#: The cache shared by the filesystem and S3 hierarchies
+existence_cache = ExistenceCache()
+
+try:
+    import zope.testing.cleanup
+except ImportError:  # pragma: no cover
+    pass
+else:
+    zope.testing.cleanup.addCleanUp(existence_cache.clear)
+
+
+def _list_directory(path):
+    try:
+        return dict.fromkeys(os.listdir(path), True)
+    except OSError:
+        return {}
+
+
+def _directory_stamp(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def filesystem_entry_exists(path):
+    """
+    Whether there is a file or directory at `path`.
+    """
+    dirname, name = os.path.split(path)
+    children = existence_cache.listing(('file', dirname),
+                                       lambda: _list_directory(dirname),
+                                       FILESYSTEM_REVALIDATE,
+                                       lambda: _directory_stamp(dirname))
+    return name in children
+
+
+def _s3_directory(bucket, prefix):
+    return ('s3', getattr(bucket, 'name', None), prefix)
+
+
+def _list_s3_prefix(bucket, prefix):
+    start = prefix + '/' if prefix else ''
+    result = {}
+    for item in bucket.list(prefix=start, delimiter='/'):
+        name = item.name[len(start):]
+        # Sub-prefixes end with the delimiter and are not keys
+        if name and not name.endswith('/'):
+            result[name] = item
+    return result
+
+
+def s3_key_lookup(bucket, key_name, finder):
+    """
+    Return the key named `key_name` in `bucket` from the listing of its
+    prefix if that is known, otherwise what `finder` returns for it.
+    """
+    prefix, _, name = key_name.rpartition('/')
+    children = existence_cache.listed(_s3_directory(bucket, prefix),
+                                      S3_TIMEOUT)
+    if children is not None:
+        return children.get(name)
+    return existence_cache.lookup(_s3_directory(bucket, key_name), finder)
+
+
+def seed_s3_prefixes(bucket, key_names):
+    """
+    List the prefixes of the keys named `key_names` in `bucket` that
+    are not known, if there are enough names to be worth it.
+    """
+    if len(key_names) < S3_LIST_THRESHOLD or not hasattr(bucket, 'list'):
+        return
+    for prefix in {x.rpartition('/')[0] for x in key_names}:
+        existence_cache.listing(_s3_directory(bucket, prefix),
+                                lambda p=prefix: _list_s3_prefix(bucket, p),
+                                S3_TIMEOUT)
+
+
+def exists_many(entry, sibling_names):
+    """
+    Return a map from each of `sibling_names` to what the
+    ``does_sibling_entry_exist`` of `entry` returns for it, asking
+    the storage as little as it can.
+    """
+    batch = getattr(entry, 'exists_many', None)
+    if batch is not None:
+        return batch(sibling_names)
+    return {x: entry.does_sibling_entry_exist(x) for x in sibling_names}
@@ -40,6 +40,9 @@ from nti.contentlibrary.bucket import AbstractBucket
 from nti.contentlibrary.contentunit import ContentUnit
 from nti.contentlibrary.contentunit import ContentPackage
 
+from nti.contentlibrary.existence import filesystem_entry_exists
+
+from nti.contentlibrary.interfaces import IPackedBucket
 from nti.contentlibrary.interfaces import IFilesystemKey
 from nti.contentlibrary.interfaces import IFilesystemBucket
 from nti.contentlibrary.interfaces import ISiteLibraryFactory
@@ -57,6 +60,27 @@ from nti.contentlibrary.interfaces import IGlobalFilesystemContentPackageLibrary
 from nti.contentlibrary.interfaces import IPersistentFilesystemContentPackageLibrary
 from nti.contentlibrary.interfaces import IDelimitedHierarchyContentPackageEnumeration
 
+from nti.contentlibrary.packed import PACKED_EXTENSION
+
+from nti.contentlibrary.packed import PersistentPackedContentUnit
+from nti.contentlibrary.packed import PersistentPackedContentPackage
+
+from nti.contentlibrary.packed import packed_bucket
+from nti.contentlibrary.packed import is_packed_archive
+from nti.contentlibrary.packed import get_filesystem_archive
+from nti.contentlibrary.packed import packed_package_factory
+
+from nti.contentlibrary.package_files import ENCODING_EXTENSIONS
+
+from nti.contentlibrary.precompress import PRECOMPRESSED_MANIFEST
+
+from nti.contentlibrary.precompress import is_variant_current
+from nti.contentlibrary.precompress import read_precompressed_manifest
+
+from nti.contentlibrary.snapshot import read_library_snapshot
+from nti.contentlibrary.snapshot import write_library_snapshot
+from nti.contentlibrary.snapshot import is_library_snapshot_current
+
 from nti.dublincore.time_mixins import TimeProperty
 
 from nti.externalization.persistence import NoPickle
@@ -79,10 +103,19 @@ def _isTOC(path):
     return os.path.basename(path) == eclipse.TOC_FILENAME
 
 
-def _package_factory(item, _package_factory=None, _unit_factory=None):
+def _package_factory(item, _package_factory=None, _unit_factory=None,
+                     _packed_package_factory=None, _packed_unit_factory=None):
     """
     Given a Filesystem item, return a package if it is suitable.
+
+    Packed archives are built with `_packed_package_factory` and
+    `_packed_unit_factory` instead of the other two.
     """
+    if IPackedBucket.providedBy(item):
+        return packed_package_factory(item,
+                                      _packed_package_factory,
+                                      _packed_unit_factory)
+
     bucket = item
     if IFilesystemKey.providedBy(item):
         bucket = item.bucket
@@ -223,7 +256,45 @@ class FilesystemKey(AbstractKey,
     def readContents(self):
         return self._contents
     read_contents = readContents
-     
+
+    def _precompressed_entry(self):
+        """
+        The entry for this key in the manifest of the nearest bucket
+        above it that was precompressed, or None.
+        """
+        bucket = self.bucket
+        while bucket is not None:
+            path = getattr(bucket, 'absolute_path', None)
+            if not path:
+                break
+            if filesystem_entry_exists(path_join(path, PRECOMPRESSED_MANIFEST)):
+                manifest = read_precompressed_manifest(path) or {}
+                name = os.path.relpath(self.absolute_path, path)
+                return manifest.get('files', {}).get(name.replace(os.sep, '/'))
+            bucket = getattr(bucket, 'bucket', None)
+        return None
+
+    def readCompressedContents(self, encoding):
+        """
+        Return the contents of the variant compressed with `encoding`
+        (see :mod:`nti.contentlibrary.precompress`) if there is one
+        for the current contents, otherwise None.
+        """
+        ext = ENCODING_EXTENSIONS.get(encoding)
+        if ext is None:
+            return None
+        variant = self.absolute_path + ext
+        try:
+            if not is_variant_current(self._precompressed_entry(),
+                                      encoding,
+                                      os.stat(self.absolute_path),
+                                      os.stat(variant)):
+                return None
+            with open(variant, 'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
     @cachedIn('_v_readContentsAsText')
     def _do_readContentsAsText(self, contents, encoding):
         if contents is not None:
@@ -261,6 +332,23 @@ class FilesystemBucket(AbstractBucket,
         """
         return {}
 
+    def _is_packed(self, absk):
+        # A directory of the same name takes precedence over its archive
+        return is_packed_archive(absk) \
+           and not os.path.isdir(absk[:-len(PACKED_EXTENSION)])
+
+    def _packed_bucket(self, absk, k):
+        """
+        Present the packed archive at `absk` as a directory named
+        without the extension, or as a plain key if it cannot be read.
+        """
+        try:
+            archive = get_filesystem_archive(absk)
+        except (IOError, OSError, ValueError):
+            logger.exception("Failed to read packed archive %s", absk)
+            return self._key_type(self, k)
+        return packed_bucket(archive, self, k[:-len(PACKED_EXTENSION)])
+
     def enumerateChildren(self):
         absolute_path = self.absolute_path
         if not os.path.isdir(absolute_path):
@@ -269,25 +357,37 @@ class FilesystemBucket(AbstractBucket,
         # note that we don't handle an entry going from
         # being a key to a bucket or vice versa;
         # we also don't handle cleaning up deleted keys/buckets,
-        # they just leak memory
+        # they just leak memory. Children are cached under their
+        # names, which for packed archives lack the extension.
         cache = self._children_cache
 
         for k in os.listdir(absolute_path):
             if k.startswith('.'):
                 continue
 
-            if k not in cache:  # pylint: disable=unsupported-membership-test
+            name = k
+            if k.endswith(PACKED_EXTENSION):
+                # pylint: disable=no-member
+                packed = cache.get(k[:-len(PACKED_EXTENSION)])
+                if IPackedBucket.providedBy(packed):
+                    name = packed.__name__
+
+            if name not in cache:  # pylint: disable=unsupported-membership-test
                 absk = os.path.join(absolute_path, k)
                 if isinstance(absk, bytes):
                     k = k.decode('utf-8')
                     absk = absk.decode('utf-8')
-                # pylint: disable=unsupported-assignment-operation
                 if os.path.isdir(absk):
-                    cache[k] = type(self)(self, k)
+                    child = type(self)(self, k)
+                elif self._is_packed(absk):
+                    child = self._packed_bucket(absk, k)
                 else:
-                    cache[k] = self._key_type(self, k)
+                    child = self._key_type(self, k)
+                name = child.__name__
+                # pylint: disable=unsupported-assignment-operation
+                cache[name] = child
 
-            yield cache[k]  # pylint: disable=unsubscriptable-object
+            yield cache[name]  # pylint: disable=unsubscriptable-object
 
 
 @interface.implementer(ILastModified)
@@ -307,7 +407,12 @@ class _FilesystemLibraryEnumeration(library.AbstractDelimitedHiercharchyContentP
     #: this is the parent enumeration that birthed us.
     parent_enumeration = None
 
-    def __init__(self, root_path, package_factory=None, unit_factory=None):
+    #: The factories of the packages and units of packed archives
+    _packed_package_factory = None
+    _packed_unit_factory = None
+
+    def __init__(self, root_path, package_factory=None, unit_factory=None,
+                 packed_package_factory=None, packed_unit_factory=None):
         if not IEnumerableDelimitedHierarchyBucket.providedBy(root_path):
             root_path = os.path.abspath(root_path)
             if root_path.endswith('/'):
@@ -322,6 +427,10 @@ class _FilesystemLibraryEnumeration(library.AbstractDelimitedHiercharchyContentP
 
         self.__package_factory = package_factory or FilesystemContentPackage
         self._unit_factory = unit_factory or FilesystemContentUnit
+        if packed_package_factory is not None:
+            self._packed_package_factory = packed_package_factory
+        if packed_unit_factory is not None:
+            self._packed_unit_factory = packed_unit_factory
 
     _bucket_factory = FilesystemBucket
     _enumeration_factory = None
@@ -355,7 +464,9 @@ class _FilesystemLibraryEnumeration(library.AbstractDelimitedHiercharchyContentP
     def _package_factory(self, bucket):
         return _package_factory(bucket,
                                 self.__package_factory,
-                                self._unit_factory)
+                                self._unit_factory,
+                                self._packed_package_factory,
+                                self._packed_unit_factory)
 
 
 @interface.implementer(IFilesystemContentPackageLibrary)
@@ -433,7 +544,11 @@ class _KeyDelimitedHierarchyEntry(object):
 
     def does_sibling_entry_exist(self, sibling_name):
         sib_key = self.make_sibling_key(sibling_name)
-        return sib_key if os.path.exists(sib_key.absolute_path) else None
+        return sib_key if filesystem_entry_exists(sib_key.absolute_path) else None
+
+    def exists_many(self, sibling_names):
+        # The listing of each directory answers for all its names
+        return {x: self.does_sibling_entry_exist(x) for x in sibling_names}
 
 
 @interface.implementer(IFilesystemContentUnit)
@@ -495,6 +610,10 @@ class FilesystemContentUnit(_FilesystemTimesMixin,
         # pylint: disable=too-many-function-args
         return entry.does_sibling_entry_exist(sibling_name)
 
+    def exists_many(self, sibling_names):
+        entry = IDelimitedHierarchyEntry(self.key)
+        return entry.exists_many(sibling_names)
+
     def __repr__(self):
         return "<%s.%s '%s' '%s'>" % (self.__class__.__module__, self.__class__.__name__,
                                       self.__name__, self.filename)
@@ -571,6 +690,10 @@ class PersistentFilesystemContentPackage(Persistent,
 class _PersistentFilesystemLibraryEnumeration(Persistent,
                                               _FilesystemLibraryEnumeration):
 
+    # Class attributes, so that enumerations already stored have them too
+    _packed_package_factory = PersistentPackedContentPackage
+    _packed_unit_factory = PersistentPackedContentUnit
+
     def __init__(self, root):
         Persistent.__init__(self)
         _FilesystemLibraryEnumeration.__init__(self,
@@ -632,12 +755,46 @@ class GlobalFilesystemContentPackageLibrary(library.GlobalContentPackageLibrary,
     it is pickled as a lookup to the main global library (if the name
     is not the default name of 'Library', that global library will
     be found instead).
+
+    If given a `snapshot` path, the library writes its packages there
+    after a sync that changed them, or when the snapshot is not
+    current, and its first sync uses them instead of parsing the
+    content when they are still current (see
+    :mod:`nti.contentlibrary.snapshot`).
     """
 
+    #: The path of the snapshot of the packages, if any
+    snapshot = None
+
+    # Whether the packages of the current sync came from the snapshot
+    _v_from_snapshot = False
+
+    def __init__(self, root='', snapshot=None, **kwargs):
+        super(GlobalFilesystemContentPackageLibrary, self).__init__(root, **kwargs)
+        if snapshot:
+            self.snapshot = snapshot
+
     @classmethod
     def _create_enumeration(cls, root):
         return _GlobalFilesystemLibraryEnumeration(root)
 
+    def _enumerate_content_packages(self):
+        if self.snapshot and not self._contentPackages:
+            packages = read_library_snapshot(self, self.snapshot)
+            if packages is not None:
+                self._v_from_snapshot = True
+                return packages
+        return super(GlobalFilesystemContentPackageLibrary, self)._enumerate_content_packages()
+
+    def syncContentPackages(self, *args, **kwargs):
+        self._v_from_snapshot = False
+        result = super(GlobalFilesystemContentPackageLibrary, self).syncContentPackages(*args, **kwargs)
+        if self.snapshot and not self._v_from_snapshot:
+            changed = result.Added or result.Modified or result.Removed
+            if changed or not is_library_snapshot_current(self, self.snapshot):
+                write_library_snapshot(self, self.snapshot)
+        return result
+
     def __reduce__(self, *unused_args):
         return _GlobalFilesystemUnpickle, (self.__name__,)
     __reduce_ex__ = __reduce__
@@ -10,6 +10,8 @@ from __future__ import absolute_import
 
 import BTrees
 
+from BTrees.Length import Length
+
 from zope import component
 
 from zope.catalog.interfaces import ICatalog
@@ -136,8 +138,46 @@ CreatedTimeIndex = LastModifiedIndex = PublishLastModifiedIndex  # BWC
 
 
 class LibraryCatalog(Catalog):
+
     family = BTrees.family64
 
+    # A conflict-resolving counter of documents (un)indexed;
+    # created on first change for older catalogs
+    _generation = None
+
+    @property
+    def generation(self):
+        """
+        A number that changes whenever documents are indexed or
+        unindexed through this catalog, or its indexes are updated.
+        """
+        return self._generation() if self._generation is not None else 0
+
+    def _changed(self):
+        if self._generation is None:
+            self._generation = Length()
+        self._generation.change(1)
+
+    def index_doc(self, docid, texts):
+        self._changed()
+        super(LibraryCatalog, self).index_doc(docid, texts)
+
+    def unindex_doc(self, docid):
+        self._changed()
+        super(LibraryCatalog, self).unindex_doc(docid)
+
+    def clear(self):
+        self._changed()
+        super(LibraryCatalog, self).clear()
+
+    def updateIndex(self, index, *args, **kwargs):
+        self._changed()
+        super(LibraryCatalog, self).updateIndex(index, *args, **kwargs)
+
+    def updateIndexes(self, *args, **kwargs):
+        self._changed()
+        super(LibraryCatalog, self).updateIndexes(*args, **kwargs)
+
 
 def get_contentlibrary_catalog(registry=component):
     return registry.queryUtility(ICatalog, name=CATALOG_INDEX_NAME)
@@ -184,6 +224,8 @@ CONTENT_BUNDLES_CATALOG_NAME = 'nti.dataserver.++etc++contentbundles.catalog'
 
 IX_TITLE = 'title'
 IX_PACKAGES = 'packages'
+IX_CREATEDTIME = 'createdTime'
+IX_LASTMODIFIED = 'lastModified'
 IX_RESTRICTED_ACCESS = 'restrictedAccess'
 
 
@@ -266,6 +308,28 @@ def ContentBundleCreatorIndex(family=BTrees.family64):
                                 interface=ValidatingContentBundleCreator)
 
 
+class ContentBundleCreatedTimeRawIndex(RawIntegerValueIndex):
+    pass
+
+
+def ContentBundleCreatedTimeIndex(family=BTrees.family64):
+    return NormalizationWrapper(field_name='createdTime',
+                                interface=IContentPackageBundle,
+                                index=ContentBundleCreatedTimeRawIndex(family=family),
+                                normalizer=TimestampToNormalized64BitIntNormalizer())
+
+
+class ContentBundleLastModifiedRawIndex(RawIntegerValueIndex):
+    pass
+
+
+def ContentBundleLastModifiedIndex(family=BTrees.family64):
+    return NormalizationWrapper(field_name='lastModified',
+                                interface=IContentPackageBundle,
+                                index=ContentBundleLastModifiedRawIndex(family=family),
+                                normalizer=TimestampToNormalized64BitIntNormalizer())
+
+
 class ContentBundleCatalog(Catalog):
     family = BTrees.family64
 
@@ -284,6 +348,8 @@ def create_contentbundle_catalog(catalog=None, family=BTrees.family64):
                         (IX_CREATOR,  ContentBundleCreatorIndex),
                         (IX_MIMETYPE, ContentBundleMimeTypeIndex),
                         (IX_PACKAGES, ContentBundlePackagesIndex),
+                        (IX_CREATEDTIME, ContentBundleCreatedTimeIndex),
+                        (IX_LASTMODIFIED, ContentBundleLastModifiedIndex),
                         (IX_RESTRICTED_ACCESS, ContentBundleRestrictedAccessIndex)):
         index = clazz(family=family)
         locate(index, catalog, name)
@@ -19,6 +19,9 @@ from zope.intid.interfaces import IIntIds
 
 from nti.contentlibrary.indexed_data import get_library_catalog
 
+from nti.contentlibrary.indexed_data.index import iter_objects
+from nti.contentlibrary.indexed_data.index import committed_generation
+
 from nti.contentlibrary.indexed_data.interfaces import IIndexedDataContainer
 from nti.contentlibrary.indexed_data.interfaces import IAudioIndexedDataContainer
 from nti.contentlibrary.indexed_data.interfaces import IVideoIndexedDataContainer
@@ -36,8 +39,6 @@ from nti.contenttypes.presentation.interfaces import INTIRelatedWorkRef
 
 from nti.site.site import get_component_hierarchy_names
 
-from nti.zope_catalog.catalog import ResultSet
-
 logger = __import__('logging').getLogger(__name__)
 
 
@@ -63,17 +64,37 @@ class IndexedDataContainer(PersistentCreatedAndModifiedTimeObject):
     def intids(self):
         return component.getUtility(IIntIds)
 
-    def __getitem__(self, key):
+    def _index_data(self):
+        """
+        Return the doc ids of our items and a map from ntiid to doc id,
+        computed once per committed catalog generation. An ntiid found
+        in more than one of our documents maps to `None`.
+        """
+        catalog = self.catalog
         # pylint: disable=no-member
-        items = list(self.catalog.search_objects(container_ntiids=(self.ntiid,),
-                                                 provided=self.type,
-                                                 ntiid=key,
-                                                 sites=self.sites,
-                                                 intids=self.intids))
-        if len(items) == 1:
-            return items[0]
-        else:
+        generation = committed_generation(catalog)
+        cached = getattr(self, '_v_cached_index', None)
+        if cached is not None and generation is not None and cached[0] == generation:
+            return cached[1], cached[2]
+
+        doc_ids = catalog.get_references(container_ntiids=(self.ntiid,),
+                                         sites=self.sites,
+                                         provided=self.type)
+        by_ntiid = {}
+        documents_to_values = catalog.ntiid_index.documents_to_values
+        for doc_id in doc_ids:
+            ntiid = documents_to_values.get(doc_id)
+            if ntiid is not None:
+                by_ntiid[ntiid] = None if ntiid in by_ntiid else doc_id
+        self._v_cached_index = (generation, doc_ids, by_ntiid)
+        return doc_ids, by_ntiid
+
+    def __getitem__(self, key):
+        doc_id = self._index_data()[1].get(key)
+        obj = self.intids.queryObject(doc_id) if doc_id is not None else None
+        if obj is None:
             raise KeyError(key)
+        return obj
 
     def get(self, key, default=None):
         try:
@@ -82,21 +103,12 @@ class IndexedDataContainer(PersistentCreatedAndModifiedTimeObject):
             return default
 
     def __contains__(self, key):
-        # pylint: disable=no-member
-        items = self.catalog.get_references(container_ntiids=(self.ntiid,),
-                                            provided=self.type,
-                                            sites=self.sites,
-                                            ntiid=key)
-        return len(items) == 1
+        return self._index_data()[1].get(key) is not None
     contains_data_item_with_ntiid = __contains__
 
     @property
     def doc_ids(self):
-        # pylint: disable=no-member
-        result = self.catalog.get_references(container_ntiids=(self.ntiid,),
-                                             sites=self.sites,
-                                             provided=self.type)
-        return result
+        return self._index_data()[0]
 
     def keys(self):
         # pylint: disable=no-member
@@ -110,13 +122,13 @@ class IndexedDataContainer(PersistentCreatedAndModifiedTimeObject):
         return iter(self.keys())
 
     def values(self):
-        for obj in ResultSet(self.doc_ids, self.intids, True):
+        for _, obj in iter_objects(self.doc_ids, self.intids):
             yield obj
     get_data_items = values
 
     def items(self):
-        for doc_id, value in ResultSet(self.doc_ids, self.intids, True).items():
-            return doc_id, value
+        for item in iter_objects(self.doc_ids, self.intids):
+            yield item
 
     def __len__(self):
         return len(self.doc_ids)
@@ -9,9 +9,17 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import time
+import random
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
 
 import BTrees
 
+from BTrees.Length import Length
+
 from persistent import Persistent
 
 import six
@@ -58,6 +66,104 @@ def to_iterable(value):
     return result
 
 
+#: The number of objects resolved and prefetched at a time by
+#: :func:`iter_objects`
+PREFETCH_BATCH_SIZE = 100
+
+
+def _prefetch(objects):
+    """
+    Ask the connections of the given ghost objects to load their state
+    in as few storage round trips as they can.
+    """
+    ghosts = {}
+    for obj in objects:
+        jar = getattr(obj, '_p_jar', None)
+        # pylint: disable=protected-access
+        if jar is not None and getattr(obj, '_p_changed', False) is None:
+            ghosts.setdefault(jar, []).append(obj)
+    for jar, objs in ghosts.items():
+        prefetch = getattr(jar, 'prefetch', None)
+        if prefetch is not None:
+            prefetch(objs)
+
+
+def iter_objects(doc_ids, intids, batch_size=PREFETCH_BATCH_SIZE):
+    """
+    Resolve the given doc ids, yielding ``(doc_id, object)`` pairs in
+    order and skipping ids that no longer resolve.
+
+    Ids are resolved a block at a time and the block is prefetched
+    from its ZODB connection (``Connection.prefetch``), so iteration
+    costs roughly one storage round trip per block rather than one
+    per object.
+    """
+    batch = []
+    query_object = intids.queryObject
+    for doc_id in doc_ids:
+        obj = query_object(doc_id)
+        if obj is not None:
+            batch.append((doc_id, obj))
+        if len(batch) >= batch_size:
+            _prefetch(obj for _, obj in batch)
+            for item in batch:
+                yield item
+            batch = []
+    if batch:
+        _prefetch(obj for _, obj in batch)
+        for item in batch:
+            yield item
+
+
+def committed_generation(catalog):
+    """
+    Return the generation of `catalog` if it reflects committed state
+    only, otherwise `None`. A number bumped by an uncommitted, and
+    perhaps later aborted, transaction could be reached again by a
+    later commit with different contents, so it must not be used to
+    key values kept beyond the transaction.
+    """
+    # pylint: disable=protected-access
+    counter = getattr(catalog, '_generation', None)
+    if counter is None or getattr(counter, '_p_changed', False):
+        return None
+    return counter()
+
+
+class _CatalogIndexMixin(object):
+    """
+    Mixed into the indexes of a :class:`ContainedObjectCatalog` so
+    that writing to one of them directly, rather than through the
+    catalog, also changes the generation of the catalog, which is
+    the index's ``__parent__``.
+    """
+
+    __parent__ = None
+
+    def _catalog_changed(self):
+        catalog = self.__parent__
+        # Readers do not use a generation changed by the current
+        # transaction until it commits, so changing it once is enough
+        counter = getattr(catalog, '_generation', None)
+        if counter is not None and getattr(counter, '_p_changed', False):
+            return
+        changed = getattr(catalog, '_changed', None)
+        if changed is not None:
+            changed()
+
+    def index_doc(self, doc_id, value):
+        self._catalog_changed()
+        return super(_CatalogIndexMixin, self).index_doc(doc_id, value)
+
+    def unindex_doc(self, doc_id):
+        self._catalog_changed()
+        return super(_CatalogIndexMixin, self).unindex_doc(doc_id)
+
+    def clear(self):
+        self._catalog_changed()
+        return super(_CatalogIndexMixin, self).clear()
+
+
 class KeepSetIndex(RawSetIndex):
     """
     A set index that keeps the old values.
@@ -71,7 +177,7 @@ class KeepSetIndex(RawSetIndex):
 
     def index_doc(self, doc_id, value):
         value = {v for v in self.to_iterable(value) if v is not None}
-        old = self.documents_to_values.get(doc_id) or self.empty_set
+        old = self.documents_to_values.get(doc_id) or ()
         if value.difference(old):
             value.update(old or ())
             result = super(KeepSetIndex, self).index_doc(doc_id, value)
@@ -88,6 +194,163 @@ class KeepSetIndex(RawSetIndex):
         else:
             super(KeepSetIndex, self).unindex_doc(doc_id)
 
+    def replace(self, doc_id, value):
+        """
+        Index exactly the given values for the document, dropping any
+        others it had, unlike :meth:`index_doc`.
+        """
+        value = {v for v in self.to_iterable(value) if v is not None}
+        if not value:
+            return super(KeepSetIndex, self).unindex_doc(doc_id)
+        old = self.documents_to_values.get(doc_id) or ()
+        if value != set(old):
+            return super(KeepSetIndex, self).index_doc(doc_id, value)
+
+    def index_values(self, values):
+        """
+        Return the given values as they are stored in this index.
+        """
+        return values
+
+    def values_of(self, doc_id):
+        """
+        Return the values indexed for the given document.
+        """
+        return self.documents_to_values.get(doc_id) or ()
+
+
+class InternedKeepSetIndex(_CatalogIndexMixin, KeepSetIndex):
+    """
+    A :class:`KeepSetIndex` that stores compact integer ids instead of
+    its (long, heavily repeated) values, translating at the API boundary.
+
+    The id of a value is reclaimed when no document has the value any
+    more, so the intern tables only hold the values indexed.
+    """
+
+    _v_next_id = None
+
+    def clear(self):
+        super(InternedKeepSetIndex, self).clear()
+        # value -> id and id -> value
+        self._ids = self.family.OI.BTree()
+        self._values = self.family.IO.BTree()
+
+    def _generate_id(self):
+        # As zope.intid does, allocate ids sequentially from a random
+        # start, to keep concurrent writers from conflicting
+        while True:
+            if self._v_next_id is None:
+                self._v_next_id = random.randrange(0, self.family.maxint)
+            result = self._v_next_id
+            self._v_next_id += 1
+            if result not in self._values:
+                return result
+            self._v_next_id = None
+
+    def _intern(self, value):
+        result = self._ids.get(value)
+        if result is None:
+            result = self._generate_id()
+            self._ids[value] = result
+            self._values[result] = value
+        return result
+
+    def index_values(self, values):
+        # Values never indexed map to None, which no document has
+        return tuple(self._ids.get(v) for v in values)
+
+    def values_of(self, doc_id):
+        ids = self.documents_to_values.get(doc_id) or ()
+        return tuple(self._values[x] for x in ids)
+
+    # The zc.catalog value accessors answer with the original values;
+    # documents_to_values and values_to_documents hold the ids
+
+    def values(self, min=None, max=None, excludemin=False, excludemax=False,
+               doc_id=None):
+        # pylint: disable=redefined-builtin
+        if doc_id is None:
+            indexed = self.values_to_documents
+            return (v for v, x in self._ids.items(min, max, excludemin, excludemax)
+                    if x in indexed)
+        values = self.family.OO.TreeSet(self.values_of(doc_id))
+        return iter(values.keys(min, max, excludemin, excludemax))
+
+    def containsValue(self, value):
+        try:
+            return self._ids.get(value) in self.values_to_documents
+        except TypeError:
+            return False
+
+    def minValue(self, min=None):
+        # pylint: disable=redefined-builtin
+        for value in self.values(min=min):
+            return value
+        raise ValueError('empty tree')
+
+    def maxValue(self, max=None):
+        # pylint: disable=redefined-builtin
+        values = list(self.values(max=max))
+        if not values:
+            raise ValueError('empty tree')
+        return values[-1]
+
+    def _reclaim(self, ids):
+        # Forget the values that no document has any more
+        indexed = self.values_to_documents
+        for x in ids:
+            if x not in indexed and x in self._values:
+                del self._ids[self._values.pop(x)]
+
+    def index_doc(self, doc_id, value):
+        value = [self._intern(v) for v in to_iterable(value) if v is not None]
+        return super(InternedKeepSetIndex, self).index_doc(doc_id, value)
+
+    def replace(self, doc_id, value):
+        self._catalog_changed()
+        old = tuple(self.documents_to_values.get(doc_id) or ())
+        value = [self._intern(v) for v in to_iterable(value) if v is not None]
+        result = super(InternedKeepSetIndex, self).replace(doc_id, value)
+        self._reclaim(old)
+        return result
+
+    def remove(self, doc_id, value):
+        self._catalog_changed()
+        ids = [x for x in self.index_values(to_iterable(value)) if x is not None]
+        super(InternedKeepSetIndex, self).remove(doc_id, ids)
+        self._reclaim(ids)
+
+    def unindex_doc(self, doc_id):
+        old = tuple(self.documents_to_values.get(doc_id) or ())
+        result = super(InternedKeepSetIndex, self).unindex_doc(doc_id)
+        self._reclaim(old)
+        return result
+
+    def apply(self, query):
+        if len(query) != 1:
+            # Let zc.catalog reject it
+            return super(InternedKeepSetIndex, self).apply(query)
+        name, values = list(query.items())[0]
+        if name in ('any_of', 'all_of'):
+            ids = self.index_values(values)
+            if name == 'all_of' and None in ids:
+                return self.family.IF.Set()
+            query = {name: [x for x in ids if x is not None]}
+        elif name == 'between':
+            # The values in the range, in their order rather than that
+            # of their ids
+            try:
+                ids = list(self._ids.values(*values))
+            except TypeError:
+                return []
+            query = {'any_of': ids}
+        elif name not in ('any', 'none'):
+            # Those two do not name values; nothing else can be
+            # translated
+            raise ValueError("unknown query type", name)
+        return super(InternedKeepSetIndex, self).apply(query)
+
 deprecated('SiteIndex', 'Replaced with SingleSiteIndex')
 class SiteIndex(RawSetIndex):
     pass
@@ -109,7 +372,7 @@ class ValidatingSiteName(object):
         raise TypeError()
 
 
-class SingleSiteIndex(ValueIndex):
+class SingleSiteIndex(_CatalogIndexMixin, ValueIndex):
     default_field_name = 'site'
     default_interface = ValidatingSiteName
 
@@ -126,12 +389,12 @@ class CheckRawValueIndex(RawValueIndex):
                 super(CheckRawValueIndex, self).index_doc(doc_id, value)
 
 
-class TypeIndex(ValueIndex):
+class TypeIndex(_CatalogIndexMixin, ValueIndex):
     default_field_name = 'type'
     default_interface = IContainedTypeAdapter
 
 
-class NamespaceIndex(CheckRawValueIndex):
+class NamespaceIndex(_CatalogIndexMixin, CheckRawValueIndex):
     pass
 
 
@@ -149,7 +412,7 @@ class ValidatingNTIID(object):
         raise TypeError()
 
 
-class NTIIDIndex(ValueIndex):
+class NTIIDIndex(_CatalogIndexMixin, ValueIndex):
     default_field_name = 'ntiid'
     default_interface = ValidatingNTIID
 
@@ -166,7 +429,7 @@ class ValidatingTarget(object):
         raise TypeError()
 
 
-class TargetIndex(ValueIndex):
+class TargetIndex(_CatalogIndexMixin, ValueIndex):
     default_field_name = 'target'
     default_interface = ValidatingTarget
 
@@ -185,9 +448,34 @@ class ContainedObjectCatalog(Persistent):
     # In case a proper migration was not ran
     _target_index = None
 
+    # A conflict-resolving counter of index changes;
+    # created on first change for older catalogs
+    _generation = None
+
     def __init__(self):
         self.reset()
 
+    @property
+    def generation(self):
+        """
+        A number that changes whenever the indexes are modified through
+        this object. Readers can use it to invalidate values they
+        compute from the indexes.
+        """
+        return self._generation() if self._generation is not None else 0
+
+    def _changed(self):
+        if self._generation is None:
+            self._generation = Length()
+            # Older catalogs: have the indexes report direct writes
+            self._adopt_indexes()
+        self._generation.change(1)
+
+    def _adopt_indexes(self):
+        for _, index in self.items():
+            if getattr(index, '__parent__', self) is not self:
+                index.__parent__ = self
+
     def reset(self):
         # Last mod by key
         self._last_modified = self.family.OI.BTree()
@@ -200,9 +488,11 @@ class ContainedObjectCatalog(Persistent):
         # Track the object site
         self._site_index = SingleSiteIndex(family=self.family)
         # Track the containers the object belongs to
-        self._container_index = KeepSetIndex(family=self.family)
+        self._container_index = InternedKeepSetIndex(family=self.family)
         # Track the source/file name an object was read from
         self._namespace_index = NamespaceIndex(family=self.family)
+        self._adopt_indexes()
+        self._changed()
 
     def get_last_modified(self, namespace):
         try:
@@ -244,13 +534,14 @@ class ContainedObjectCatalog(Persistent):
         if doc_id is None:
             result = set()
         else:
-            result = self._container_index.documents_to_values.get(doc_id)
-            result = set(result or ())
+            result = set(self._container_index.values_of(doc_id))
         return result
 
     def update_containers(self, item, containers=(), intids=None):
+        result = None
         doc_id = self._doc_id(item, intids)
         if doc_id is not None and containers:
+            self._changed()
             containers = to_iterable(containers)
             result = self._container_index.index_doc(doc_id, containers)
         return result
@@ -259,6 +550,7 @@ class ContainedObjectCatalog(Persistent):
     def remove_containers(self, item, containers, intids=None):
         doc_id = self._doc_id(item, intids)
         if doc_id is not None:
+            self._changed()
             self._container_index.remove(doc_id, containers)
             return True
         return False
@@ -267,16 +559,79 @@ class ContainedObjectCatalog(Persistent):
     def remove_all_containers(self, item, intids=None):
         doc_id = self._doc_id(item, intids)
         if doc_id is not None:
+            self._changed()
             self._container_index.unindex_doc(doc_id)
             return True
         return False
 
-    def get_references(self, container_ntiids=None, provided=None,
-                       namespace=None, ntiid=None, sites=None, target=None,
-                       container_all_of=True):
-        result = None
+    #: When the current result set is this many times smaller than
+    #: the estimated result of the next index, we check each document's
+    #: indexed value instead of materializing and intersecting the
+    #: index's result set.
+    filter_factor = 16
+
+    #: The same for set indexes, whose per-document values are sets
+    #: and so slower to check
+    set_filter_factor = 64
+
+    def _estimate(self, index, values, query):
+        """
+        Estimate the number of documents the index query will match,
+        from the sizes of the document sets of the queried values,
+        without materializing it. A value missing from the index has
+        an empty set: if it is needed to match, the estimate is zero.
+        """
+        if isinstance(index, KeepSetIndex):
+            values = index.index_values(values)
+        try:
+            values_to_documents = index.values_to_documents
+        except AttributeError:  # pragma: no cover
+            return float('inf')
+        sizes = [len(values_to_documents.get(v, ())) for v in values]
+        if not sizes:
+            return 0
+        if query == 'all_of':
+            # No larger than the smallest set
+            return min(sizes)
+        # No larger than all of them together
+        return sum(sizes)
+
+    def _filter_factor(self, index):
+        if isinstance(index, RawSetIndex):
+            return self.set_filter_factor
+        return self.filter_factor
+
+    def _filter(self, index, doc_ids, values, query):
+        """
+        Return the subset of `doc_ids` whose value in the given
+        index matches the query.
+        """
+        if isinstance(index, KeepSetIndex):
+            values = index.index_values(values)
+        values = set(values)
+        documents_to_values = index.documents_to_values
+        if isinstance(index, RawSetIndex):
+            if query == 'all_of':
+                def match(doc_values):
+                    return values.issubset(doc_values)
+            else:
+                def match(doc_values):
+                    return not values.isdisjoint(doc_values)
+        else:
+            def match(doc_value):
+                return doc_value in values
+        result = [x for x in doc_ids
+                  if match(documents_to_values.get(x, ()))]
+        return self.family.IF.LFSet(result)
+
+    def _plan(self, container_ntiids=None, provided=None, namespace=None,
+              ntiid=None, sites=None, target=None, container_all_of=True):
+        """
+        Return a list of ``(estimate, index, values, query)`` for the
+        given parameters, most selective first.
+        """
+        plan = []
         container_query = 'all_of' if container_all_of else 'any_of'
-
         # pylint: disable=no-member
         # Provided is interface that maps to our type adapter
         for index, value, query in ((self._site_index, sites, 'any_of'),
@@ -287,11 +642,34 @@ class ContainedObjectCatalog(Persistent):
                                     (self._container_index, container_ntiids, container_query)):
             if value is not None and index is not None:
                 value = to_iterable(value)
+                plan.append((self._estimate(index, value, query), len(plan),
+                             index, value, query))
+        plan.sort(key=lambda x: x[:2])
+        return [(x[0],) + x[2:] for x in plan]
+
+    def get_references(self, container_ntiids=None, provided=None,
+                       namespace=None, ntiid=None, sites=None, target=None,
+                       container_all_of=True):
+        result = None
+        plan = self._plan(container_ntiids=container_ntiids,
+                          provided=provided,
+                          namespace=namespace,
+                          ntiid=ntiid,
+                          sites=sites,
+                          target=target,
+                          container_all_of=container_all_of)
+        for estimate, index, value, query in plan:
+            if not estimate:
+                return self.family.IF.LFSet()
+            if result is None:
+                result = index.apply({query: value}) or self.family.IF.LFSet()
+            elif len(result) * self._filter_factor(index) < estimate:
+                result = self._filter(index, result, value, query)
+            else:
                 ids = index.apply({query: value}) or self.family.IF.LFSet()
-                if result is None:
-                    result = ids
-                else:
-                    result = self.family.IF.intersection(result, ids)
+                result = self.family.IF.intersection(result, ids)
+            if not result:
+                break
         return result if result else self.family.IF.LFSet()
 
     def search_objects(self, container_ntiids=None, provided=None, namespace=None,
@@ -318,6 +696,7 @@ class ContainedObjectCatalog(Persistent):
         if namespace is not None:
             namespace = getattr(namespace, '__name__', namespace)
 
+        self._changed()
         for index, value in ((self._type_index, item),
                              (self._site_index, sites),
                              (self._ntiid_index, item),
@@ -331,16 +710,147 @@ class ContainedObjectCatalog(Persistent):
         return True
     index_doc = index
 
+    def _sorted_doc_ids(self, items, intids=None):
+        """
+        Resolve the doc ids of the given items with a single intid
+        utility lookup, returning ``(doc_id, item)`` pairs sorted by doc id.
+        Items that have no doc id are dropped.
+        """
+        if intids is None:
+            intids = component.queryUtility(IIntIds)
+        result = []
+        for item in items:
+            doc_id = self._doc_id(item, intids)
+            if doc_id is not None:
+                result.append((doc_id, item))
+        result.sort(key=lambda x: x[0])
+        return result
+
+    def index_many(self, entries, namespace=None, sites=None, intids=None):
+        """
+        Index many items at once.
+
+        :param entries: An iterable of ``(item, container_ntiids)`` pairs;
+            the containers may be `None`.
+        :return: The number of items indexed.
+
+        Updates are applied one index at a time, in doc id order, which
+        keeps BTree writes localized.
+        """
+        containers = {}
+        items = []
+        for item, container_ntiids in entries:
+            items.append(item)
+            containers[id(item)] = container_ntiids
+        resolved = self._sorted_doc_ids(items, intids)
+        if namespace is not None:
+            namespace = getattr(namespace, '__name__', namespace)
+        if resolved:
+            self._changed()
+
+        # pylint: disable=no-member
+        for index in (self._type_index, self._ntiid_index, self._target_index):
+            if index is not None:
+                for doc_id, item in resolved:
+                    index.index_doc(doc_id, item)
+        for index, value in ((self._site_index, sites),
+                             (self._namespace_index, namespace)):
+            if value is not None:
+                for doc_id, _ in resolved:
+                    index.index_doc(doc_id, value)
+        for doc_id, item in resolved:
+            container_ntiids = containers[id(item)]
+            if container_ntiids is not None:
+                self._container_index.index_doc(doc_id, container_ntiids)
+        return len(resolved)
+
+    def unindex_many(self, items, intids=None):
+        """
+        Unindex many items at once, one index at a time and in doc id order.
+
+        :return: The number of items unindexed.
+        """
+        doc_ids = [x[0] for x in self._sorted_doc_ids(items, intids)]
+        if doc_ids:
+            self._changed()
+        for _, index in self.items():
+            for doc_id in doc_ids:
+                index.unindex_doc(doc_id)
+        return len(doc_ids)
+
+    def replace_namespace(self, namespace, items, containers=None, sites=None,
+                          intids=None, last_modified=None):
+        """
+        Make the given items the only ones indexed under the namespace.
+
+        :param items: The items read from the namespace.
+        :param containers: Either a mapping from an item NTIID to its
+            container ntiids, or a sequence of container ntiids shared
+            by all the items.
+        :param last_modified: The namespace modification time to record;
+            defaults to now.
+        :return: A tuple with the number of documents added to and
+            removed from the namespace.
+
+        Only the difference between the documents currently indexed under
+        the namespace and the new ones is unindexed or fully indexed;
+        documents in both are reindexed in place, which writes nothing
+        for values that did not change. The containers of those are
+        replaced, not added to.
+        """
+        namespace = getattr(namespace, '__name__', namespace)
+        # pylint: disable=no-member
+        old = self._namespace_index.values_to_documents.get(namespace)
+        old = set(old) if old else set()
+        resolved = self._sorted_doc_ids(items, intids)
+        new = {doc_id for doc_id, _ in resolved}
+        removed = sorted(old - new)
+
+        if resolved or removed:
+            self._changed()
+        for _, index in self.items():
+            for doc_id in removed:
+                index.unindex_doc(doc_id)
+
+        for index in (self._type_index, self._ntiid_index, self._target_index):
+            if index is not None:
+                for doc_id, item in resolved:
+                    index.index_doc(doc_id, item)
+        if sites is not None:
+            for doc_id, _ in resolved:
+                self._site_index.index_doc(doc_id, sites)
+        added = 0
+        for doc_id, item in resolved:
+            if isinstance(containers, Mapping):
+                ntiid = getattr(item, 'ntiid', None) or getattr(item, 'NTIID', None)
+                container_ntiids = containers.get(ntiid)
+            else:
+                container_ntiids = containers
+            if doc_id not in old:
+                added += 1
+                self._namespace_index.index_doc(doc_id, namespace)
+                if container_ntiids is not None:
+                    self._container_index.index_doc(doc_id, container_ntiids)
+            else:
+                # As if unindexed and indexed again: an item re-imported
+                # under other containers leaves its old ones
+                self._container_index.replace(doc_id, container_ntiids or ())
+
+        self.set_last_modified(namespace, last_modified)
+        return added, len(removed)
+
     def unindex(self, item, intids=None):
         doc_id = self._doc_id(item, intids)
         if doc_id is None:
             return False
+        self._changed()
         for _, index in self.items():
             index.unindex_doc(doc_id)
         return True
     unindex_doc = unindex
 
     def clear(self):
+        self._changed()
         self._last_modified.clear()
         for _, index in self.items():
             index.clear()
@@ -8,8 +8,19 @@ from __future__ import absolute_import
 # pylint: disable=protected-access,too-many-public-methods,arguments-differ
 
 from hamcrest import is_
+from hamcrest import none
+from hamcrest import contains
+from hamcrest import greater_than
 from hamcrest import assert_that
 
+import transaction
+
+from ZODB import DB
+
+from nti.contentlibrary.indexed_data.container import IndexedDataContainer
+
+from nti.contentlibrary.indexed_data.index import iter_objects
+from nti.contentlibrary.indexed_data.index import committed_generation
 from nti.contentlibrary.indexed_data.index import ContainedObjectCatalog
 
 from nti.contentlibrary.tests import ContentlibraryLayerTest
@@ -59,3 +70,232 @@ class TestIndex(ContentlibraryLayerTest):
         # indexing with a None does not alter the index
         catalog.index(100, namespace=None)
         assert_that(list(catalog.get_references(namespace='p')), is_([100]))
+
+    def test_planned_references(self):
+        catalog = ContainedObjectCatalog()
+        for doc_id in range(1, 101):
+            catalog.index(doc_id, namespace='p',
+                          container_ntiids=('x', 'y') if doc_id % 10 else ('x',))
+        # selective container first, then namespace filtered per document
+        assert_that(list(catalog.get_references(container_ntiids=('x',), namespace='p')),
+                    is_(list(range(1, 101))))
+        assert_that(list(catalog.get_references(container_ntiids=('x',), namespace='q')),
+                    is_([]))
+        assert_that(list(catalog.get_references(container_ntiids=('x', 'y'), namespace='p')),
+                    is_([x for x in range(1, 101) if x % 10]))
+        assert_that(list(catalog.get_references(container_ntiids=('x', 'z'), namespace='p')),
+                    is_([]))
+        assert_that(list(catalog.get_references(container_ntiids=('x', 'z'), namespace='p',
+                                                container_all_of=False)),
+                    is_(list(range(1, 101))))
+
+        catalog.index(1000, container_ntiids='r', namespace='n')
+        assert_that(list(catalog.get_references(container_ntiids=('x', 'r'), namespace='n',
+                                                container_all_of=False)),
+                    is_([1000]))
+        assert_that(catalog._filter(catalog.namespace_index, (1, 1000), ('n',), 'any_of'),
+                    contains(1000))
+        assert_that(catalog._filter(catalog.container_index, (1, 10, 1000), ('x', 'y'), 'all_of'),
+                    contains(1))
+
+    def test_index_many(self):
+        catalog = ContainedObjectCatalog()
+        count = catalog.index_many(((3, 'x'), (1, ('x', 'y')), (2, None)),
+                                   namespace='p')
+        assert_that(count, is_(3))
+        assert_that(list(catalog.get_references(namespace='p')),
+                    is_([1, 2, 3]))
+        assert_that(list(catalog.get_references(container_ntiids='x')),
+                    is_([1, 3]))
+        assert_that(list(catalog.get_references(container_ntiids='y')),
+                    is_([1]))
+
+        assert_that(catalog.unindex_many((3, 1)), is_(2))
+        assert_that(list(catalog.get_references(namespace='p')),
+                    is_([2]))
+        assert_that(list(catalog.get_references(container_ntiids='x')),
+                    is_([]))
+
+    def test_estimate_skewed(self):
+        catalog = ContainedObjectCatalog()
+        for doc_id in range(1, 101):
+            containers = ('hot', 'cold') if doc_id == 1 else ('hot',)
+            catalog.index(doc_id, namespace='p%d' % (doc_id % 2),
+                          container_ntiids=containers)
+        # The size of each value's set, not the average
+        index = catalog.container_index
+        assert_that(catalog._estimate(index, ('hot',), 'any_of'), is_(100))
+        assert_that(catalog._estimate(index, ('cold',), 'any_of'), is_(1))
+        assert_that(catalog._estimate(index, ('hot', 'cold'), 'all_of'), is_(1))
+        assert_that(catalog._estimate(index, ('hot', 'missing'), 'all_of'), is_(0))
+        assert_that(catalog._estimate(index, ('cold', 'missing'), 'any_of'), is_(1))
+        # so the skewed container is applied last
+        plan = catalog._plan(container_ntiids=('hot',), namespace='p1')
+        assert_that([x[1] for x in plan],
+                    contains(catalog.namespace_index, catalog.container_index))
+        assert_that(list(catalog.get_references(container_ntiids=('hot',), namespace='p1')),
+                    is_(list(range(1, 101, 2))))
+
+    def test_generation(self):
+        catalog = ContainedObjectCatalog()
+        generation = catalog.generation
+        catalog.index_many(((1, 'x'),), namespace='p')
+        assert_that(catalog.generation, is_(greater_than(generation)))
+        generation = catalog.generation
+        catalog.unindex(1)
+        assert_that(catalog.generation, is_(greater_than(generation)))
+
+        # Writes made directly to the indexes count too
+        for index in (catalog.ntiid_index, catalog.container_index):
+            generation = catalog.generation
+            index.index_doc(2, 'y')
+            assert_that(catalog.generation, is_(greater_than(generation)))
+        generation = catalog.generation
+        catalog.container_index.remove(2, 'y')
+        assert_that(catalog.generation, is_(greater_than(generation)))
+
+        # Indexes of catalogs stored before the generation existed are
+        # adopted on the first change
+        catalog = ContainedObjectCatalog()
+        del catalog._generation
+        catalog.ntiid_index.__parent__ = None
+        catalog.index(3, container_ntiids='x')
+        generation = catalog.generation
+        catalog.ntiid_index.index_doc(4, 'z')
+        assert_that(catalog.generation, is_(greater_than(generation)))
+
+    def test_committed_generation(self):
+        db = DB(None)
+        tm = transaction.TransactionManager()
+        conn = db.open(tm)
+        try:
+            catalog = conn.root()['catalog'] = ContainedObjectCatalog()
+            catalog.index(1, container_ntiids='x', sites='site')
+            tm.commit()
+            generation = committed_generation(catalog)
+            assert_that(generation, is_(catalog.generation))
+
+            unit = type('Unit', (object,), {'ntiid': u'x'})()
+            container = IndexedDataContainer(unit, sites=('site',))
+            container.catalog = catalog
+            assert_that(list(container.doc_ids), is_([1]))
+
+            # An uncommitted generation is neither reported nor cached
+            catalog.index(2, container_ntiids='x', sites='site')
+            assert_that(committed_generation(catalog), is_(none()))
+            assert_that(list(container.doc_ids), is_([1, 2]))
+            tm.abort()
+            assert_that(committed_generation(catalog), is_(generation))
+
+            # so a later commit reaching the same number is seen
+            catalog.index(3, container_ntiids='x', sites='site')
+            tm.commit()
+            assert_that(committed_generation(catalog), is_(generation + 1))
+            assert_that(list(container.doc_ids), is_([1, 3]))
+
+            # Direct writes to an index are seen once committed
+            catalog.site_index.index_doc(4, 'site')
+            catalog.container_index.index_doc(4, 'x')
+            tm.commit()
+            assert_that(committed_generation(catalog), is_(generation + 2))
+            assert_that(list(container.doc_ids), is_([1, 3, 4]))
+        finally:
+            tm.abort()
+            conn.close()
+            db.close()
+
+    def test_iter_objects(self):
+        prefetched = []
+
+        class Jar(object):
+            def prefetch(self, objs):
+                prefetched.append(list(objs))
+
+        class Ghost(object):
+            _p_changed = None
+            _p_jar = Jar()
+
+        objects = {x: Ghost() for x in range(5) if x != 2}
+
+        class IntIds(object):
+            queryObject = objects.get
+
+        result = list(iter_objects(range(5), IntIds(), batch_size=2))
+        assert_that([doc_id for doc_id, _ in result], is_([0, 1, 3, 4]))
+        assert_that([len(x) for x in prefetched], is_([2, 2]))
+
+    def test_replace_namespace(self):
+        catalog = ContainedObjectCatalog()
+        catalog.index_many(((1, 'x'), (2, 'x')), namespace='p')
+        result = catalog.replace_namespace('p', (2, 3), containers=('y',),
+                                           last_modified=1000)
+        assert_that(result, is_((1, 1)))
+        assert_that(list(catalog.get_references(namespace='p')),
+                    is_([2, 3]))
+        assert_that(list(catalog.get_references(container_ntiids='y')),
+                    is_([2, 3]))
+        assert_that(catalog.get_last_modified('p'), is_(1000))
+        # The retained item moved containers
+        assert_that(list(catalog.get_references(container_ntiids='x')),
+                    is_([]))
+
+    def test_replace_namespace_moves_containers(self):
+        catalog = ContainedObjectCatalog()
+        catalog.index_many(((1, ('x', 'y')), (2, 'x')), namespace='p')
+        result = catalog.replace_namespace('p', (1, 2), containers=('z',))
+        assert_that(result, is_((0, 0)))
+        assert_that(list(catalog.get_references(container_ntiids=('x', 'y'))),
+                    is_([]))
+        assert_that(list(catalog.get_references(container_ntiids='z')),
+                    is_([1, 2]))
+        assert_that(catalog.get_containers(1), is_({'z'}))
+        # No containers given, none kept
+        catalog.replace_namespace('p', (1, 2))
+        assert_that(catalog.get_containers(1), is_(set()))
+        assert_that(list(catalog.get_references(container_ntiids='z')),
+                    is_([]))
+
+    def test_interned_containers(self):
+        catalog = ContainedObjectCatalog()
+        index = catalog.container_index
+        catalog.update_containers(1, ('x', 'y'))
+        catalog.update_containers(2, ('y',))
+        assert_that(catalog.get_containers(1), is_({'x', 'y'}))
+        assert_that(list(index.values_to_documents),
+                    is_(sorted(index.index_values(('x', 'y')))))
+        assert_that(list(catalog.get_references(container_ntiids='y')),
+                    is_([1, 2]))
+        assert_that(list(catalog.get_references(container_ntiids=('x', 'z'))),
+                    is_([]))
+        # The public accessors answer with container ntiids
+        assert_that(list(index.values()), is_(['x', 'y']))
+        assert_that(list(index.values(doc_id=1)), is_(['x', 'y']))
+        assert_that(list(index.values(min='y')), is_(['y']))
+        assert_that(index.containsValue('x'), is_(True))
+        assert_that(index.containsValue('z'), is_(False))
+        assert_that(index.minValue(), is_('x'))
+        assert_that(index.maxValue(), is_('y'))
+        catalog.remove_containers(1, 'x')
+        assert_that(catalog.get_containers(1), is_({'y'}))
+        assert_that(list(index.values()), is_(['y']))
+        assert_that(index.containsValue('x'), is_(False))
+
+    def test_interned_queries(self):
+        catalog = ContainedObjectCatalog()
+        index = catalog.container_index
+        catalog.update_containers(1, ('a', 'b'))
+        catalog.update_containers(2, ('c',))
+        assert_that(list(index.apply({'between': ('b', 'c')})), is_([1, 2]))
+        assert_that(list(index.apply({'between': ('a', 'a')})), is_([1]))
+        assert_that(list(index.apply({'any': None})), is_([1, 2]))
+        with self.assertRaises(ValueError):
+            index.apply({'all': ('a',)})
+
+        # The ids of values no document has are reclaimed
+        catalog.remove_containers(1, 'a')
+        assert_that(index._ids.get('a'), is_(none()))
+        index.replace(1, ('d',))
+        assert_that(index._ids.get('b'), is_(none()))
+        index.unindex_doc(2)
+        assert_that(list(index._ids), is_(['d']))
+        assert_that(list(index._values.values()), is_(['d']))
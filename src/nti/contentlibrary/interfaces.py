@@ -346,6 +346,13 @@ class ISynchronizationParams(interface.Interface):
                         default=False,
                         required=False)
 
+    useContentFingerprints = Bool(title=u"Detect changed packages by content",
+                                  description=u"Packages whose TOC, metadata and "
+                                  u"asset data are unchanged are not updated, "
+                                  u"even if they are newer",
+                                  default=False,
+                                  required=False)
+
 
 class IGenericSynchronizationResults(interface.Interface):
     pass
@@ -991,6 +998,11 @@ class IContentPackageReplacedEvent(IObjectModifiedEvent):
 
     Note particularly that the children might be different between the two
     objects.
+
+    While the event is notified, the units of the original still have
+    their intids and those of the replacement have none. Right after
+    it, each replacement unit takes over the intid of the original
+    unit with the same NTIID, or gets a new one.
     """
 
     replacement = Object(IContentPackage,
@@ -1151,6 +1163,40 @@ class IS3ContentPackage(IDelimitedHierarchyContentPackage, IS3ContentUnit):
     pass
 
 
+class IPackedBucket(IEnumerableDelimitedHierarchyBucket):
+    """
+    A directory within a packed content package archive
+    (see :mod:`nti.contentlibrary.packed`).
+    """
+
+    path = TextLine(title=u"The path of the directory within the archive")
+
+
+class IPackedKey(IDelimitedHierarchyKey):
+    """
+    A file within a packed content package archive.
+    """
+
+    bucket = Object(IPackedBucket,
+                    title=u"The bucket to which this key belongs")
+
+    path = TextLine(title=u"The path of the file within the archive")
+
+
+class IPackedContentUnit(dub_interfaces.IDCTimes, IDelimitedHierarchyContentUnit):
+
+    key = Object(IPackedKey,
+                 title=u"The key identifying the unit of content this belongs to.")
+
+    # @deprecated: Prefer IDCTimes
+    lastModified = Number(title=u"Time since the epoch this unit was last modified.",
+                          readonly=True)
+
+
+class IPackedContentPackage(IDelimitedHierarchyContentPackage, IPackedContentUnit):
+    pass
+
+
 class IFilesystemBucket(IEnumerableDelimitedHierarchyBucket):
     """
     An absolute string of a filesystem directory.
@@ -1379,7 +1425,7 @@ class ISyncableContentPackageBundleLibrary(interface.Interface):
     if necessary.
     """
 
-    def syncFromBucket(bundle_bucket):
+    def syncFromBucket(bundle_bucket, fast=True):
         """
         Synchronize the state of the library. The code that calls this should take
         care to use the (abstractly) same bucket every time.
@@ -1389,6 +1435,8 @@ class ISyncableContentPackageBundleLibrary(interface.Interface):
                 in general, calling code should not pass a `None` value, representing a
                 missing bucket, as that is likely to be a temporary condition and
                 would result in much churn.
+        :keyword fast: If true, bundles whose meta info has not been modified
+                since the last sync are skipped without being read.
         """
 
 
@@ -1649,6 +1697,26 @@ class IEclipseContentPackageFactory(interface.Interface):
         """
 
 
+class ICompiledTOCCache(interface.Interface):
+    """
+    A utility storing compiled TOCs (see
+    :func:`nti.contentlibrary.eclipse.compile_toc`), so content packages
+    can be built without parsing their TOC XML.
+    """
+
+    def get(digest):
+        """
+        Return the compiled TOC stored for the TOC with the SHA1 hex
+        `digest`, or None.
+        """
+
+    def set(digest, compiled):
+        """
+        Store the compiled TOC of the TOC with the SHA1 hex `digest`.
+        Failures are not reported.
+        """
+
+
 class IContentVendorInfo(IEnumerableMapping,
                          ILastModified,
                          IZContained):
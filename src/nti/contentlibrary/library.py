@@ -9,6 +9,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import time
+import itertools
 import numbers
 import warnings
 
@@ -37,6 +38,10 @@ from zope.intid.interfaces import IIntIds
 from nti.contentlibrary import DELETED_MARKER
 from nti.contentlibrary import AUTHORED_PREFIX
 
+from nti.contentlibrary.contentunit import content_unit_table
+
+from nti.contentlibrary.existence import existence_cache
+
 from nti.contentlibrary.interfaces import INoAutoSync
 from nti.contentlibrary.interfaces import IContentPackage
 from nti.contentlibrary.interfaces import IGlobalContentPackage
@@ -60,6 +65,9 @@ from nti.contentlibrary.synchronize import UnmatchedRootNTIIDException
 from nti.contentlibrary.synchronize import LibrarySynchronizationResults
 
 from nti.contentlibrary.utils import get_content_packages
+from nti.contentlibrary.utils import content_package_fingerprint
+
+from nti.contentlibrary.walker import walk_events
 
 from nti.externalization.persistence import NoPickle
 
@@ -72,6 +80,20 @@ from nti.site.localutility import queryNextUtility
 
 logger = __import__('logging').getLogger(__name__)
 
+#: A process-wide counter incremented whenever any library
+#: changes the content units it contains. Caches of library
+#: lookups use it as an invalidation stamp.
+_library_generation = 0
+
+
+def library_generation():
+    return _library_generation
+
+
+def _bump_library_generation():
+    global _library_generation  # pylint: disable=global-statement
+    _library_generation += 1
+
 
 @interface.implementer(IContentPackageEnumeration)
 class AbstractContentPackageEnumeration(object):
@@ -166,6 +188,19 @@ def is_indexable(obj):
         return False
 
 
+def _adopt_units(context, table):
+    """
+    Add the units of the table to the connection of `context` and
+    make units without a parent owned by their parent in the tree.
+    """
+    units = table.units
+    for obj, parent in zip(units, table.parents):
+        add_to_connection(context, obj)
+        # take ownership
+        if parent is not None and getattr(obj, '__parent__', None) is None:
+            obj.__parent__ = units[parent]
+
+
 def register_content_units(context, content_unit):
     """
     Recursively register content units.
@@ -174,22 +209,15 @@ def register_content_units(context, content_unit):
     if intids is None:
         return
 
-    def _register(obj):
-        add_to_connection(context, obj)
-        for child in obj.children or ():
-            # take ownership
-            if getattr(child, '__parent__', None) is None:
-                child.__parent__ = obj
-            # process children
-            _register(child)
-        # register w/ intid utility
+    table = content_unit_table(content_unit)
+    _adopt_units(context, table)
+    # register w/ intid utility, children first
+    for obj in reversed(table.units):
         if is_indexable(obj):
             intid = intids.queryId(obj)
             if intid is None:
                 addIntId(obj)
 
-    _register(content_unit)
-
 
 def unregister_content_units(context):
     """
@@ -199,15 +227,77 @@ def unregister_content_units(context):
     if intids is None:
         return
 
-    def _unregister(obj):
-        for child in obj.children or ():
-            _unregister(child)
+    for obj in reversed(content_unit_table(context).units):
         if is_indexable(obj):
             intid = intids.queryId(obj)
             if intid is not None:
                 removeIntId(obj)
 
-    _unregister(context)
+
+def _unit_signature(unit):
+    """
+    The values of a unit the catalogs index, its location in the tree,
+    and its modification time, to tell whether a replacement unit
+    changed.
+    """
+    creator = getattr(unit, 'creator', None)
+    parent = getattr(unit, '__parent__', None)
+    return (getattr(unit, 'mimeType', None),
+            getattr(unit, 'title', None),
+            getattr(creator, 'username', creator),
+            getattr(unit, 'href', None),
+            getattr(parent, 'ntiid', None),
+            getattr(unit, 'ordinal', None),
+            tuple(x.ntiid for x in unit.children or ()),
+            tuple(getattr(unit, 'embeddedContainerNTIIDs', None) or ()),
+            getattr(unit, 'publishLastModified', None),
+            getattr(unit, 'lastModified', None))
+
+
+def replace_content_units(context, new, old):
+    """
+    Recursively register the content units of `new`, a replacement
+    for `old`, reusing the intid of the old unit with the same NTIID.
+    Units that take over an intid do not get the intid events, so a
+    modified event is notified for those that changed, to reindex them.
+
+    :return: The old units with no counterpart in `new`, including all
+        but the first of several old units sharing an NTIID. They are
+        still registered; pass them to :func:`unregister_content_units`.
+    """
+    intids = component.queryUtility(IIntIds)
+    if intids is None:
+        return ()
+    if getattr(intids, 'force_register', None) is None:
+        register_content_units(context, new)
+        return (old,)
+
+    previous = {}
+    for obj in content_unit_table(old).units:
+        if is_indexable(obj) and intids.queryId(obj) is not None:
+            previous.setdefault(obj.ntiid, []).append(obj)
+
+    table = content_unit_table(new)
+    _adopt_units(context, table)
+    for obj in reversed(table.units):
+        if not is_indexable(obj):
+            continue
+        matches = previous.get(obj.ntiid) or []
+        kept = [x for x in matches if x is not obj]
+        if len(kept) != len(matches) or intids.queryId(obj) is not None:
+            matches[:] = kept
+            continue
+        if not matches:
+            addIntId(obj)
+            continue
+        match = matches.pop(0)
+        uid = intids.getId(match)
+        intids.force_unregister(uid, match)
+        intids.force_register(uid, obj)
+        setattr(obj, intids.attribute, uid)
+        if _unit_signature(obj) != _unit_signature(match):
+            lifecycleevent.modified(obj)
+    return [x for matches in previous.values() for x in matches]
 
 
 @interface.implementer(IEditableContentPackageLibrary)
@@ -247,6 +337,11 @@ class AbstractContentPackageLibrary(object):
     # library last modified timestamp
     _last_modified = 0
 
+    # Whether a package whose files are newer is compared by
+    # content before it is updated, when the sync params
+    # do not ask for it
+    use_content_fingerprints = False
+
     __name__ = u'Library'
     __parent__ = None
 
@@ -263,6 +358,37 @@ class AbstractContentPackageLibrary(object):
         """
         return not INoAutoSync.providedBy(package)
 
+    def _use_content_fingerprints(self, params=None):
+        return self.use_content_fingerprints \
+            or bool(getattr(params, 'useContentFingerprints', False))
+
+    @staticmethod
+    def _fingerprint(package):
+        result = package.contentFingerprint
+        if result is None:
+            result = content_package_fingerprint(package)
+            package.contentFingerprint = result
+        return result
+
+    def _is_content_unchanged(self, new_package, old_package):
+        """
+        Determine if the newer `new_package` has the same content
+        fingerprint as the `old_package` it would replace.
+        """
+        old_print = getattr(old_package, 'contentFingerprint', None)
+        if old_print is None:
+            # Never fingerprinted, so we must update to record one
+            return False
+        return self._fingerprint(new_package) == old_print
+
+    @staticmethod
+    def _synced_last_modified(package):
+        """
+        The time of the newest files `package` is known to reflect.
+        """
+        return max(package.lastModified,
+                   getattr(package, 'fingerprintLastModified', -1))
+
     @property
     def _root_name(self):
         root = getattr(self._enumeration, 'root', None)
@@ -270,20 +396,15 @@ class AbstractContentPackageLibrary(object):
         return name
 
     def _get_content_units_for_package(self, package):
-        result = []
-
-        def _recur(unit):
-            result.append(unit)
-            for child in unit.children:
-                _recur(child)
-        _recur(package)
-        return result
+        return content_unit_table(package).units
 
     def _record_units_by_ntiid(self, package):
+        _bump_library_generation()
         for unit in self._get_content_units_for_package(package):
             self._contentUnitsByNTIID[unit.ntiid] = unit
 
     def _unrecord_units_by_ntiid(self, package):
+        _bump_library_generation()
         for unit in self._get_content_units_for_package(package):
             self._contentUnitsByNTIID.pop(unit.ntiid, None)
 
@@ -347,18 +468,20 @@ class AbstractContentPackageLibrary(object):
             self._unrecord_units_by_ntiid(old)
             self._record_units_by_ntiid(new)
             new.__parent__ = self  # ownership
-            # CS/JZ, 2-04-15 DO NEITHER call lifecycleevent.created nor
-            # lifecycleevent.added on 'new' objects as modified events subscribers
-            # are expected to handle any change
-            register_content_units(self, new)
             if lib_sync_results is not None:
                 lib_sync_results.modified(new.ntiid)  # register
             # Note that this is the special event that shows both objects.
+            # The old units still have their intids while it is notified.
             notify(ContentPackageReplacedEvent(new, old, params, results))
+            # CS/JZ, 2-04-15 DO NEITHER call lifecycleevent.created nor
+            # lifecycleevent.added on 'new' objects as modified events subscribers
+            # are expected to handle any change
+            vanished = replace_content_units(self, new, old)
             # CS/JZ, 2-04-15  DO NOT call lifecycleevent.removed on this
             # objects b/c this may unregister things we don't want to leaving
             # the database in a invalid state
-            unregister_content_units(old)
+            for unit in vanished:
+                unregister_content_units(unit)
             old.__parent__ = None  # ground
             # track
             result.append(new)
@@ -400,7 +523,7 @@ class AbstractContentPackageLibrary(object):
             or component.getGlobalSiteManager() == component.getSiteManager():
             return self._contentPackages.values()
         else:
-            return get_content_packages(sites=(site,))
+            return get_content_packages(sites=(site,), cached=True)
 
     def _mappify(self, contentPackages=(), package_ntiids=None):
         """
@@ -415,6 +538,12 @@ class AbstractContentPackageLibrary(object):
             raise Exception("No packages to update were found")
         return result
 
+    def _enumerate_content_packages(self):
+        """
+        Return all the content packages there are now.
+        """
+        return self._enumeration.enumerateContentPackages()
+
     def syncContentPackages(self, params=None, results=None, do_notify=True):
         """
         Fires created, added, modified, or removed events for each
@@ -435,13 +564,18 @@ class AbstractContentPackageLibrary(object):
         current_packages = self._get_current_packages()
         old_content_packages = self._mappify(current_packages, packages)
 
+        # Existence answers from before the sync may be stale
+        existence_cache.clear()
+
         # Make sure we get ALL packages
-        new_content_packages = self._enumeration.enumerateContentPackages()
+        new_content_packages = self._enumerate_content_packages()
         new_content_packages = {x.ntiid: x for x in new_content_packages}
 
         enumeration = self._enumeration
         enumeration_last_modified = getattr(enumeration, 'lastModified', 0)
 
+        fingerprints = self._use_content_fingerprints(params)
+
         # Before we fire any events, compute all the work so that we can present
         # a consistent view to any listeners that will be watching.
         removed = []
@@ -468,11 +602,22 @@ class AbstractContentPackageLibrary(object):
             new_package = new_content_packages.get(old_key)
             if new_package is None:
                 removed.append(old_package)
-            elif old_package.lastModified < new_package.lastModified:
-                changed.append((new_package, old_package))
+            elif self._synced_last_modified(old_package) < new_package.lastModified:
+                if      fingerprints \
+                    and self._is_content_unchanged(new_package, old_package):
+                    logger.debug("Package %s is newer but unchanged", old_key)
+                    old_package.fingerprintLastModified = new_package.lastModified
+                    unmodified.append(old_package)
+                else:
+                    changed.append((new_package, old_package))
             else:
                 unmodified.append(old_package)
 
+        if fingerprints:
+            # Record what the added and updated packages were built from
+            for package in itertools.chain(added, (x[0] for x in changed)):
+                self._fingerprint(package)
+
         if removed or added or changed or never_synced:
             # CS/JZ, 1-29-15 We need this before event firings because some code
             # (at least question_map.py used to) relies on getting the new content units
@@ -584,6 +729,8 @@ class AbstractContentPackageLibrary(object):
             if intids.queryId(unit) is None:
                 result[ntiid] = unit
                 del self._contentUnitsByNTIID[ntiid]
+        if result:
+            _bump_library_generation()
 
         parent = queryNextUtility(self, IContentPackageLibrary)
         if parent is not None:
@@ -628,6 +775,7 @@ class AbstractContentPackageLibrary(object):
         # so that people that care can clean up.
         # What's the right order for this, before or after
         # we do the delete?
+        _bump_library_generation()
         if self._contentPackages:
             for title in self._contentPackages.values():
                 lifecycleevent.removed(title)
@@ -772,12 +920,11 @@ class AbstractContentPackageLibrary(object):
         result = []
         parent = self._get_content_unit(ntiid)
         if parent is not None:
-            def rec(toc, accum):
-                accum.extend(toc.embeddedContainerNTIIDs)
-                for child in toc.children:
-                    rec(child, accum)
-                accum.append(toc.ntiid)
-            rec(parent, result)
+            for toc, entering in walk_events(parent):
+                if entering:
+                    result.extend(toc.embeddedContainerNTIIDs)
+                else:
+                    result.append(toc.ntiid)
             # And the last thing we did was append the parent
             # itself, so take it off; we only want the children
             result.pop()
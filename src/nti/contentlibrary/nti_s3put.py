@@ -38,7 +38,9 @@ SYNOPSIS
           -b/--bucket <bucket_name> [-c/--callback <num_cb>]
           [-d/--debug <debug_level>] [-i/--ignore <ignore_dirs>]
           [-n/--no_op] [-p/--prefix <prefix>] [-q/--quiet]
-          [-g/--grant grant] [-w/--no_overwrite] [-r/--reduced] path
+          [-g/--grant grant] [-w/--no_overwrite] [-r/--reduced]
+          [-j/--jobs <jobs>] [--state <state_file>]
+          [--endpoint <host[:port]>] [--sync [--delete]] path
 
     Where
         access_key - Your AWS Access Key ID.  If not supplied, boto will
@@ -83,6 +85,23 @@ SYNOPSIS
                        the key exists on s3 the file on s3 will not be
                        updated.
         reduced - Use Reduced Redundancy storage
+        jobs - The number of files uploaded at the same time (default 8).
+        state_file - A file recording the files that have been uploaded.
+                     If the upload is interrupted, running it again with
+                     the same state file skips the files that were
+                     uploaded and have not changed since.
+        sync - Only upload the files that differ from their copy in s3,
+               comparing the MD5 of what would be uploaded (after any
+               gzip compression) with the ETag and size of the keys
+               under the prefix, which are listed once.
+        delete - With --sync, delete the keys under the prefix that have
+                 no local file. Nothing is deleted if an upload failed.
+        endpoint - Upload to an S3 compatible service at host[:port]
+                   over plain HTTP, such as a local stand-in for testing.
+
+     Files of 64MB or more (once compressed) are sent as multipart
+     uploads. Unless -q is given, progress and throughput are reported
+     every few seconds.
 
 
      If the -n option is provided, no files will be transferred to S3 but
@@ -95,12 +114,18 @@ SYNOPSIS
      and python/emacs configs..
 """
 
+import io
 import os
 import sys
-import gzip
+import time
+import shutil
+import hashlib
+import tempfile
 import getopt
 import logging
-from six import StringIO
+import threading
+
+from multiprocessing.pool import ThreadPool
 
 import boto
 
@@ -110,17 +135,37 @@ from zope.configuration import xmlconfig
 
 from zope.exceptions.log import Formatter
 
-#: Content types we will gzip on upload
-GZIP_TYPES = ('text/csv', 'text/css', 'text/html', 'text/xml', 'application/xml',
-              'application/json', 'application/javascript')
+from nti.contentlibrary.package_files import GZIP_TYPES
+from nti.contentlibrary.package_files import READ_CHUNK_SIZE
+from nti.contentlibrary.package_files import IGNORED_DOTFILES  # pylint: disable=unused-import
+
+from nti.contentlibrary.package_files import walk_files
+from nti.contentlibrary.package_files import write_gzipped
 
 #: Anything we explicitly want to exclude from gzipping, like .json
 #: data
 NOT_GZIP_EXT = ()
 
-#: Unix dotfiles we will always ignore
-IGNORED_DOTFILES = ('.svn', '.git', '.DS_Store', '.coverage', '.noseids',
-                    '.dir_locals.el', '.installed.cfg')
+#: The default number of concurrent uploads
+DEFAULT_JOBS = 8
+
+#: Files at least this large that are not gzipped are sent
+#: as multipart uploads
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+
+#: The size of the parts of a multipart upload; S3 requires
+#: all but the last to be at least 5MB
+MULTIPART_CHUNK_SIZE = 16 * 1024 * 1024
+
+#: Compressed files up to this size are kept in memory
+#: until they are uploaded, larger ones are spooled to disk
+SPOOL_SIZE = 8 * 1024 * 1024
+
+#: The maximum number of keys deleted in one request
+DELETE_BATCH_SIZE = 1000
+
+#: Seconds between progress reports
+PROGRESS_INTERVAL = 5
 
 
 logger = __import__('logging').getLogger(__name__)
@@ -147,9 +192,205 @@ def set_log_formatter():
     logging.root.handlers[0].setFormatter(Formatter(ei))
 
 
+def _upload_headers(fullpath, headers=None):
+    if headers is not None:
+        headers = dict(headers)
+    else:
+        headers = {}
+
+    mt = mimetypes.guess_type(fullpath)
+    if mt and mt[0]:
+        headers['Content-Type'] = mt[0]
+    return headers
+
+
+def _is_gzipped(fullpath, headers, gzip_types=GZIP_TYPES,
+                gz_ext_exclude=NOT_GZIP_EXT):
+    return  headers.get('Content-Type') in gzip_types \
+        and not os.path.splitext(fullpath)[-1] in gz_ext_exclude
+
+
+class _DigestSink(object):
+    """
+    A write-only file that keeps the MD5 of what is written, both
+    whole and in parts of `chunk_size` bytes.
+    """
+
+    def __init__(self, chunk_size=MULTIPART_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.md5 = hashlib.md5()
+        self.parts = []
+        self.size = 0
+        self._part_left = 0
+
+    def write(self, data):
+        self.md5.update(data)
+        self.size += len(data)
+        while data:
+            if not self._part_left:
+                self.parts.append(hashlib.md5())
+                self._part_left = self.chunk_size
+            piece = data[:self._part_left]
+            self.parts[-1].update(piece)
+            self._part_left -= len(piece)
+            data = data[len(piece):]
+
+    def flush(self):
+        pass
+
+    def etag(self, multipart_threshold=None):
+        if multipart_threshold and self.size >= multipart_threshold:
+            # The ETag of a multipart upload is the MD5 of the MD5s
+            # of the parts, followed by the number of parts
+            etag = hashlib.md5(b''.join(x.digest() for x in self.parts))
+            return '%s-%d' % (etag.hexdigest(), len(self.parts))
+        return self.md5.hexdigest()
+
+
+def s3_etag(fullpath, headers=None, gzip_types=GZIP_TYPES,
+            gz_ext_exclude=NOT_GZIP_EXT, multipart_threshold=None,
+            chunk_size=MULTIPART_CHUNK_SIZE, **unused_kwargs):
+    """
+    Return the ETag and size S3 will report for the file once it is
+    uploaded by :func:`s3_upload_file` with the same arguments. The
+    file is read in chunks, never all at once.
+    """
+    headers = _upload_headers(fullpath, headers)
+    sink = _DigestSink(chunk_size)
+    if _is_gzipped(fullpath, headers, gzip_types, gz_ext_exclude):
+        write_gzipped(fullpath, sink)
+    else:
+        with open(fullpath, 'rb') as f:
+            shutil.copyfileobj(f, sink, READ_CHUNK_SIZE)
+    return sink.etag(multipart_threshold), sink.size
+
+
+class PreparedUpload(object):
+    """
+    A file ready to upload: its headers and, for the types that are
+    compressed, its compressed contents.
+    """
+
+    __slots__ = ('fullpath', 'headers', 'fp', 'size')
+
+    def __init__(self, fullpath, headers, fp=None, size=None):
+        self.fullpath = fullpath
+        self.headers = headers
+        self.fp = fp
+        self.size = os.path.getsize(fullpath) if size is None else size
+
+    def open(self):
+        return open(self.fullpath, 'rb') if self.fp is None else self.fp
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+def prepare_upload(fullpath, headers=None, gzip_types=GZIP_TYPES,
+                   gz_ext_exclude=NOT_GZIP_EXT, **unused_kwargs):
+    """
+    Return the :class:`PreparedUpload` of a file. Files that are
+    compressed are compressed in chunks to a temporary file that
+    stays in memory up to :data:`SPOOL_SIZE` bytes, so neither the
+    whole file nor the whole compressed file needs to be in memory.
+    """
+    headers = _upload_headers(fullpath, headers)
+    if not _is_gzipped(fullpath, headers, gzip_types, gz_ext_exclude):
+        return PreparedUpload(fullpath, headers)
+    fp = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        write_gzipped(fullpath, fp)
+        size = fp.tell()
+        fp.seek(0)
+    except Exception:
+        fp.close()
+        raise
+    headers['Content-Encoding'] = 'gzip'
+    return PreparedUpload(fullpath, headers, fp, size)
+
+
+def _multipart_upload(key, fp, size, cb=None, num_cb=None, policy=None,
+                      reduced_redundancy=None, headers=None,
+                      chunk_size=MULTIPART_CHUNK_SIZE):
+    upload = key.bucket.initiate_multipart_upload(key.name,
+                                                  headers=headers,
+                                                  policy=policy,
+                                                  reduced_redundancy=reduced_redundancy)
+    try:
+        remaining = size
+        part_num = 1
+        while remaining > 0 or part_num == 1:
+            part_size = min(chunk_size, remaining)
+            upload.upload_part_from_file(fp, part_num,
+                                         cb=cb,
+                                         num_cb=num_cb,
+                                         size=part_size)
+            remaining -= part_size
+            part_num += 1
+        upload.complete_upload()
+    except Exception:
+        upload.cancel_upload()
+        raise
+
+
+def s3_multipart_upload(key, fullpath, cb=None, num_cb=None, policy=None,
+                        reduced_redundancy=None, headers=None,
+                        chunk_size=MULTIPART_CHUNK_SIZE):
+    """
+    Upload a file to s3 in parts of `chunk_size` bytes. An
+    upload that fails is cancelled so no parts are left behind.
+    """
+    with open(fullpath, 'rb') as fp:
+        _multipart_upload(key, fp, os.path.getsize(fullpath),
+                          cb=cb,
+                          num_cb=num_cb,
+                          policy=policy,
+                          reduced_redundancy=reduced_redundancy,
+                          headers=headers,
+                          chunk_size=chunk_size)
+
+
+def s3_upload_prepared(key, prepared, cb=None, num_cb=None, policy=None,
+                       reduced_redundancy=None, multipart_threshold=None,
+                       chunk_size=MULTIPART_CHUNK_SIZE, **unused_kwargs):
+    """
+    Upload a :class:`PreparedUpload` to s3 and close it. See
+    :func:`s3_upload_file` for the arguments.
+
+    :return: The headers the file was uploaded with.
+    """
+    headers = prepared.headers
+    kwargs = {
+        'cb': cb,
+        'num_cb': num_cb,
+        'policy': policy,
+        'headers': headers,
+        'reduced_redundancy': reduced_redundancy,
+    }
+    try:
+        if multipart_threshold and prepared.size >= multipart_threshold:
+            fp = prepared.open()
+            try:
+                _multipart_upload(key, fp, prepared.size,
+                                  chunk_size=chunk_size,
+                                  **kwargs)
+            finally:
+                fp.close()
+        elif prepared.fp is not None:
+            key.set_contents_from_file(prepared.fp, **kwargs)
+        else:
+            key.set_contents_from_filename(prepared.fullpath, **kwargs)
+    finally:
+        prepared.close()
+    return headers
+
+
 def s3_upload_file(key, fullpath, cb=None, num_cb=None, policy=None,
                    reduced_redundancy=None, headers=None,
-                   gzip_types=GZIP_TYPES, gz_ext_exclude=NOT_GZIP_EXT):
+                   gzip_types=GZIP_TYPES, gz_ext_exclude=NOT_GZIP_EXT,
+                   multipart_threshold=None):
     """
     Upload a file to s3
 
@@ -164,71 +405,289 @@ def s3_upload_file(key, fullpath, cb=None, num_cb=None, policy=None,
     :param: headers - Transfer file headers
     :param: gzip_types - Mime types to upload as gzip
     :param: gz_ext_exclude - exclude exts files from gzipping
+    :param: multipart_threshold - Upload files of at least this size
+                                  (after compression) in parts
     """
+    prepared = prepare_upload(fullpath, headers, gzip_types, gz_ext_exclude)
+    return s3_upload_prepared(key, prepared,
+                              cb=cb,
+                              num_cb=num_cb,
+                              policy=policy,
+                              reduced_redundancy=reduced_redundancy,
+                              multipart_threshold=multipart_threshold)
+_upload_file = s3_upload_file
 
-    if headers is not None:
-        headers = dict(headers)
-    else:
-        headers = {}
 
-    mt = mimetypes.guess_type(fullpath)
-    if mt and mt[0]:
-        headers['Content-Type'] = mt[0]
+class UploadState(object):
+    """
+    The files already uploaded, recorded in a file so that an
+    interrupted upload can be resumed. Each line holds the key
+    name, size and modification time of an uploaded file; a file
+    that changed after it was uploaded is uploaded again.
+    """
 
-    if      headers.get('Content-Type') in gzip_types \
-        and not os.path.splitext(fullpath)[-1] in gz_ext_exclude:
-        mtime = os.stat(fullpath).st_mtime
-        filename = os.path.basename(fullpath)
-        strio = StringIO()
-        with gzip.GzipFile(fileobj=strio,
-                           mode='wb',
-                           filename=filename,
-                           mtime=mtime) as gzipped:
-            with open(fullpath, 'rb') as f:
-                gzipped.write(f.read())
-        data = strio.getvalue()
-        headers['Content-Encoding'] = 'gzip'
-        key.set_contents_from_string(data,
-                                     cb=cb,
-                                     num_cb=num_cb,
-                                     policy=policy,
-                                     reduced_redundancy=reduced_redundancy,
-                                     headers=headers)
-    else:
-        key.set_contents_from_filename(fullpath,
-                                       cb=cb,
-                                       num_cb=num_cb,
-                                       policy=policy,
-                                       reduced_redundancy=reduced_redundancy,
-                                       headers=headers)
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = set()
+        if os.path.exists(filename):
+            with io.open(filename, 'r', encoding='utf-8') as fp:
+                self.done.update(line.rstrip(u'\n') for line in fp)
+            self.done.discard(u'')
+        self._fp = io.open(filename, 'a', encoding='utf-8')
 
-    return headers
-_upload_file = s3_upload_file
+    @staticmethod
+    def entry(key_name, fullpath):
+        if isinstance(key_name, bytes):
+            key_name = key_name.decode('utf-8')
+        stat = os.stat(fullpath)
+        return u'%s\t%d\t%d' % (key_name, stat.st_size, int(stat.st_mtime))
+
+    def __contains__(self, entry):
+        return entry in self.done
+
+    def record(self, entry):
+        self.done.add(entry)
+        self._fp.write(entry + u'\n')
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+
+class UploadProgress(object):
+    """
+    Counts of the work done by :func:`upload_files`.
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self.files = 0
+        self.bytes = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    def __str__(self):
+        elapsed = self.elapsed
+        mbytes = self.bytes / (1024 * 1024)
+        return ('%d/%d files uploaded (%d skipped, %d failed), '
+                '%.1f MB in %.1fs, %.2f MB/s'
+                % (self.files, self.total, self.skipped, self.failed,
+                   mbytes, elapsed, mbytes / elapsed if elapsed else 0))
+
+
+def upload_files(bucket_factory, paths, prefix, jobs=DEFAULT_JOBS,
+                 existing=(), state=None, quiet=False, no_op=False,
+                 compress_jobs=None, **upload_kwargs):
+    """
+    Upload the files at `paths` using `jobs` concurrent uploads,
+    while up to `compress_jobs` (by default, `jobs`) others are
+    being compressed.
+
+    :param bucket_factory: A callable of no arguments returning the
+        bucket. It is called once by each worker, as boto connections
+        must not be shared between threads.
+    :param prefix: The prefix stripped from paths to get key names.
+    :param existing: Key names that are not uploaded again.
+    :param state: An optional :class:`UploadState` recording the
+        uploaded files. Files it has recorded are skipped.
+    :param upload_kwargs: The arguments of :func:`s3_upload_file`.
+    :return: The :class:`UploadProgress`; bytes are counted as sent.
+    """
+    existing = existing if isinstance(existing, (set, frozenset)) else set(existing)
+    work = []
+    progress = UploadProgress()
+    for fullpath in paths:
+        key_name = get_key_name(fullpath, prefix)
+        entry = UploadState.entry(key_name, fullpath) if state is not None else None
+        if key_name in existing or (entry is not None and entry in state):
+            progress.skipped += 1
+            if not quiet:
+                print('Skipping %s as it exists in s3' % fullpath)
+            continue
+        work.append((fullpath, key_name, entry))
+    progress.total = len(work) + progress.skipped
+
+    if no_op:
+        if not quiet:
+            for fullpath, key_name, _ in work:
+                print('Copying %s to %s' % (fullpath, key_name))
+        return progress
+
+    # Files are compressed by one pool and uploaded by another, so
+    # compression overlaps with the network. At most `pending` files
+    # are between the two at once, bounding the temporary files.
+    workers = max(1, min(jobs, len(work) or 1))
+    compress_jobs = workers if compress_jobs is None else max(1, compress_jobs)
+    pending = threading.Semaphore(workers + compress_jobs)
+    stopped = []
+    local = threading.local()
+
+    def feed():
+        for item in work:
+            pending.acquire()
+            if stopped:
+                break
+            yield item
+
+    def prepare(item):
+        try:
+            return item, prepare_upload(item[0], **upload_kwargs)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to compress %s", item[0])
+            return item, None
+
+    def upload(prepared_item):
+        item, prepared = prepared_item
+        try:
+            if prepared is None:
+                return item, None, 0
+            bucket = getattr(local, 'bucket', None)
+            if bucket is None:
+                bucket = local.bucket = bucket_factory()
+            size = prepared.size
+            key = bucket.new_key(item[1])
+            return item, s3_upload_prepared(key, prepared, **upload_kwargs), size
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to upload %s", item[0])
+            return item, None, 0
+        finally:
+            if prepared is not None:
+                prepared.close()
+            pending.release()
+
+    compress_pool = ThreadPool(compress_jobs)
+    upload_pool = ThreadPool(workers)
+    try:
+        reported = time.time()
+        prepared = compress_pool.imap_unordered(prepare, feed())
+        for item, headers, size in upload_pool.imap_unordered(upload, prepared):
+            fullpath, key_name, entry = item
+            if headers is None:
+                progress.failed += 1
+                continue
+            progress.files += 1
+            progress.bytes += size
+            if entry is not None:
+                state.record(entry)
+            if not quiet:
+                print('Copied %s to %s as type %s encoding %s'
+                      % (fullpath, key_name,
+                         headers.get('Content-Type', 'application/octet-stream'),
+                         headers.get('Content-Encoding', 'identity')))
+                if time.time() - reported >= PROGRESS_INTERVAL:
+                    reported = time.time()
+                    print(progress)
+    finally:
+        # Unblock the feed if we are leaving early
+        stopped.append(True)
+        pending.release()
+        for pool in (compress_pool, upload_pool):
+            pool.close()
+            pool.join()
+    if not quiet:
+        print(progress)
+    return progress
+
+
+def list_remote_keys(bucket, key_prefix):
+    """
+    Return a map from the names of the keys under `key_prefix` to
+    their ETag and size, listing the bucket once.
+    """
+    return {key.name: (key.etag.strip('"'), key.size)
+            for key in bucket.list(key_prefix)}
+
+
+def unchanged_keys(paths, prefix, remote, jobs=DEFAULT_JOBS, **upload_kwargs):
+    """
+    Return the key names of the files at `paths` that are the same as
+    their copy in `remote` (see :func:`list_remote_keys`). The files
+    are hashed by `jobs` concurrent workers.
+
+    :param upload_kwargs: The arguments the files would be uploaded
+        with; see :func:`s3_etag`.
+    """
+    candidates = []
+    for fullpath in paths:
+        key_name = get_key_name(fullpath, prefix)
+        if key_name in remote:
+            candidates.append((fullpath, key_name))
+
+    def digest(item):
+        fullpath, key_name = item
+        headers = _upload_headers(fullpath, upload_kwargs.get('headers'))
+        gzipped = _is_gzipped(fullpath, headers,
+                              upload_kwargs.get('gzip_types', GZIP_TYPES),
+                              upload_kwargs.get('gz_ext_exclude', NOT_GZIP_EXT))
+        if      not gzipped \
+            and os.path.getsize(fullpath) != remote[key_name][1]:
+            return key_name, None
+        try:
+            return key_name, s3_etag(fullpath, **upload_kwargs)
+        except (IOError, OSError):
+            logger.exception("Failed to hash %s", fullpath)
+            return key_name, None
+
+    pool = ThreadPool(max(1, min(jobs, len(candidates) or 1)))
+    try:
+        return {key_name
+                for key_name, etag in pool.imap_unordered(digest, candidates)
+                if etag == remote[key_name]}
+    finally:
+        pool.close()
+        pool.join()
+
+
+def delete_orphans(bucket, key_names, remote, quiet=False, no_op=False):
+    """
+    Delete the keys in `remote` that are not in `key_names`.
+
+    :return: The names of the deleted keys.
+    """
+    orphans = sorted(set(remote).difference(key_names))
+    for i in range(0, len(orphans), DELETE_BATCH_SIZE):
+        batch = orphans[i:i + DELETE_BATCH_SIZE]
+        if not quiet:
+            for name in batch:
+                print('Deleting %s' % name)
+        if not no_op:
+            bucket.delete_keys(batch)
+    return orphans
 
 
 def main():
     try:
         opts, args = getopt.getopt(
-            sys.argv[1:], 'a:b:c::d:g:hi:np:qs:vwr',
+            sys.argv[1:], 'a:b:c::d:g:hi:j:np:qs:vwr',
             ['access_key=', 'bucket=', 'callback=', 'debug=', 'help',
              'grant=', 'ignore=', 'no_op', 'prefix=', 'quiet',
-             'secret_key=', 'no_overwrite', 'reduced', "header="]
+             'secret_key=', 'no_overwrite', 'reduced', "header=",
+             'jobs=', 'state=', 'endpoint=', 'sync', 'delete']
         )
     except:
         usage()
 
     cb = None
     debug = 0
-    total = 0
     num_cb = 0
     headers = {}
     prefix = '/'
     grant = None
+    sync = False
     quiet = False
     no_op = False
+    delete = False
     reduced = False
+    state_file = None
+    endpoint = None
     ignore_dirs = []
     bucket_name = ''
+    jobs = DEFAULT_JOBS
     no_overwrite = False
     aws_access_key_id = None
     aws_secret_access_key = None
@@ -250,6 +709,8 @@ def main():
             grant = a
         if o in ('-i', '--ignore'):
             ignore_dirs = a.split(',')
+        if o in ('-j', '--jobs'):
+            jobs = int(a)
         if o in ('-n', '--no_op'):
             no_op = True
         if o in ('-w', '--no_overwrite'):
@@ -264,6 +725,14 @@ def main():
             quiet = True
         if o in ('-s', '--secret_key'):
             aws_secret_access_key = a
+        if o == '--state':
+            state_file = a
+        if o == '--endpoint':
+            endpoint = a
+        if o == '--sync':
+            sync = True
+        if o == '--delete':
+            delete = True
         if o in ('--header'):
             # JAM: FIXME: The lowlevel boto layer has a bug uploading the cache-control header,
             # it prematurely escapes the = in max age, so we get a bad value
@@ -280,70 +749,86 @@ def main():
     path = os.path.expanduser(args[0])
     path = os.path.expandvars(path)
     path = os.path.abspath(path)
-    if bucket_name:
-        c = boto.connect_s3(aws_access_key_id=aws_access_key_id,
-                            aws_secret_access_key=aws_secret_access_key)
+    if not bucket_name:
+        print(usage())
+        return
+
+    connect_kwargs = {
+        'aws_access_key_id': aws_access_key_id,
+        'aws_secret_access_key': aws_secret_access_key,
+    }
+    if endpoint:
+        from boto.s3.connection import OrdinaryCallingFormat
+        host, _, port = endpoint.partition(':')
+        connect_kwargs.update(host=host,
+                              port=int(port) if port else None,
+                              is_secure=False,
+                              calling_format=OrdinaryCallingFormat())
+
+    def bucket_factory(validate=False):
+        c = boto.connect_s3(**connect_kwargs)
         c.debug = debug
-        b = c.get_bucket(bucket_name)
-        if os.path.isdir(path):
-            if no_overwrite:
-                if not quiet:
-                    print('Getting list of existing keys to check against')
-                keys = []
-                for key in b.list(get_key_name(path, prefix)):
-                    keys.append(key.name)
-            for root, dirs, files in os.walk(path):
-                for ignore in ignore_dirs:
-                    if ignore in dirs:
-                        dirs.remove(ignore)
-                for filename in files:
-                    if filename in IGNORED_DOTFILES:
-                        continue
-
-                    fullpath = os.path.join(root, filename)
-                    key_name = get_key_name(fullpath, prefix)
-                    copy_file = True
-                    if no_overwrite:
-                        if key_name in keys:
-                            copy_file = False
-                            if not quiet:
-                                print('Skipping %s as it exists in s3' %
-                                      filename)
-                    if copy_file:
-                        if not quiet and no_op:
-                            print('Copying %s to %s/%s' %
-                                  (filename, bucket_name, key_name))
-                        if not no_op:
-                            k = b.new_key(key_name)
-                            file_headers = _upload_file(k, fullpath,
-                                                        cb=cb,
-                                                        policy=grant,
-                                                        num_cb=num_cb,
-                                                        headers=headers,
-                                                        reduced_redundancy=reduced)
-                            if not quiet:
-                                print('Copied %s to %s/%s as type %s encoding %s'
-                                      % (filename, bucket_name, key_name,
-                                          file_headers.get(
-                                              'Content-Type',
-                                              'application/octet-stream'),
-                                          file_headers.get('Content-Encoding', 'identity')))
-                    total += 1
-        elif os.path.isfile(path):
-            copy_file = True
-            key_name = get_key_name(path, prefix)
-            if no_overwrite:
-                if b.get_key(key_name):  # FIXME: maybe none
-                    copy_file = False
-                    if not quiet:
-                        print('Skipping %s as it exists in s3' % path)
-            if copy_file:
-                k = b.new_key(key_name)
-                _upload_file(k, path, cb=cb, num_cb=num_cb,
-                             policy=grant,
-                             reduced_redundancy=reduced, headers=headers)
+        return c.get_bucket(bucket_name, validate=validate)
+
+    b = bucket_factory(validate=True)
+    if os.path.isdir(path):
+        paths = list(walk_files(path, ignore_dirs))
+        key_prefix = get_key_name(path, prefix)
+        if key_prefix and not key_prefix.endswith('/'):
+            # Only what is inside the directory
+            key_prefix += '/'
+    elif os.path.isfile(path):
+        paths = [path]
+        key_prefix = get_key_name(path, prefix)
     else:
         print(usage())
+        return
+
+    upload_kwargs = {
+        'cb': cb,
+        'num_cb': num_cb,
+        'policy': grant,
+        'headers': headers,
+        'reduced_redundancy': reduced,
+        'multipart_threshold': MULTIPART_THRESHOLD,
+    }
+
+    remote = {}
+    existing = set()
+    if sync or no_overwrite:
+        if not quiet:
+            print('Getting list of existing keys to check against')
+        if os.path.isdir(path):
+            remote = list_remote_keys(b, key_prefix)
+        else:
+            key = b.get_key(key_prefix)
+            if key is not None:
+                remote[key.name] = (key.etag.strip('"'), key.size)
+    if sync:
+        existing = unchanged_keys(paths, prefix, remote, jobs=jobs,
+                                  **upload_kwargs)
+        if not quiet:
+            print('%d of %d files are unchanged' % (len(existing), len(paths)))
+    elif no_overwrite:
+        existing = set(remote)
+
+    state = UploadState(state_file) if state_file else None
+    try:
+        progress = upload_files(bucket_factory, paths, prefix,
+                                jobs=jobs,
+                                existing=existing,
+                                state=state,
+                                quiet=quiet,
+                                no_op=no_op,
+                                **upload_kwargs)
+    finally:
+        if state is not None:
+            state.close()
+    if sync and delete and not progress.failed:
+        delete_orphans(b, (get_key_name(x, prefix) for x in paths), remote,
+                       quiet=quiet, no_op=no_op)
+    if progress.failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+The files of rendered content packages on disk, as the publishing
+tools (:mod:`.nti_s3put`, :mod:`.precompress`, :mod:`.packed`) and the
+filesystem keys see them.
+
+This module only uses the standard library, so that importing it
+does not pull in the dependencies of those tools.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import gzip
+import shutil
+
+#: The gzip content encoding
+GZIP = 'gzip'
+
+#: The brotli content encoding
+BROTLI = 'br'
+
+#: The extension of the compressed variant of a file for each encoding
+ENCODING_EXTENSIONS = {
+    GZIP: '.gz',
+    BROTLI: '.br',
+}
+
+#: Content types we will gzip
+GZIP_TYPES = ('text/csv', 'text/css', 'text/html', 'text/xml', 'application/xml',
+              'application/json', 'application/javascript')
+
+#: Unix dotfiles we will always ignore
+IGNORED_DOTFILES = ('.svn', '.git', '.DS_Store', '.coverage', '.noseids',
+                    '.dir_locals.el', '.installed.cfg')
+
+#: The size of the blocks files are read in
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def write_gzipped(fullpath, fileobj):
+    """
+    Write the gzipped contents of the file to `fileobj`.
+
+    The gzip header records no modification time, so the same
+    contents always compress to the same bytes (and S3 ETag), even
+    when the file is rendered again.
+    """
+    with gzip.GzipFile(fileobj=fileobj,
+                       mode='wb',
+                       filename=os.path.basename(fullpath),
+                       mtime=0) as gzipped:
+        with open(fullpath, 'rb') as f:
+            shutil.copyfileobj(f, gzipped, READ_CHUNK_SIZE)
+
+
+def _is_variant(filename, filenames):
+    """
+    Whether `filename` is a compressed variant of another of the
+    `filenames` of its directory.
+    """
+    base, ext = os.path.splitext(filename)
+    return ext in ENCODING_EXTENSIONS.values() and base in filenames
+
+
+def walk_files(path, ignore_dirs=()):
+    """
+    Yield the full paths of the files under `path` that make up
+    the content. Compressed variants of other files (see
+    :mod:`.precompress`) are derived data and are not included.
+    """
+    for root, dirs, files in os.walk(path):
+        for ignore in ignore_dirs:
+            if ignore in dirs:
+                dirs.remove(ignore)
+        names = set(files)
+        for filename in files:
+            if      filename not in IGNORED_DOTFILES \
+                and not _is_variant(filename, names):
+                yield os.path.join(root, filename)
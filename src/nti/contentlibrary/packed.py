@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Content packages packed into a single archive file.
+
+A rendered package is a directory of many small files; each costs an
+inode on disk and a request on S3. :func:`pack_package` writes the
+whole directory into one ``<name>.ntipkg`` archive instead:
+
+* an 8 byte magic number and the length of the index, as an
+  unsigned 64 bit big-endian integer;
+* the index, a UTF-8 JSON object whose ``members`` map the
+  '/'-separated path of each file to its ``[offset, size, mtime,
+  sha1]``, offsets being relative to the end of the index;
+* the contents of the files.
+
+The archive is read through :class:`PackedBucket` and
+:class:`PackedKey`, which implement the same delimited hierarchy as
+the filesystem and S3, so :func:`.eclipse.EclipseContentPackage` and
+the bundle synchronization work with them as they are. Archives on
+disk are memory mapped (:class:`FilesystemPackedArchive`); archives
+in S3 are read with ranged GET requests (:class:`S3PackedArchive`).
+A filesystem library presents each ``.ntipkg`` file it finds as a
+directory of that name, without the extension.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+
+import simplejson as json
+
+import repoze.lru
+
+from persistent import Persistent
+
+from zope import component
+from zope import interface
+
+from zope.cachedescriptors.method import cachedIn
+
+from nti.contentlibrary import eclipse
+
+from nti.contentlibrary.bucket import AbstractKey
+from nti.contentlibrary.bucket import AbstractBucket
+
+from nti.contentlibrary.contentunit import ContentUnit
+from nti.contentlibrary.contentunit import ContentPackage
+
+from nti.contentlibrary.interfaces import IPackedKey
+from nti.contentlibrary.interfaces import IPackedBucket
+from nti.contentlibrary.interfaces import IPackedContentUnit
+from nti.contentlibrary.interfaces import IPackedContentPackage
+from nti.contentlibrary.interfaces import IPersistentContentUnit
+from nti.contentlibrary.interfaces import IDelimitedHierarchyEntry
+from nti.contentlibrary.interfaces import IEclipseContentPackageFactory
+from nti.contentlibrary.interfaces import IPersistentContentPackage
+
+from nti.contentlibrary.package_files import READ_CHUNK_SIZE
+
+from nti.contentlibrary.package_files import walk_files
+
+from nti.dublincore.time_mixins import TimeProperty
+
+from nti.externalization.persistence import NoPickle
+
+#: The extension of packed package archives
+PACKED_EXTENSION = u'.ntipkg'
+
+#: The magic number starting a packed package archive
+PACKED_MAGIC = b'NTIPKG\x00\x01'
+
+_HEADER = struct.Struct('>8sQ')
+
+#: The number of bytes read from the start of an archive in S3 in
+#: the hope of getting the whole index in one request
+INDEX_PREFETCH_SIZE = 64 * 1024
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def pack_package(path, target=None):
+    """
+    Pack the directory of a rendered package into an archive, by
+    default ``path`` + :data:`PACKED_EXTENSION`. The archive is
+    replaced atomically.
+
+    :return: The path of the archive.
+    """
+    path = os.path.abspath(path)
+    target = target or path.rstrip(os.sep) + PACKED_EXTENSION
+    # Hash everything first; the index with the hashes comes
+    # before the data
+    members = {}
+    offset = 0
+    files = []
+    for fullpath in sorted(walk_files(path)):
+        stat = os.stat(fullpath)
+        sha1 = hashlib.sha1()
+        with open(fullpath, 'rb') as f:
+            for data in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                sha1.update(data)
+        name = os.path.relpath(fullpath, path).replace(os.sep, '/')
+        members[name] = [offset, stat.st_size, int(stat.st_mtime),
+                         sha1.hexdigest()]
+        files.append((fullpath, stat.st_size))
+        offset += stat.st_size
+
+    index = json.dumps({'members': members}, sort_keys=True).encode('utf-8')
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(target),
+                               dir=os.path.dirname(target))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(_HEADER.pack(PACKED_MAGIC, len(index)))
+            out.write(index)
+            for fullpath, size in files:
+                with open(fullpath, 'rb') as f:
+                    remaining = size
+                    while remaining > 0:
+                        data = f.read(min(READ_CHUNK_SIZE, remaining))
+                        if not data:
+                            raise IOError("File changed while packing", fullpath)
+                        out.write(data)
+                        remaining -= len(data)
+        os.rename(tmp, target)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return target
+
+
+def is_packed_archive(path):
+    return path.endswith(PACKED_EXTENSION) and os.path.isfile(path)
+
+
+class PackedArchive(object):
+    """
+    The index of an archive and access to its members, read through
+    a callable of a start offset and a size returning those bytes of
+    the archive.
+
+    :ivar members: A map from member path to ``(offset, size, mtime,
+        sha1)``.
+    """
+
+    lastModified = createdTime = -1
+
+    def __init__(self, read_range):
+        self._read_range = read_range
+        self.members = {}
+        self._data_offset = 0
+        self._children = None
+
+    def _parse_index(self, head=b'', read_range=None):
+        """
+        Read the index, returning the members and the offset of the
+        data. `head` may hold the first bytes of the archive.
+        """
+        read_range = read_range or self._read_range
+        if len(head) < _HEADER.size:
+            head = read_range(0, _HEADER.size)
+        magic, length = _HEADER.unpack(head[:_HEADER.size])
+        if magic != PACKED_MAGIC:
+            raise ValueError("Not a packed package archive", self)
+        end = _HEADER.size + length
+        if len(head) >= end:
+            index = head[_HEADER.size:end]
+        else:
+            index = read_range(_HEADER.size, length)
+        index = json.loads(bytes(index).decode('utf-8'))
+        members = {k: tuple(v) for k, v in index['members'].items()}
+        return members, end
+
+    def _load_index(self, head=b''):
+        self.members, self._data_offset = self._parse_index(head)
+        self._children = None
+
+    @property
+    def children(self):
+        """
+        A map from the path of each directory ('' for the root) to
+        a map of the names of its children to whether they are
+        directories.
+        """
+        if self._children is None:
+            children = {u'': {}}
+            for name in self.members:
+                parts = name.split('/')
+                for i in range(len(parts)):
+                    parent = u'/'.join(parts[:i])
+                    is_dir = i < len(parts) - 1
+                    children.setdefault(parent, {})[parts[i]] = is_dir
+            self._children = children
+        return self._children
+
+    def is_directory(self, path):
+        return path in self.children
+
+    def member(self, path):
+        return self.members.get(path)
+
+    def read(self, path):
+        """
+        Return the contents of the member at `path`, or None.
+        """
+        member = self.members.get(path)
+        if member is None:
+            return None
+        offset, size = member[:2]
+        if not size:
+            return b''
+        return bytes(self._read_range(self._data_offset + offset, size))
+
+
+def _filesystem_archive_unpickle(path):
+    return get_filesystem_archive(path)
+
+
+class FilesystemPackedArchive(PackedArchive):
+    """
+    An archive on disk, memory mapped. When the file is replaced, the
+    new one is mapped the next time it is read. Archives pickle as
+    their path and are shared (see :func:`get_filesystem_archive`).
+    """
+
+    # The map of the file, its members and the offset of their
+    # data, replaced together so that a reader never takes the
+    # offsets of one file to the map of another
+    _state = (None, {}, 0)
+
+    def __init__(self, path):
+        super(FilesystemPackedArchive, self).__init__(self._read_mapped)
+        self.path = path
+        self._stat = None
+        self._lock = threading.Lock()
+        self._check()
+
+    def __reduce__(self):
+        return _filesystem_archive_unpickle, (self.path,)
+
+    def __repr__(self):
+        return "<%s '%s'>" % (type(self).__name__, self.path)
+
+    def _check(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime, stat.st_size, stat.st_ino)
+        if stamp == self._stat:
+            return
+        with self._lock:
+            if stamp == self._stat:
+                return
+            with open(self.path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            members, data_offset = self._parse_index(
+                read_range=lambda start, size: mapped[start:start + size])
+            # The old map is not closed: readers may still hold it.
+            # It is unmapped once the last of them lets go of it.
+            self._state = (mapped, members, data_offset)
+            self.members, self._data_offset = members, data_offset
+            self._children = None
+            self.lastModified = stat.st_mtime
+            self.createdTime = stat.st_ctime
+            self._stat = stamp
+
+    def _read_mapped(self, start, size):
+        return self._state[0][start:start + size]
+
+    def read(self, path):
+        self._check()
+        mapped, members, data_offset = self._state
+        member = members.get(path)
+        if member is None:
+            return None
+        start = data_offset + member[0]
+        return mapped[start:start + member[1]]
+
+
+_filesystem_archives = repoze.lru.LRUCache(1000)
+
+try:
+    import zope.testing.cleanup
+except ImportError:  # pragma: no cover
+    pass
+else:
+    zope.testing.cleanup.addCleanUp(_filesystem_archives.clear)
+
+
+def get_filesystem_archive(path):
+    """
+    Return the shared :class:`FilesystemPackedArchive` for `path`.
+    """
+    path = os.path.abspath(path)
+    result = _filesystem_archives.get(path)
+    if result is None:
+        result = FilesystemPackedArchive(path)
+        _filesystem_archives.put(path, result)
+    return result
+
+
+@NoPickle
+class S3PackedArchive(PackedArchive):
+    """
+    An archive in S3, whose index and members are read with ranged
+    GET requests of the key.
+    """
+
+    def __init__(self, key):
+        super(S3PackedArchive, self).__init__(self._read_key_range)
+        self.key = key
+        from nti.contentlibrary.boto_s3 import key_last_modified
+        head = self._read_range(0, INDEX_PREFETCH_SIZE)
+        self._load_index(head)
+        self.lastModified = self.createdTime = key_last_modified(key)
+
+    def __repr__(self):
+        return "<%s '%s'>" % (type(self).__name__, self.key.name)
+
+    def _read_key_range(self, start, size):
+        headers = {'Range': 'bytes=%d-%d' % (start, start + size - 1)}
+        # A key of our own, since boto keys hold the response
+        key = self.key.bucket.new_key(self.key.name)
+        return key.get_contents_as_string(headers=headers)
+
+
+class _PackedItemMixin(object):
+
+    # The member path within the archive; '' for the root
+    path = u''
+
+    @property
+    def archive(self):
+        parent = self.__parent__
+        return parent.archive if parent is not None else None
+
+    def _child_path(self, name):
+        return name if not self.path else self.path + u'/' + name
+
+    modified = TimeProperty('lastModified', writable=False, cached=True)
+    created = TimeProperty('createdTime', writable=False, cached=True)
+
+
+@interface.implementer(IPackedKey)
+class PackedKey(_PackedItemMixin, AbstractKey):
+    """
+    A file within a packed archive.
+    """
+
+    def __init__(self, bucket=None, name=None):
+        super(PackedKey, self).__init__(bucket, name)
+        if bucket is not None and name is not None:
+            self.path = bucket._child_path(name)
+
+    def exists(self, *unused_args, **unused_kwargs):
+        return self.archive.member(self.path) is not None
+
+    def readContents(self):
+        return self.archive.read(self.path)
+    read_contents = readContents
+
+    def _member_time(self):
+        member = self.archive.member(self.path)
+        return member[2] if member is not None else -1
+
+    @property
+    def lastModified(self):
+        return self._member_time()
+
+    createdTime = lastModified
+
+
+@interface.implementer(IPackedBucket)
+class PackedBucket(_PackedItemMixin, AbstractBucket):
+    """
+    A directory within a packed archive. The root directory holds the
+    archive and is named for it, without the extension.
+    """
+
+    def __init__(self, bucket=None, name=None, archive=None):
+        super(PackedBucket, self).__init__(bucket, name)
+        if archive is not None:
+            self._archive = archive
+        elif bucket is not None and name is not None:
+            self.path = bucket._child_path(name)
+
+    @property
+    def archive(self):
+        archive = self.__dict__.get('_archive')
+        if archive is not None:
+            return archive
+        return super(PackedBucket, self).archive
+
+    @property
+    def lastModified(self):
+        return self.archive.lastModified
+
+    @property
+    def createdTime(self):
+        return self.archive.createdTime
+
+    def _child(self, name, is_dir):
+        cache = self.__dict__.setdefault('_v_children', {})
+        child = cache.get(name)
+        if child is None or isinstance(child, PackedBucket) != is_dir:
+            factory = PackedBucket if is_dir else PackedKey
+            child = cache[name] = factory(self, name)
+        return child
+
+    def enumerateChildren(self):
+        children = self.archive.children.get(self.path, {})
+        for name, is_dir in sorted(children.items()):
+            yield self._child(name, is_dir)
+    enumerate_children = enumerateChildren
+
+    def getChildNamed(self, name):
+        children = self.archive.children.get(self.path, {})
+        is_dir = children.get(name)
+        if is_dir is None:
+            return None
+        return self._child(name, is_dir)
+    get_child_named = getChildNamed
+
+
+def packed_bucket(archive, bucket=None, name=None):
+    """
+    Return the root :class:`PackedBucket` of `archive`, as the child
+    `name` of `bucket`.
+    """
+    return PackedBucket(bucket, name, archive=archive)
+
+
+@component.adapter(IPackedKey)
+@interface.implementer(IDelimitedHierarchyEntry)
+class _KeyDelimitedHierarchyEntry(object):
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def read_contents(self):
+        return self.key.readContents()
+    readContents = read_contents
+
+    def get_parent_key(self):
+        return self.key.bucket
+
+    def make_sibling_key(self, sibling_name):
+        assert bool(sibling_name)
+        assert not sibling_name.startswith('/')
+        parts = sibling_name.split('/')
+        parent = self.key.bucket
+        for part in parts[:-1]:
+            parent = PackedBucket(parent, part)
+        return PackedKey(parent, parts[-1])
+
+    def read_contents_of_sibling_entry(self, sibling_name):
+        return self.make_sibling_key(sibling_name).readContents()
+
+    def does_sibling_entry_exist(self, sibling_name):
+        sib_key = self.make_sibling_key(sibling_name)
+        archive = sib_key.archive
+        if      archive.member(sib_key.path) is None \
+            and not archive.is_directory(sib_key.path):
+            return None
+        return sib_key
+
+    def exists_many(self, sibling_names):
+        # The index of the archive is in memory
+        return {x: self.does_sibling_entry_exist(x) for x in sibling_names}
+
+
+@interface.implementer(IPackedContentUnit)
+class PackedContentUnit(ContentUnit):
+    """
+    A content unit whose key is in a packed archive.
+    """
+
+    key = None
+
+    @property
+    def lastModified(self):
+        return self.key.lastModified if self.key is not None else -1
+
+    @property
+    def createdTime(self):
+        return self.key.createdTime if self.key is not None else -1
+
+    modified = TimeProperty('lastModified', writable=False, cached=True)
+    created = TimeProperty('createdTime', writable=False, cached=True)
+
+    def read_contents(self):
+        return IDelimitedHierarchyEntry(self.key).read_contents()
+
+    def get_parent_key(self):
+        return IDelimitedHierarchyEntry(self.key).get_parent_key()
+
+    @cachedIn('_v_make_sibling_keys')
+    def make_sibling_key(self, sibling_name):
+        entry = IDelimitedHierarchyEntry(self.key)
+        return entry.make_sibling_key(sibling_name)
+
+    def read_contents_of_sibling_entry(self, sibling_name):
+        if self.key is not None:
+            entry = IDelimitedHierarchyEntry(self.key)
+            return entry.read_contents_of_sibling_entry(sibling_name)
+
+    def does_sibling_entry_exist(self, sibling_name):
+        entry = IDelimitedHierarchyEntry(self.key)
+        return entry.does_sibling_entry_exist(sibling_name)
+
+    def exists_many(self, sibling_names):
+        entry = IDelimitedHierarchyEntry(self.key)
+        return entry.exists_many(sibling_names)
+
+
+@interface.implementer(IPackedContentPackage)
+class PackedContentPackage(ContentPackage, PackedContentUnit):
+    """
+    A content package read from a packed archive.
+    """
+
+    TRANSIENT_EXCEPTIONS = (IOError,)
+
+    @property
+    def lastModified(self):
+        """
+        The most recent of the index and the archive modification
+        times; the archive changes whenever any file in the
+        package does.
+        """
+        archive = self.key.archive if self.key is not None else None
+        return max(self.index_last_modified,
+                   getattr(archive, 'lastModified', -1))
+
+
+@interface.implementer(IPersistentContentUnit)
+class PersistentPackedContentUnit(Persistent, PackedContentUnit):
+    pass
+
+
+@interface.implementer(IPersistentContentPackage)
+class PersistentPackedContentPackage(Persistent, PackedContentPackage):
+    pass
+
+
+def packed_package_factory(bucket, _package_factory=None, _unit_factory=None):
+    """
+    Given the root :class:`PackedBucket` of an archive, return its
+    package, or None if it has no TOC.
+    """
+    key = bucket.getChildNamed(eclipse.TOC_FILENAME)
+    if not IPackedKey.providedBy(key):
+        return None
+    _unit_factory = _unit_factory or PackedContentUnit
+    _package_factory = _package_factory or PackedContentPackage
+    temp_entry = PackedContentUnit(key=key)
+    return eclipse.EclipseContentPackage(temp_entry,
+                                         _package_factory,
+                                         _unit_factory)
+
+
+@interface.implementer(IEclipseContentPackageFactory)
+class _EclipseContentPackageFactory(object):
+
+    __slots__ = ()
+
+    def __init__(self, *args):
+        pass
+
+    def new_instance(self, item, package_factory=None, unit_factory=None):
+        return packed_package_factory(item, package_factory, unit_factory)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Pack content packages")
+    parser.add_argument('paths', nargs='+',
+                        help="The content package directories")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="Do not report what was done")
+    args = parser.parse_args(args)
+    for path in args.paths:
+        if not os.path.isdir(path):
+            parser.error("Not a directory: %s" % path)
+        target = pack_package(path)
+        if not args.quiet:
+            print('%s: %d bytes' % (target, os.path.getsize(target)),
+                  file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
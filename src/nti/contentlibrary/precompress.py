@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pre-compressed variants of rendered content.
+
+At publish time, :func:`precompress_package` writes a compressed
+sibling (``index.html.gz``, and ``index.html.br`` if :mod:`brotli`
+is available) next to each compressible file of a package, and a
+manifest of them at the root of the package. Key readers can then
+hand those bytes to clients that accept the encoding instead of
+compressing the content on every request; see
+:func:`read_contents_for_encoding`.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import argparse
+import tempfile
+import mimetypes
+
+import simplejson as json
+
+import repoze.lru
+
+from nti.contentlibrary.package_files import GZIP
+from nti.contentlibrary.package_files import BROTLI
+from nti.contentlibrary.package_files import GZIP_TYPES
+from nti.contentlibrary.package_files import READ_CHUNK_SIZE
+from nti.contentlibrary.package_files import ENCODING_EXTENSIONS
+
+from nti.contentlibrary.package_files import walk_files
+from nti.contentlibrary.package_files import write_gzipped
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+#: The name of the manifest written at the root of a package
+PRECOMPRESSED_MANIFEST = u'precompressed.json'
+
+#: Files smaller than this are not worth compressing
+MIN_SIZE = 256
+
+#: Variants that do not save at least this fraction of the
+#: size of their source are not kept
+MIN_SAVING = 0.1
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def available_encodings():
+    """
+    The encodings that can be produced here.
+    """
+    return (GZIP, BROTLI) if brotli is not None else (GZIP,)
+
+
+def _write_brotli(fullpath, fileobj):
+    compressor = brotli.Compressor()
+    with open(fullpath, 'rb') as f:
+        for data in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            fileobj.write(compressor.process(data))
+    fileobj.write(compressor.finish())
+
+
+_WRITERS = {
+    GZIP: write_gzipped,
+    BROTLI: _write_brotli,
+}
+
+
+# The manifests read, by path, with the stamp of the file
+_manifest_cache = repoze.lru.LRUCache(1000)
+
+
+def read_precompressed_manifest(path):
+    """
+    Return the manifest written by :func:`precompress_package` for the
+    package at `path`, or None if there is none.
+    """
+    filename = os.path.join(path, PRECOMPRESSED_MANIFEST)
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    stamp = (stat.st_mtime, stat.st_size)
+    cached = _manifest_cache.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        logger.exception("Failed to read manifest %s", filename)
+        return None
+    _manifest_cache.put(filename, (stamp, manifest))
+    return manifest
+
+
+def is_variant_current(entry, encoding, stat, variant_stat):
+    """
+    Whether the variant for `encoding` of a file is the one written for
+    its current contents, given the manifest `entry` of the file and
+    the ``os.stat`` results of the file and of the variant.
+    """
+    return  entry is not None \
+        and entry.get('size') == stat.st_size \
+        and entry.get('mtime') == int(stat.st_mtime) \
+        and entry.get(encoding) == variant_stat.st_size
+
+
+def _compress(fullpath, encoding, source_size, entry=None):
+    """
+    Write the variant of `fullpath` for `encoding`, returning its size,
+    or remove it and return None if it does not save enough. The
+    variant gets the modification time of its source. A variant the
+    previous manifest `entry` of the file shows to be current is kept.
+    """
+    variant = fullpath + ENCODING_EXTENSIONS[encoding]
+    stat = os.stat(fullpath)
+    try:
+        vstat = os.stat(variant)
+    except OSError:
+        pass
+    else:
+        if is_variant_current(entry, encoding, stat, vstat):
+            return vstat.st_size  # up to date
+
+    dirname, basename = os.path.split(fullpath)
+    fd, tmp = tempfile.mkstemp(prefix='.' + basename, dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            _WRITERS[encoding](fullpath, f)
+            size = f.tell()
+        if size > source_size * (1 - MIN_SAVING):
+            os.remove(tmp)
+            if os.path.exists(variant):
+                os.remove(variant)
+            return None
+        os.utime(tmp, (stat.st_atime, stat.st_mtime))
+        os.rename(tmp, variant)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return size
+
+
+def _is_compressible(fullpath, types):
+    if os.path.splitext(fullpath)[1] in ENCODING_EXTENSIONS.values():
+        return False
+    mt = mimetypes.guess_type(fullpath)[0]
+    return mt in types
+
+
+def precompress_package(path, encodings=(GZIP,), types=GZIP_TYPES,
+                        min_size=MIN_SIZE):
+    """
+    Write the compressed variants of the files of the package at `path`
+    whose type is in `types`, and the manifest describing them. Variants
+    that are up to date with their source are kept as they are.
+
+    :return: The manifest, a dictionary with the ``encodings`` and, in
+        ``files``, a map from the path of each file relative to the
+        package to its ``size``, ``mtime`` and the size of each of its
+        variants, by encoding.
+    """
+    encodings = [x for x in encodings if x in available_encodings()]
+    previous = (read_precompressed_manifest(path) or {}).get('files', {})
+    files = {}
+    for fullpath in walk_files(path):
+        if not _is_compressible(fullpath, types):
+            continue
+        stat = os.stat(fullpath)
+        if stat.st_size < min_size:
+            continue
+        name = os.path.relpath(fullpath, path).replace(os.sep, '/')
+        entry = {}
+        for encoding in encodings:
+            size = _compress(fullpath, encoding, stat.st_size,
+                             previous.get(name))
+            if size is not None:
+                entry[encoding] = size
+        if entry:
+            entry['size'] = stat.st_size
+            entry['mtime'] = int(stat.st_mtime)
+            files[name] = entry
+
+    manifest = {'encodings': encodings, 'files': files}
+    tmp = os.path.join(path, PRECOMPRESSED_MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.rename(tmp, os.path.join(path, PRECOMPRESSED_MANIFEST))
+    return manifest
+
+
+def read_compressed_contents(key, encoding=GZIP):
+    """
+    Return the contents of `key` compressed with `encoding`, if they
+    are stored that way, or None.
+    """
+    reader = getattr(key, 'readCompressedContents', None)
+    return reader(encoding) if reader is not None else None
+
+
+def _accepted(accept_encoding):
+    result = []
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        if name and q > 0:
+            result.append((q, name.strip().lower()))
+    result.sort(key=lambda x: -x[0])
+    return [name for _, name in result]
+
+
+def read_contents_for_encoding(key, accept_encoding=None):
+    """
+    Return the contents of `key` and their content encoding (None for
+    identity), using a stored compressed variant that the client
+    accepts according to the `accept_encoding` header value.
+    """
+    for encoding in _accepted(accept_encoding):
+        if encoding in ENCODING_EXTENSIONS:
+            data = read_compressed_contents(key, encoding)
+            if data is not None:
+                return data, encoding
+    return key.readContents(), None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Pre-compress content packages")
+    parser.add_argument('paths', nargs='+',
+                        help="The content package directories")
+    parser.add_argument('-b', '--brotli', action='store_true',
+                        help="Also write brotli variants")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="Do not report what was done")
+    args = parser.parse_args(args)
+
+    encodings = (GZIP, BROTLI) if args.brotli else (GZIP,)
+    if args.brotli and brotli is None:
+        print("brotli is not installed; writing gzip variants only",
+              file=sys.stderr)
+    for path in args.paths:
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isdir(path):
+            parser.error("Not a directory: %s" % path)
+        manifest = precompress_package(path, encodings)
+        if not args.quiet:
+            print('%s: %d files compressed' % (path, len(manifest['files'])))
+
+
+if __name__ == "__main__":
+    main()
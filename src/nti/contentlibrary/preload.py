@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Preloading the global library before a server forks its workers.
+
+A forking server whose workers each sync the global library on first
+use shares none of it between them. Calling :func:`preload_library`
+in the master process, after the configuration is loaded and before
+the fork, syncs and warms the library once so the workers inherit it
+copy-on-write. The structures are then frozen with :func:`gc.freeze`
+(Python 3.7 and later), so that garbage collections in the workers do
+not write to, and therefore copy, the pages holding them.
+
+As the :mod:`gc` documentation advises, the garbage collector is
+disabled while preloading and left disabled, so that objects freed
+before the fork do not leave holes in the pages the workers share.
+Each worker calls :func:`after_fork` (from the post-fork hook of the
+server) to enable it again.
+
+:func:`memory_report` (and the ``nti_library_memory`` script) tell how
+much of the memory of each worker is actually shared.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import gc
+import os
+import argparse
+
+from persistent import Persistent
+
+from zope import component
+
+from nti.contentlibrary.contentunit import content_unit_table
+
+from nti.contentlibrary.interfaces import IContentPackageLibrary
+
+# The fields of /proc/<pid>/smaps(_rollup) we report, in kB
+_SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared',
+    'Shared_Dirty': 'shared',
+    'Private_Clean': 'private',
+    'Private_Dirty': 'private',
+}
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def warm_package(package):
+    """
+    Compute what is otherwise computed lazily on first use of `package`
+    and kept, and compact its unit table.
+
+    The unit table is only kept for packages that are not persistent,
+    such as those of the global library: persistent packages can be
+    edited in place without their stamp changing.
+    """
+    if not isinstance(package, Persistent):
+        # Global packages do not change in place, so the table is kept
+        # even where it was built afresh
+        table = content_unit_table(package)
+        package._v_unit_table = table.compact()  # pylint: disable=protected-access
+    for name in ('_v_references', 'PlatformPresentationResources'):
+        try:
+            getattr(package, name, None)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to warm %s of %s", name, package)
+
+
+def preload_library(library=None, freeze=True):
+    """
+    Sync `library`, by default the global :class:`.IContentPackageLibrary`,
+    if it never was, warm its packages and, if `freeze` is true and this
+    Python supports it, move everything allocated so far out of the reach
+    of the garbage collector.
+
+    When freezing, the garbage collector is disabled and stays so until
+    :func:`after_fork` is called; a process that does not fork workers
+    should not freeze.
+
+    :return: The library, or None if there is none.
+    """
+    if library is None:
+        gsm = component.getGlobalSiteManager()
+        library = gsm.queryUtility(IContentPackageLibrary)
+    if library is None:
+        logger.warning("No global library to preload")
+        return None
+
+    gc_freeze = getattr(gc, 'freeze', None)
+    freeze = freeze and gc_freeze is not None
+    if freeze:
+        gc.disable()
+
+    if getattr(library, '_contentPackages', None) is None:
+        library.syncContentPackages()
+    packages = library.contentPackages
+    for package in packages:
+        warm_package(package)
+    # Build the merged maps, if any
+    getattr(library, 'contentUnitsByNTIID', None)
+
+    # Garbage is freed rather than frozen
+    gc.collect()
+    if freeze:
+        gc_freeze()
+        logger.info("Preloaded %d packages of %s; froze %d objects",
+                    len(packages), library, gc.get_freeze_count())
+    else:
+        logger.info("Preloaded %d packages of %s", len(packages), library)
+    return library
+
+
+def after_fork():
+    """
+    Enable the garbage collector that :func:`preload_library` disabled.
+    Call this in each worker, once forked.
+    """
+    gc.enable()
+
+
+def memory_report(pid=None):
+    """
+    Return the resident, proportional, shared and private memory of
+    the process `pid` (by default, this one), in bytes, from its
+    ``/proc/<pid>/smaps_rollup`` (or ``smaps``). Only Linux is
+    supported.
+    """
+    pid = os.getpid() if pid is None else pid
+    result = dict.fromkeys(('rss', 'pss', 'shared', 'private'), 0)
+    for name in ('smaps_rollup', 'smaps'):
+        path = '/proc/%s/%s' % (pid, name)
+        if os.path.exists(path):
+            break
+    with open(path) as f:
+        for line in f:
+            field, _, value = line.partition(':')
+            key = _SMAPS_FIELDS.get(field)
+            if key is not None:
+                result[key] += int(value.split()[0]) * 1024
+    return result
+
+
+def _children(pid):
+    path = '/proc/%s/task/%s/children' % (pid, pid)
+    with open(path) as f:
+        return [int(x) for x in f.read().split()]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Report the shared and private memory of processes")
+    parser.add_argument('pids', nargs='+', type=int,
+                        help="The process ids")
+    parser.add_argument('-c', '--children', action='store_true',
+                        help="Report the children of the processes instead,"
+                             " such as the workers of a server")
+    args = parser.parse_args(args)
+
+    pids = args.pids
+    if args.children:
+        pids = [child for pid in pids for child in _children(pid)]
+    print('%8s %10s %10s %10s %10s' % ('PID', 'RSS MB', 'PSS MB',
+                                       'SHARED MB', 'PRIVATE MB'))
+    for pid in pids:
+        report = memory_report(pid)
+        print('%8d %10.1f %10.1f %10.1f %10.1f' %
+              (pid,
+               report['rss'] / 1048576,
+               report['pss'] / 1048576,
+               report['shared'] / 1048576,
+               report['private'] / 1048576))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Snapshots of the content packages of a global library.
+
+Every process synchronizes its global library on startup, enumerating
+and parsing every content package. A library can instead write its
+packages, with their unit trees, to a snapshot file after it
+synchronizes (:func:`write_library_snapshot`), and the next process
+can load them from there (:func:`read_library_snapshot`) as long as
+the enumeration and the packages have not been modified since.
+
+The library, its enumeration and the root bucket of the enumeration
+are not part of the snapshot; references to them are resolved to
+those of the library loading it.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import tempfile
+
+from six.moves import cPickle as pickle
+
+#: The version of the snapshot format
+LIBRARY_SNAPSHOT_VERSION = 2
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def _external_objects(library):
+    enumeration = library.enumeration
+    return {
+        'library': library,
+        'enumeration': enumeration,
+        'root': getattr(enumeration, 'root', None),
+    }
+
+
+def _header(library):
+    enumeration = library.enumeration
+    return {
+        'version': LIBRARY_SNAPSHOT_VERSION,
+        'python': sys.version_info[0],
+        'root': getattr(enumeration, 'absolute_path', None),
+        'lastModified': getattr(enumeration, 'lastModified', None),
+    }
+
+
+def _package_stamp(package):
+    """
+    The modification times of the TOC and the root of `package`, as
+    they are now.
+    """
+    return (getattr(package.index, 'lastModified', None),
+            getattr(package.root, 'lastModified', None))
+
+
+def _package_stamps(packages):
+    return {x.ntiid: _package_stamp(x) for x in packages}
+
+
+def write_library_snapshot(library, path):
+    """
+    Write the content packages of `library` to the file at `path`,
+    replacing it atomically.
+
+    :return: A true value if the snapshot was written.
+    """
+    external = {id(v): k for k, v in _external_objects(library).items()
+                if v is not None}
+
+    def persistent_id(obj):
+        return external.get(id(obj))
+
+    packages = list(library._contentPackages.values())
+    stamps = _package_stamps(packages)
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path),
+                                   dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(_header(library), f, pickle.HIGHEST_PROTOCOL)
+            # Before the packages, so they can be checked alone
+            pickle.dump(stamps, f, pickle.HIGHEST_PROTOCOL)
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = persistent_id
+            pickler.dump(packages)
+        os.rename(tmp, path)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Failed to write library snapshot %s", path)
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    logger.info("Wrote snapshot of %d packages of %s to %s",
+                len(packages), library, path)
+    return True
+
+
+def read_library_snapshot(library, path):
+    """
+    Return the content packages in the snapshot at `path`, if it was
+    written for the enumeration of `library` and nothing has been
+    modified since, otherwise None.
+    """
+    external = _external_objects(library)
+    try:
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+            if header != _header(library):
+                logger.info("Library snapshot %s is out of date", path)
+                return None
+            stamps = pickle.load(f)
+            unpickler = pickle.Unpickler(f)
+            unpickler.persistent_load = external.__getitem__
+            packages = unpickler.load()
+    except (IOError, OSError):
+        return None
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Failed to read library snapshot %s", path)
+        return None
+
+    for package in packages:
+        if _package_stamp(package) != stamps.get(package.ntiid):
+            logger.info("Library snapshot %s is out of date for %s",
+                        path, package)
+            return None
+    logger.info("Read snapshot of %d packages of %s from %s",
+                len(packages), library, path)
+    return packages
+
+
+def is_library_snapshot_current(library, path):
+    """
+    Whether the snapshot at `path` holds the content packages
+    `library` has now, as they are now. Only the header and the
+    stamps of the snapshot are read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) != _header(library):
+                return False
+            stamps = pickle.load(f)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    packages = (library._contentPackages or {}).values()
+    return stamps == _package_stamps(packages)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_length
+from hamcrest import assert_that
+
+import os
+import unittest
+
+from zope import interface
+
+from nti.contentlibrary import filesystem
+
+from nti.contentlibrary.aio import asyncio
+from nti.contentlibrary.aio import async_entry
+
+from nti.contentlibrary.interfaces import IS3Key
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+PAGE = u'tag_nextthought_com_2011-10_USSC-HTML-Cohen_18.html'
+
+
+@unittest.skipIf(asyncio is None, "asyncio is not available")
+class TestAsyncHierarchyEntry(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestAsyncHierarchyEntry, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        bucket = filesystem.FilesystemBucket(name=u'TestFilesystem')
+        bucket.absolute_path = os.path.join(os.path.dirname(__file__),
+                                            'TestFilesystem')
+        self.key = filesystem.FilesystemKey(bucket=bucket, name=PAGE)
+        self.entry = async_entry(self.key, loop=self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        super(TestAsyncHierarchyEntry, self).tearDown()
+
+    def _run(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def _read_all(self, iterator):
+        chunks = []
+        while True:
+            try:
+                chunks.append(self._run(iterator.__anext__()))
+            except StopAsyncIteration:  # pylint: disable=undefined-variable
+                return chunks
+
+    def test_reads(self):
+        contents = self.key.readContents()
+        assert_that(self._run(self.entry.read_contents()), is_(contents))
+        assert_that(self._run(self.entry.read_contents_of_sibling_entry(u'eclipse-toc.xml')),
+                    is_(self.key.bucket.getChildNamed(u'eclipse-toc.xml').readContents()))
+        assert_that(self._run(self.entry.does_sibling_entry_exist(u'index.html')),
+                    is_not(none()))
+        assert_that(self._run(self.entry.does_sibling_entry_exist(u'missing.html')),
+                    is_(none()))
+
+        results = self._run(self.entry.read_contents_of_sibling_entries([PAGE] * 20))
+        assert_that(results, has_length(20))
+        assert_that(set(results), is_({contents}))
+
+    def test_running_loop(self):
+        entry = async_entry(self.key)
+        started = []
+        # Without a loop of its own, the entry is used in the running one
+        self.loop.call_soon(lambda: started.append(entry.read_contents()))
+        self._run(asyncio.sleep(0))
+        assert_that(self._run(started[0]), is_(self.key.readContents()))
+
+    def test_s3_key(self):
+        reads = []
+
+        @interface.implementer(IS3Key)
+        class Key(object):
+            content_encoding = None
+
+            def __init__(self, bucket, name):
+                self.bucket = bucket
+                self.name = name
+
+            def get_contents_as_string(self):
+                reads.append(self)
+                return b'contents of ' + self.name.encode('ascii')
+
+        class Bucket(object):
+
+            def new_key(self, name):
+                return Key(self, name)
+            get_key = new_key
+
+        key = Key(Bucket(), u'a/b.html')
+        entry = async_entry(key, loop=self.loop)
+        results = self._run(asyncio.gather(entry.read_contents(),
+                                           entry.read_contents(),
+                                           entry.read_contents_of_sibling_entry(u'c.html')))
+        assert_that(results, is_([b'contents of a/b.html',
+                                  b'contents of a/b.html',
+                                  b'contents of a/c.html']))
+        # Each read has a key of its own
+        assert_that(set(map(id, reads)), has_length(3))
+        assert_that(key in reads, is_(False))
+
+    def test_persistent_unit(self):
+        from concurrent.futures import ThreadPoolExecutor
+        submitted = []
+
+        class Executor(ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                submitted.append(fn)
+                return super(Executor, self).submit(fn, *args, **kwargs)
+
+        unit = filesystem.PersistentFilesystemContentUnit()
+        unit.key = self.key
+        executor = Executor(2)
+        try:
+            entry = async_entry(unit, executor=executor, loop=self.loop)
+            # The unit is only asked for its key; the file is read
+            # in the pool
+            assert_that(self._run(entry.read_contents()),
+                        is_(self.key.readContents()))
+            assert_that(self._run(entry.does_sibling_entry_exist(u'index.html')),
+                        is_not(none()))
+            assert_that(submitted, has_length(2))
+        finally:
+            executor.shutdown()
+
+    def test_iter_contents(self):
+        contents = self.key.readContents()
+        chunks = self._read_all(self.entry.iter_contents(chunk_size=1024))
+        assert_that(len(chunks), is_((len(contents) + 1023) // 1024))
+        assert_that(b''.join(chunks), is_(contents))
+
+        chunks = self._read_all(self.entry.iter_contents_of_sibling_entry(u'eclipse-toc.xml'))
+        assert_that(b''.join(chunks),
+                    is_(self.key.bucket.getChildNamed(u'eclipse-toc.xml').readContents()))
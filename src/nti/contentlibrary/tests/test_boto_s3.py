@@ -95,8 +95,10 @@ class TestBotoS3(ContentlibraryLayerTest):
     def test_does_exist_cached(self):
         @interface.implementer(interfaces.IS3Bucket)
         class Bucket(object):
+            lookups = 0
 
             def get_key(self, unused_k):
+                self.lookups += 1
                 return object()
 
         @interface.implementer(interfaces.IS3Key)
@@ -125,6 +127,11 @@ class TestBotoS3(ContentlibraryLayerTest):
 
         assert_that(unit.does_sibling_entry_exist('bar'),
                     is_not(same_instance(unit.does_sibling_entry_exist('baz'))))
+        # Answered from the existence cache
+        assert_that(key.bucket.lookups, is_(2))
+        assert_that(BotoS3ContentUnit(key=key).does_sibling_entry_exist('baz'),
+                    is_(same_instance(unit.does_sibling_entry_exist('baz'))))
+        assert_that(key.bucket.lookups, is_(2))
 
     def test_response_exception(self):
         @interface.implementer(interfaces.IS3Bucket)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import not_none
+from hamcrest import has_entries
+from hamcrest import assert_that
+from hamcrest import same_instance
+
+import os
+import time
+import shutil
+import tempfile
+
+from zope import interface
+
+from nti.contentlibrary import existence
+from nti.contentlibrary import filesystem
+from nti.contentlibrary import interfaces
+
+from nti.contentlibrary.boto_s3 import BotoS3ContentUnit
+
+from nti.contentlibrary.existence import exists_many
+from nti.contentlibrary.existence import existence_cache
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+
+class TestFilesystemExistence(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestFilesystemExistence, self).setUp()
+        existence_cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, 'index.html'), 'w') as f:
+            f.write('<html/>')
+        os.mkdir(os.path.join(self.tmpdir, 'images'))
+        bucket = filesystem.FilesystemBucket(name=u'Existence')
+        bucket.absolute_path = self.tmpdir
+        key = filesystem.FilesystemKey(bucket=bucket, name=u'index.html')
+        self.unit = filesystem.FilesystemContentUnit(key=key)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        existence_cache.clear()
+        super(TestFilesystemExistence, self).tearDown()
+
+    def test_negative_cached(self):
+        unit = self.unit
+        assert_that(unit.does_sibling_entry_exist(u'index.html'), is_(not_none()))
+        assert_that(unit.does_sibling_entry_exist(u'images'), is_(not_none()))
+        assert_that(unit.does_sibling_entry_exist(u'missing.html'), is_(none()))
+
+        # Once listed, the directory is not asked again while its
+        # modification time is unchanged
+        listdir = os.listdir
+        calls = []
+        os.listdir = lambda path: calls.append(path) or listdir(path)
+        try:
+            assert_that(unit.does_sibling_entry_exist(u'missing.html'), is_(none()))
+            assert_that(unit.does_sibling_entry_exist(u'other.html'), is_(none()))
+        finally:
+            os.listdir = listdir
+        assert_that(calls, is_([]))
+
+    def test_revalidated(self):
+        unit = self.unit
+        assert_that(unit.does_sibling_entry_exist(u'new.html'), is_(none()))
+
+        path = os.path.join(self.tmpdir, 'new.html')
+        with open(path, 'w') as f:
+            f.write('<html/>')
+        later = time.time() + 10
+        os.utime(self.tmpdir, (later, later))
+
+        # Not seen until the listing is checked again
+        revalidate = existence.FILESYSTEM_REVALIDATE
+        existence.FILESYSTEM_REVALIDATE = -1
+        try:
+            assert_that(unit.does_sibling_entry_exist(u'new.html'), is_(not_none()))
+        finally:
+            existence.FILESYSTEM_REVALIDATE = revalidate
+
+    def test_exists_many(self):
+        result = exists_many(self.unit, (u'index.html', u'missing.html',
+                                         u'images/missing.png'))
+        assert_that(result, has_entries(u'index.html', not_none(),
+                                        u'missing.html', none(),
+                                        u'images/missing.png', none()))
+
+
+@interface.implementer(interfaces.IS3Bucket)
+class Bucket(object):
+
+    name = u'content.nextthought.com'
+
+    def __init__(self, names):
+        self.names = names
+        self.gets = []
+        self.lists = []
+
+    def get_key(self, name):
+        self.gets.append(name)
+        return Key(self, name) if name in self.names else None
+
+    def list(self, prefix='', delimiter=''):
+        self.lists.append(prefix)
+        for name in self.names:
+            if name.startswith(prefix):
+                rest = name[len(prefix):]
+                if delimiter in rest:
+                    rest = rest.split(delimiter)[0] + delimiter
+                yield Key(self, prefix + rest)
+
+
+@interface.implementer(interfaces.IS3Key)
+class Key(object):
+
+    last_modified = None
+
+    def __init__(self, bucket=None, name=None):
+        self.bucket = bucket
+        self.name = name
+
+
+class TestS3Existence(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestS3Existence, self).setUp()
+        existence_cache.clear()
+        self.bucket = Bucket([u'foo/index.html', u'foo/eclipse-toc.xml',
+                              u'foo/images/a.png'])
+        self.entry = interfaces.IDelimitedHierarchyEntry(Key(self.bucket,
+                                                             u'foo/index.html'))
+
+    def tearDown(self):
+        existence_cache.clear()
+        super(TestS3Existence, self).tearDown()
+
+    def test_negative_cached(self):
+        entry = self.entry
+        assert_that(entry.does_sibling_entry_exist(u'missing.html'), is_(none()))
+        assert_that(entry.does_sibling_entry_exist(u'missing.html'), is_(none()))
+        assert_that(entry.does_sibling_entry_exist(u'index.html'),
+                    is_(same_instance(entry.does_sibling_entry_exist(u'index.html'))))
+        assert_that(self.bucket.gets, is_([u'foo/missing.html',
+                                           u'foo/index.html']))
+        assert_that(self.bucket.lists, is_([]))
+
+    def test_exists_many(self):
+        names = (u'index.html', u'eclipse-toc.xml', u'missing.html',
+                 u'images', u'images/a.png', u'images/b.png')
+        unit = BotoS3ContentUnit(key=self.entry.key)
+        result = exists_many(unit, names)
+        assert_that(result, has_entries(u'index.html', not_none(),
+                                        u'eclipse-toc.xml', not_none(),
+                                        u'missing.html', none(),
+                                        u'images', none(),
+                                        u'images/a.png', not_none(),
+                                        u'images/b.png', none()))
+        # Answered by listing each prefix once
+        assert_that(self.bucket.gets, is_([]))
+        assert_that(sorted(self.bucket.lists), is_([u'foo/', u'foo/images/']))
+
+        assert_that(self.entry.does_sibling_entry_exist(u'other.html'), is_(none()))
+        assert_that(self.bucket.gets, is_([]))
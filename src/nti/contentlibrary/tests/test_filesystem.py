@@ -29,7 +29,9 @@ from nti.testing.matchers import verifiably_provides
 
 import six
 import pickle
+import shutil
 import os.path
+import tempfile
 
 import simplejson as json
 
@@ -39,6 +41,10 @@ from zope.dublincore.interfaces import IWriteZopeDublinCore
 
 from nti.contentlibrary import filesystem
 from nti.contentlibrary import interfaces
+from nti.contentlibrary import library as library_module
+
+from nti.contentlibrary.contentunit import ContentUnitTable
+from nti.contentlibrary.contentunit import content_unit_table
 
 from nti.contentlibrary.interfaces import IEclipseContentPackageFactory
 
@@ -203,6 +209,29 @@ class TestFilesystem(ContentlibraryLayerTest):
                     has_property('href',
                                  '/SomePrefix/TestFilesystem/tag_nextthought_com_2011-10_USSC-HTML-Cohen_18.html#22'))
 
+    def test_unit_table(self):
+        library = filesystem.EnumerateOnceFilesystemLibrary(os.path.dirname(__file__))
+        library.syncContentPackages()
+        package = library[0]
+
+        # built along with the package and shared afterwards
+        table = content_unit_table(package)
+        assert_that(table, is_(same_instance(package._v_unit_table)))
+        assert_that(table.units[0], is_(same_instance(package)))
+        assert_that(table.parents[0], is_(none()))
+
+        fresh = ContentUnitTable(package)
+        assert_that(fresh.units, is_(table.units))
+        assert_that(fresh.parents, is_(table.parents))
+        for unit, parent in zip(table.units[1:], table.parents[1:]):
+            assert_that(unit.__parent__, is_(same_instance(table.units[parent])))
+
+        ntiid = 'tag:nextthought.com,2011-10:testing-NTICard-temp.nticard.1'
+        assert_that(table.units[table.embedded[ntiid][0]],
+                    has_property('ntiid',
+                                 'tag:nextthought.com,2011-10:USSC-HTML-Cohen.28'))
+        assert_that(package[package.ntiid], is_(same_instance(package)))
+
     def test_path_to_ntiid(self):
         library = filesystem.EnumerateOnceFilesystemLibrary(os.path.dirname(__file__))
         library.syncContentPackages()
@@ -241,6 +270,45 @@ class TestFilesystem(ContentlibraryLayerTest):
         # doesn't have access to its parent contents yet.
         assert_that(site_lib, has_property('contentPackages', is_empty()))
 
+    def test_sync_keeps_touched_package(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'TestFilesystem')
+            shutil.copytree(os.path.join(os.path.dirname(__file__), 'TestFilesystem'),
+                            path)
+            library = filesystem.GlobalFilesystemContentPackageLibrary(tmpdir)
+            library.use_content_fingerprints = True
+            library.syncContentPackages()
+            package = library[0]
+            assert_that(package.contentFingerprint, is_not(none()))
+
+            # Newer, but with the same content
+            toc = os.path.join(path, 'eclipse-toc.xml')
+            later = package.lastModified + 10
+            os.utime(toc, (later, later))
+
+            fingerprinted = []
+            def fingerprint(package):
+                fingerprinted.append(package)
+                return original(package)
+            original = library_module.content_package_fingerprint
+            library_module.content_package_fingerprint = fingerprint
+            try:
+                library.syncContentPackages()
+                assert_that(library[0], is_(same_instance(package)))
+                assert_that(fingerprinted, has_length(1))
+                assert_that(package.fingerprintLastModified,
+                            is_(greater_than_or_equal_to(later)))
+
+                # Not compared again until the files change again
+                library.syncContentPackages()
+                assert_that(library[0], is_(same_instance(package)))
+                assert_that(fingerprinted, has_length(1))
+            finally:
+                library_module.content_package_fingerprint = original
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_state(self):
         unit = filesystem.FilesystemContentUnit()
         unit._v_foo = 1
@@ -64,7 +64,17 @@ class TestIndex(ContentlibraryLayerTest):
         package.description = u'Cohen vs California'
         package.publishLastModified = 10000
         package.index_last_modified = 80000
+        generation = catalog.generation
         catalog.index_doc(1, package)
+        assert_that(catalog.generation, is_(generation + 1))
+
+        # Updating indexes changes it too
+        catalog._visitSublocations = lambda: iter(((2, package),))
+        catalog.updateIndex(catalog['ntiid'])
+        assert_that(catalog.generation, is_(generation + 2))
+        catalog.updateIndexes()
+        assert_that(catalog.generation, is_(generation + 3))
+        del catalog._visitSublocations
 
         for query in (
                 {'ntiid': {'any_of': (ntiid,)}},
@@ -76,7 +86,7 @@ class TestIndex(ContentlibraryLayerTest):
     def test_bundle_catalog(self):
         catalog = create_contentbundle_catalog()
         assert_that(catalog, is_not(none()))
-        assert_that(catalog, has_length(7))
+        assert_that(catalog, has_length(9))
         assert_that(isinstance(catalog, ContentBundleCatalog), is_(True))
 
         pkg_ntiid = u'tag:nextthought.com,2011-10:USSC-HTML-Cohen.cohen_v._california.'
@@ -89,6 +99,7 @@ class TestIndex(ContentlibraryLayerTest):
         bundle.creator = u'ichigo'
         bundle.title = u'Janux FAQ'
         bundle.ContentPackages = (package,)
+        bundle.createdTime = bundle.lastModified = 10000
         catalog.index_doc(1, bundle)
 
         for query in (
@@ -96,6 +107,8 @@ class TestIndex(ContentlibraryLayerTest):
                 {'creator': {'any_of': ('ichigo',)}},
                 {'title': {'any_of': ('Janux FAQ',)}},
                 {'packages': {'any_of': (pkg_ntiid,)}},
+                {'createdTime': {'between': (9999, 10001)}},
+                {'lastModified': {'between': (9999, 10001)}},
                 {'restrictedAccess': {'any_of': (False,)}},
                 {'mimeType': {'any_of': ('application/vnd.nextthought.contentpackagebundle',)}}):
             results = catalog.apply(query) or ()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import same_instance
+from hamcrest import contains_inanyorder
+
+import os
+
+from zope import component
+
+from zope.component import eventtesting
+
+from zope.intid.interfaces import IIntIds
+
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+
+from nti.contentlibrary import library
+from nti.contentlibrary import filesystem
+
+from nti.contentlibrary.interfaces import IContentPackageReplacedEvent
+
+from nti.contentlibrary.library import replace_content_units
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+from nti.contentlibrary.zodb import PersistentContentUnit
+from nti.contentlibrary.zodb import PersistentContentPackage
+
+PREFIX = u'tag:nextthought.com,2011-10:NTI-HTML-Replaced.'
+
+
+class _IntIds(object):
+
+    attribute = '_ds_intid'
+
+    def __init__(self):
+        self.refs = {}
+
+    def register(self, ob):
+        uid = len(self.refs) + 1
+        self.refs[uid] = ob
+        setattr(ob, self.attribute, uid)
+        return uid
+
+    def queryId(self, ob, default=None):
+        uid = getattr(ob, self.attribute, None)
+        return uid if uid is not None and self.refs.get(uid) is ob else default
+
+    def getId(self, ob):
+        result = self.queryId(ob)
+        if result is None:
+            raise KeyError(ob)
+        return result
+
+    def force_register(self, uid, ob):
+        self.refs[uid] = ob
+
+    def force_unregister(self, uid, ob=None):
+        del self.refs[uid]
+        setattr(ob, self.attribute, None)
+
+
+def _tree(*names, **kwargs):
+    package = PersistentContentPackage()
+    package.ntiid = PREFIX + u'package'
+    package.children = package.children_iterable_factory()
+    for name in names:
+        unit = PersistentContentUnit()
+        unit.ntiid = PREFIX + name
+        unit.title = kwargs.get(name, name)
+        unit.href = name + u'.html'
+        unit.lastModified = 1000
+        unit.__parent__ = package
+        unit.ordinal = len(package.children) + 1
+        package.children.append(unit)
+    package.lastModified = 1000
+    return package
+
+
+class TestReplaceContentUnits(ContentlibraryLayerTest):
+
+    def setUp(self):
+        self.intids = _IntIds()
+        self._add_intid = library.addIntId
+        library.addIntId = self.intids.register
+        component.getGlobalSiteManager().registerUtility(self.intids, IIntIds)
+
+    def tearDown(self):
+        component.getGlobalSiteManager().unregisterUtility(self.intids, IIntIds)
+        library.addIntId = self._add_intid
+
+    def _register(self, package):
+        for unit in [package] + list(package.children):
+            self.intids.register(unit)
+
+    def test_replace_content_units(self):
+        old = _tree(u'same', u'changed', u'vanished')
+        self._register(old)
+        same, changed, vanished = old.children
+        new = _tree(u'same', u'changed', u'added', changed=u'Changed')
+
+        eventtesting.clearEvents()
+        result = replace_content_units(None, new, old)
+        assert_that(result, is_([vanished]))
+
+        # Matched units take over the intids of the old ones
+        assert_that(self.intids.queryId(new), is_(1))
+        assert_that(self.intids.queryId(old), is_(none()))
+        assert_that(self.intids.queryId(new.children[0]), is_(2))
+        assert_that(self.intids.queryId(same), is_(none()))
+        assert_that(self.intids.queryId(new.children[1]), is_(3))
+        assert_that(self.intids.queryId(changed), is_(none()))
+        # New units get new ones; old units left over keep theirs
+        assert_that(self.intids.queryId(new.children[2]), is_(5))
+        assert_that(self.intids.queryId(vanished), is_(4))
+
+        # Only changed units are announced, so they are reindexed; the
+        # package changed as its children did
+        events = eventtesting.getEvents(IObjectModifiedEvent)
+        assert_that([x.object for x in events],
+                    contains_inanyorder(new, new.children[1]))
+
+    def test_replace_moved_units(self):
+        old = _tree(u'first', u'second', u'third', u'fourth')
+        self._register(old)
+        new = _tree(u'second', u'first', u'third', u'fourth')
+        third, fourth = new.children[2:]
+        third.href = u'other.html'
+        fourth.embeddedContainerNTIIDs = (PREFIX + u'embedded',)
+
+        eventtesting.clearEvents()
+        assert_that(replace_content_units(None, new, old), is_([]))
+        # Units that moved, point elsewhere or embed other containers
+        # changed, as did the package whose children were reordered
+        events = eventtesting.getEvents(IObjectModifiedEvent)
+        assert_that([x.object for x in events],
+                    contains_inanyorder(new, third, fourth, *new.children[:2]))
+
+    def test_replace_package(self):
+        old = _tree(u'same')
+        self._register(old)
+        new = _tree(u'same')
+        lib = filesystem.EnumerateOnceFilesystemLibrary(os.path.dirname(__file__))
+        lib._contentPackages = {old.ntiid: old}
+        lib._contentUnitsByNTIID = {}
+
+        seen = []
+
+        def _replaced(event):
+            seen.append((self.intids.queryId(event.original),
+                         self.intids.queryId(event.replacement)))
+        gsm = component.getGlobalSiteManager()
+        gsm.registerHandler(_replaced, (IContentPackageReplacedEvent,))
+        try:
+            lib.replace(new)
+        finally:
+            gsm.unregisterHandler(_replaced, (IContentPackageReplacedEvent,))
+        # The intids are handed over after the event
+        assert_that(seen, is_([(1, None)]))
+        assert_that(self.intids.queryId(new), is_(1))
+        assert_that(self.intids.queryId(old), is_(none()))
+
+    def test_replace_duplicate_ntiid(self):
+        old = _tree(u'dup', u'dup')
+        self._register(old)
+        first, second = old.children
+        new = _tree(u'dup')
+
+        result = replace_content_units(None, new, old)
+        # Only one old unit can hand over its intid
+        assert_that(result, has_length(1))
+        assert_that(result[0], is_(same_instance(second)))
+        assert_that(self.intids.queryId(second), is_(3))
+        assert_that(self.intids.queryId(first), is_(none()))
+        assert_that(self.intids.queryId(new.children[0]), is_(2))
+
+    def test_replace_without_force_register(self):
+        self.intids.force_register = None
+        old = _tree(u'same')
+        self._register(old)
+        new = _tree(u'same', u'added')
+
+        result = replace_content_units(None, new, old)
+        # Everything is registered anew; the old tree is left over
+        assert_that(result, is_((old,)))
+        assert_that(self.intids.queryId(new.children[1]), is_(3))
+        assert_that(self.intids.queryId(new.children[0]), is_(4))
+        assert_that(self.intids.queryId(new), is_(5))
+        assert_that(self.intids.queryId(old), is_(1))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import has_key
+from hamcrest import has_entry
+from hamcrest import has_length
+from hamcrest import assert_that
+
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+import unittest
+import threading
+
+from six import BytesIO
+
+from nti.contentlibrary import nti_s3put
+
+
+class _Upload(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.parts = {}
+
+    def upload_part_from_file(self, fp, part_num, size=None, **unused_kwargs):
+        self.parts[part_num] = fp.read(size)
+
+    def complete_upload(self):
+        parts = [self.parts[i] for i in sorted(self.parts)]
+        etag = hashlib.md5(b''.join(hashlib.md5(x).digest() for x in parts))
+        etag = '%s-%d' % (etag.hexdigest(), len(parts))
+        self.bucket.store(self.name, b''.join(parts), etag=etag)
+
+    def cancel_upload(self):
+        self.parts.clear()
+
+
+class _Key(object):
+
+    etag = None
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def size(self):
+        return len(self.bucket.keys[self.name][0])
+
+    def set_contents_from_string(self, data, headers=None, **unused_kwargs):
+        self.bucket.store(self.name, data, headers)
+
+    def set_contents_from_file(self, fp, headers=None, **unused_kwargs):
+        self.bucket.store(self.name, fp.read(), headers)
+
+    def set_contents_from_filename(self, filename, headers=None, **unused_kwargs):
+        with open(filename, 'rb') as f:
+            self.bucket.store(self.name, f.read(), headers)
+
+
+class _Bucket(object):
+    """
+    A local stand-in for a boto bucket, shared by all threads.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.etags = {}
+        self.multipart = set()
+        self.lock = threading.Lock()
+
+    def store(self, name, data, headers=None, etag=None):
+        with self.lock:
+            self.keys[name] = (data, dict(headers or {}))
+            self.etags[name] = etag or hashlib.md5(data).hexdigest()
+            if etag:
+                self.multipart.add(name)
+
+    def new_key(self, name):
+        return _Key(self, name)
+
+    def list(self, prefix=''):
+        for name in sorted(self.keys):
+            if name.startswith(prefix):
+                key = _Key(self, name)
+                key.etag = '"%s"' % self.etags[name]
+                yield key
+
+    def delete_keys(self, names):
+        for name in names:
+            self.keys.pop(name)
+            self.etags.pop(name)
+
+    def initiate_multipart_upload(self, name, **unused_kwargs):
+        return _Upload(self, name)
+
+
+class TestS3Put(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'book')
+        os.makedirs(os.path.join(self.source, 'images'))
+        for name, data in (('index.html', b'<html/>'),
+                           ('data.bin', b'x' * 1024),
+                           ('.DS_Store', b''),
+                           (os.path.join('images', 'a.png'), b'png')):
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(data)
+        self.prefix = self.tmpdir + os.sep
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _upload(self, bucket, **kwargs):
+        paths = nti_s3put.walk_files(self.source)
+        return nti_s3put.upload_files(lambda: bucket, paths, self.prefix,
+                                      quiet=True, **kwargs)
+
+    def test_upload_files(self):
+        bucket = _Bucket()
+        progress = self._upload(bucket, jobs=3)
+        assert_that(progress.files, is_(3))
+        assert_that(progress.failed, is_(0))
+        assert_that(bucket.keys, has_length(3))
+        assert_that(bucket.keys, has_key('book/images/a.png'))
+
+        data, headers = bucket.keys['book/index.html']
+        assert_that(headers, has_entry('Content-Encoding', 'gzip'))
+        assert_that(gzip.GzipFile(fileobj=BytesIO(data)).read(),
+                    is_(b'<html/>'))
+
+        progress = self._upload(_Bucket(),
+                                existing={'book/index.html'})
+        assert_that(progress.skipped, is_(1))
+        assert_that(progress.files, is_(2))
+
+    def test_skips_precompressed_variants(self):
+        for name in ('index.html.gz', 'index.html.br', 'archive.gz'):
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(b'z')
+        bucket = _Bucket()
+        progress = self._upload(bucket)
+        # Variants of other files are left out; other files are not
+        assert_that(progress.files, is_(4))
+        assert_that(bucket.keys, has_key('book/archive.gz'))
+        assert_that(bucket.keys, is_not(has_key('book/index.html.gz')))
+        assert_that(bucket.keys, is_not(has_key('book/index.html.br')))
+
+    def test_resume(self):
+        state_file = os.path.join(self.tmpdir, 'state')
+        state = nti_s3put.UploadState(state_file)
+        try:
+            self._upload(_Bucket(), state=state)
+        finally:
+            state.close()
+
+        # Nothing changed, nothing to do
+        bucket = _Bucket()
+        state = nti_s3put.UploadState(state_file)
+        try:
+            progress = self._upload(bucket, state=state)
+        finally:
+            state.close()
+        assert_that(progress.skipped, is_(3))
+        assert_that(bucket.keys, has_length(0))
+
+        # A changed file is uploaded again
+        with open(os.path.join(self.source, 'data.bin'), 'ab') as f:
+            f.write(b'more')
+        state = nti_s3put.UploadState(state_file)
+        try:
+            progress = self._upload(bucket, state=state)
+        finally:
+            state.close()
+        assert_that(progress.files, is_(1))
+        assert_that(bucket.keys, has_key('book/data.bin'))
+
+    def test_multipart(self):
+        bucket = _Bucket()
+        fullpath = os.path.join(self.source, 'data.bin')
+        nti_s3put.s3_upload_file(bucket.new_key('data.bin'), fullpath,
+                                 multipart_threshold=512)
+        nti_s3put.s3_multipart_upload(bucket.new_key('chunked.bin'), fullpath,
+                                      chunk_size=100)
+        assert_that(bucket.multipart, is_({'data.bin', 'chunked.bin'}))
+        assert_that(bucket.keys['chunked.bin'][0], is_(b'x' * 1024))
+
+    def test_sync(self):
+        bucket = _Bucket()
+        kwargs = {'multipart_threshold': 512}
+        self._upload(bucket, **kwargs)
+        bucket.store('book/orphan.html', b'')
+        bucket.store('bookshelf/other.html', b'')
+
+        remote = nti_s3put.list_remote_keys(bucket, 'book/')
+        assert_that(remote, has_length(4))
+        paths = list(nti_s3put.walk_files(self.source))
+        unchanged = nti_s3put.unchanged_keys(paths, self.prefix, remote,
+                                             **kwargs)
+        # Including the gzipped and the multipart files
+        assert_that(unchanged, is_({'book/index.html',
+                                    'book/data.bin',
+                                    'book/images/a.png'}))
+
+        # Rendered again, only the edited file changed
+        for name, data in (('index.html', b'<html/>'), ('data.bin', b'y' * 1024)):
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(data)
+        unchanged = nti_s3put.unchanged_keys(paths, self.prefix, remote,
+                                             **kwargs)
+        assert_that(unchanged, is_({'book/index.html', 'book/images/a.png'}))
+
+        key_names = [nti_s3put.get_key_name(x, self.prefix) for x in paths]
+        deleted = nti_s3put.delete_orphans(bucket, key_names, remote,
+                                           quiet=True)
+        assert_that(deleted, is_(['book/orphan.html']))
+        assert_that(bucket.keys, has_key('bookshelf/other.html'))
+
+    def test_compressed_upload(self):
+        fullpath = os.path.join(self.source, 'big.html')
+        with open(fullpath, 'wb') as f:
+            for i in range(20000):
+                f.write(b'<p>%d</p>' % i)
+        with open(fullpath, 'rb') as f:
+            contents = f.read()
+
+        prepared = nti_s3put.prepare_upload(fullpath)
+        try:
+            assert_that(prepared.headers, has_entry('Content-Encoding', 'gzip'))
+            assert_that(prepared.size < len(contents), is_(True))
+        finally:
+            prepared.close()
+
+        # Spooled to disk and sent in parts, with the ETag we predicted
+        bucket = _Bucket()
+        kwargs = {'multipart_threshold': 2048, 'chunk_size': 1024}
+        orig_spool_size = nti_s3put.SPOOL_SIZE
+        nti_s3put.SPOOL_SIZE = 1024
+        try:
+            progress = self._upload(bucket, jobs=2, compress_jobs=1, **kwargs)
+        finally:
+            nti_s3put.SPOOL_SIZE = orig_spool_size
+        assert_that(progress.failed, is_(0))
+        assert_that(bucket.multipart, is_({'book/big.html'}))
+        data = bucket.keys['book/big.html'][0]
+        assert_that(gzip.GzipFile(fileobj=BytesIO(data)).read(), is_(contents))
+        etag, size = nti_s3put.s3_etag(fullpath, **kwargs)
+        assert_that(etag, is_(bucket.etags['book/big.html']))
+        assert_that(size, is_(len(data)))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_key
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_property
+from hamcrest import same_instance
+
+from nti.testing.matchers import validly_provides
+
+import os
+import pickle
+import shutil
+import tempfile
+
+from nti.contentlibrary import filesystem
+from nti.contentlibrary import interfaces
+
+from nti.contentlibrary.packed import PACKED_MAGIC
+from nti.contentlibrary.packed import PACKED_EXTENSION
+
+from nti.contentlibrary.packed import pack_package
+from nti.contentlibrary.packed import packed_bucket
+from nti.contentlibrary.packed import S3PackedArchive
+from nti.contentlibrary.packed import get_filesystem_archive
+from nti.contentlibrary.packed import packed_package_factory
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+SOURCE = os.path.join(os.path.dirname(__file__), 'TestFilesystem')
+
+
+class _S3Key(object):
+
+    last_modified = 1000
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def get_contents_as_string(self, headers=None):
+        start, end = headers['Range'][len('bytes='):].split('-')
+        self.bucket.reads.append(self)
+        return self.bucket.data[int(start):int(end) + 1]
+
+
+class _S3Bucket(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = []
+
+    def new_key(self, name):
+        return _S3Key(self, name)
+
+
+class TestPacked(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestPacked, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = pack_package(SOURCE,
+                                 os.path.join(self.tmpdir,
+                                              'TestFilesystem' + PACKED_EXTENSION))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(TestPacked, self).tearDown()
+
+    def test_archive(self):
+        archive = get_filesystem_archive(self.path)
+        assert_that(get_filesystem_archive(self.path),
+                    is_(same_instance(archive)))
+        assert_that(archive.members, has_key('eclipse-toc.xml'))
+        assert_that(archive.is_directory('presentation-assets/iPad'),
+                    is_(True))
+        with open(os.path.join(SOURCE, 'eclipse-toc.xml'), 'rb') as f:
+            assert_that(archive.read('eclipse-toc.xml'), is_(f.read()))
+        assert_that(archive.read('missing.html'), is_(none()))
+
+        # Shared again when unpickled
+        assert_that(pickle.loads(pickle.dumps(archive)),
+                    is_(same_instance(archive)))
+
+    def test_archive_replaced(self):
+        archive = get_filesystem_archive(self.path)
+        old_map = archive._state[0]
+
+        source = os.path.join(self.tmpdir, 'source')
+        os.makedirs(source)
+        with open(os.path.join(source, 'eclipse-toc.xml'), 'wb') as f:
+            f.write(b'<toc/>')
+        pack_package(source, self.path)
+        later = int(os.stat(self.path).st_mtime) + 10
+        os.utime(self.path, (later, later))
+
+        assert_that(archive.read('eclipse-toc.xml'), is_(b'<toc/>'))
+        assert_that(archive.members, has_length(1))
+        assert_that(archive.lastModified, is_(later))
+        # A reader still holding the old map can finish with it
+        assert_that(old_map[:len(PACKED_MAGIC)], is_(PACKED_MAGIC))
+
+    def test_s3_archive(self):
+        with open(self.path, 'rb') as f:
+            bucket = _S3Bucket(f.read())
+        key = bucket.new_key('TestFilesystem' + PACKED_EXTENSION)
+        archive = S3PackedArchive(key)
+        assert_that(archive.lastModified, is_(1000))
+        with open(os.path.join(SOURCE, 'eclipse-toc.xml'), 'rb') as f:
+            assert_that(archive.read('eclipse-toc.xml'), is_(f.read()))
+        archive.read('dc_metadata.xml')
+        # Each read has a key of its own
+        assert_that(bucket.reads, has_length(3))
+        assert_that(set(map(id, bucket.reads)), has_length(3))
+        assert_that(key in bucket.reads, is_(False))
+
+    def test_package(self):
+        archive = get_filesystem_archive(self.path)
+        bucket = packed_bucket(archive, None, u'TestFilesystem')
+        package = packed_package_factory(bucket)
+        assert_that(package,
+                    validly_provides(interfaces.IPackedContentPackage))
+        assert_that(package.key.bucket, is_(same_instance(bucket)))
+        assert_that(package,
+                    has_property('PlatformPresentationResources', has_length(3)))
+
+        expected = filesystem.EnumerateOnceFilesystemLibrary(os.path.dirname(SOURCE))
+        expected.syncContentPackages()
+        expected = expected[0]
+        assert_that(package.ntiid, is_(expected.ntiid))
+        assert_that(package.children, has_length(len(expected.children)))
+        assert_that(package.lastModified, is_(archive.lastModified))
+
+        assert_that(package.does_sibling_entry_exist('index.html'),
+                    validly_provides(interfaces.IPackedKey))
+        assert_that(package.does_sibling_entry_exist('missing.html'),
+                    is_(none()))
+
+    def test_child_named(self):
+        bucket = filesystem.FilesystemBucket(name=u'packed')
+        bucket.absolute_path = self.tmpdir
+        packed = bucket.getChildNamed(u'TestFilesystem')
+        assert_that(packed, validly_provides(interfaces.IPackedBucket))
+        assert_that(bucket.getChildNamed(u'TestFilesystem' + PACKED_EXTENSION),
+                    is_(none()))
+        # Enumeration and lookup by name share the one cached child
+        assert_that(list(bucket.enumerateChildren()),
+                    is_([packed]))
+        assert_that(list(bucket.enumerateChildren())[0],
+                    is_(same_instance(packed)))
+        assert_that(bucket._children_cache, is_({u'TestFilesystem': packed}))
+
+    def test_library(self):
+        library = filesystem.EnumerateOnceFilesystemLibrary(self.tmpdir)
+        library.syncContentPackages()
+        assert_that(library.contentPackages, has_length(1))
+        package = library[0]
+        assert_that(package,
+                    validly_provides(interfaces.IPackedContentPackage))
+        assert_that(package.key.bucket, has_property('__name__', 'TestFilesystem'))
+
+        # An unpacked directory of the same name wins
+        shutil.copytree(SOURCE, os.path.join(self.tmpdir, 'TestFilesystem'))
+        library = filesystem.EnumerateOnceFilesystemLibrary(self.tmpdir)
+        library.syncContentPackages()
+        assert_that(library.contentPackages, has_length(1))
+        assert_that(library[0],
+                    validly_provides(interfaces.IFilesystemContentPackage))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_key
+from hamcrest import has_entry
+from hamcrest import assert_that
+
+import os
+import gzip
+import shutil
+import tempfile
+
+from six import BytesIO
+
+import simplejson as json
+
+from nti.contentlibrary import filesystem
+
+from nti.contentlibrary.precompress import GZIP
+from nti.contentlibrary.precompress import PRECOMPRESSED_MANIFEST
+
+from nti.contentlibrary.precompress import _accepted
+from nti.contentlibrary.precompress import precompress_package
+from nti.contentlibrary.precompress import read_contents_for_encoding
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+
+#: A rendered page of the test package big enough to compress
+PAGE = u'tag_nextthought_com_2011-10_USSC-HTML-Cohen_18.html'
+
+
+class TestPrecompress(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestPrecompress, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'TestFilesystem')
+        shutil.copytree(os.path.join(os.path.dirname(__file__), 'TestFilesystem'),
+                        self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(TestPrecompress, self).tearDown()
+
+    def test_precompress_package(self):
+        manifest = precompress_package(self.path)
+        assert_that(manifest, has_entry('encodings', [GZIP]))
+        files = manifest['files']
+        assert_that(files, has_key('eclipse-toc.xml'))
+        assert_that(files, has_key(PAGE))
+        # too small to be worth it
+        assert_that(files, is_not(has_key('index.html')))
+
+        with open(os.path.join(self.path, PRECOMPRESSED_MANIFEST)) as f:
+            assert_that(json.load(f), is_(manifest))
+
+        source = os.path.join(self.path, PAGE)
+        with open(source, 'rb') as f:
+            contents = f.read()
+        with gzip.open(source + '.gz', 'rb') as f:
+            assert_that(f.read(), is_(contents))
+        assert_that(files[PAGE],
+                    has_entry(GZIP, os.path.getsize(source + '.gz')))
+
+        # Up to date variants are kept
+        mtime = os.stat(source + '.gz').st_mtime
+        assert_that(precompress_package(self.path), is_(manifest))
+        assert_that(os.stat(source + '.gz').st_mtime, is_(mtime))
+
+        # Changed contents are compressed again, even in the same second
+        stat = os.stat(source)
+        with open(source, 'ab') as f:
+            f.write(b'<p>More</p>')
+        os.utime(source, (stat.st_atime, stat.st_mtime))
+        manifest = precompress_package(self.path)
+        assert_that(manifest['files'][PAGE],
+                    has_entry('size', stat.st_size + 11))
+        with gzip.open(source + '.gz', 'rb') as f:
+            assert_that(f.read(), is_(contents + b'<p>More</p>'))
+
+    def test_read_contents_for_encoding(self):
+        precompress_package(self.path)
+        bucket = filesystem.FilesystemBucket(name=u'TestFilesystem')
+        bucket.absolute_path = self.path
+        key = filesystem.FilesystemKey(bucket=bucket, name=PAGE)
+
+        data, encoding = read_contents_for_encoding(key, 'deflate, gzip;q=0.8')
+        assert_that(encoding, is_(GZIP))
+        assert_that(gzip.GzipFile(fileobj=BytesIO(data)).read(),
+                    is_(key.readContents()))
+
+        data, encoding = read_contents_for_encoding(key, 'gzip;q=0')
+        assert_that(encoding, is_(none()))
+        assert_that(data, is_(key.readContents()))
+
+        # A variant for other contents is not used
+        stat = os.stat(key.absolute_path)
+        with open(key.absolute_path, 'ab') as f:
+            f.write(b'<p>More</p>')
+        os.utime(key.absolute_path, (stat.st_atime, stat.st_mtime))
+        assert_that(key.readCompressedContents(GZIP), is_(none()))
+
+        os.utime(key.absolute_path, (0, 0))
+        assert_that(key.readCompressedContents(GZIP), is_(none()))
+        assert_that(read_contents_for_encoding(key, 'gzip')[1], is_(none()))
+
+    def test_accepted(self):
+        assert_that(_accepted('gzip;q=0.5, br, identity;q=0'),
+                    is_(['br', 'gzip']))
+        assert_that(_accepted(None), is_([]))
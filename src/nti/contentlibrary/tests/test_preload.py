@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_key
+from hamcrest import assert_that
+from hamcrest import greater_than
+from hamcrest import instance_of
+from hamcrest import same_instance
+
+import gc
+import os
+import unittest
+
+from nti.contentlibrary import filesystem
+
+from nti.contentlibrary.contentunit import content_unit_table
+
+from nti.contentlibrary.preload import after_fork
+from nti.contentlibrary.preload import warm_package
+from nti.contentlibrary.preload import memory_report
+from nti.contentlibrary.preload import preload_library
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+from nti.contentlibrary.zodb import RenderableContentPackage
+
+
+class TestPreload(ContentlibraryLayerTest):
+
+    def tearDown(self):
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        gc.enable()
+        super(TestPreload, self).tearDown()
+
+    def test_preload_library(self):
+        library = filesystem.GlobalFilesystemContentPackageLibrary(os.path.dirname(__file__))
+        assert_that(preload_library(library), is_(same_instance(library)))
+
+        package = library[0]
+        table = package._v_unit_table
+        assert_that(content_unit_table(package), is_(same_instance(table)))
+        assert_that(table.units, instance_of(tuple))
+        assert_that(table.parents, instance_of(tuple))
+        assert_that(package.__dict__, has_key('_v_references'))
+        if hasattr(gc, 'freeze'):
+            assert_that(gc.get_freeze_count(), greater_than(0))
+            # Until the workers are forked
+            assert_that(gc.isenabled(), is_(False))
+        after_fork()
+        assert_that(gc.isenabled(), is_(True))
+
+    def test_persistent_package(self):
+        package = RenderableContentPackage()
+        package.ntiid = u'tag:nextthought.com,2011-10:NTI-HTML-Preloaded'
+        warm_package(package)
+        # Persistent packages may be edited, so no table is kept
+        assert_that(package.__dict__.get('_v_unit_table'), is_(none()))
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps'), "Linux only")
+    def test_memory_report(self):
+        report = memory_report()
+        assert_that(report['rss'], greater_than(0))
+        assert_that(report['shared'] + report['private'], is_(report['rss']))
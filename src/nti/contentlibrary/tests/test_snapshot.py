@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_property
+from hamcrest import same_instance
+
+import os
+import time
+import shutil
+import tempfile
+
+from nti.contentlibrary import filesystem
+
+from nti.contentlibrary.snapshot import is_library_snapshot_current
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+
+class TestLibrarySnapshot(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestLibrarySnapshot, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'library')
+        os.makedirs(self.root)
+        shutil.copytree(os.path.join(os.path.dirname(__file__), 'TestFilesystem'),
+                        os.path.join(self.root, 'TestFilesystem'))
+        self.snapshot = os.path.join(self.tmpdir, 'library.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(TestLibrarySnapshot, self).tearDown()
+
+    def _library(self):
+        library = filesystem.GlobalFilesystemContentPackageLibrary(self.root,
+                                                                   snapshot=self.snapshot)
+        library.syncContentPackages()
+        return library
+
+    def test_snapshot(self):
+        expected = self._library()
+        assert_that(expected, has_property('_v_from_snapshot', False))
+        assert_that(os.path.exists(self.snapshot), is_(True))
+
+        library = self._library()
+        assert_that(library, has_property('_v_from_snapshot', True))
+        assert_that(library.contentPackages, has_length(1))
+        package = library[0]
+        assert_that(package.ntiid, is_(expected[0].ntiid))
+        assert_that(package.__parent__, is_(same_instance(library)))
+        assert_that(package.root.__parent__,
+                    is_(same_instance(library.enumeration.root)))
+        assert_that(package.key.absolute_path,
+                    is_(expected[0].key.absolute_path))
+
+        ntiid = 'tag:nextthought.com,2011-10:testing-NTICard-temp.nticard.1'
+        assert_that(library.pathsToEmbeddedNTIID(ntiid), has_length(1))
+        assert_that(library.contentUnitsByNTIID,
+                    has_length(len(expected.contentUnitsByNTIID)))
+
+        # Once the content changes, the snapshot is not used
+        toc = os.path.join(self.root, 'TestFilesystem', 'eclipse-toc.xml')
+        later = time.time() + 10
+        os.utime(toc, (later, later))
+        library = self._library()
+        assert_that(library, has_property('_v_from_snapshot', False))
+        # and is written again
+        assert_that(self._library(), has_property('_v_from_snapshot', True))
+
+    def test_snapshot_written_when_changed(self):
+        written = []
+        def write(library, path):
+            written.append(path)
+            return original(library, path)
+        original = filesystem.write_library_snapshot
+        filesystem.write_library_snapshot = write
+        try:
+            library = self._library()
+            assert_that(written, has_length(1))
+
+            # Nothing changed
+            library.syncContentPackages()
+            assert_that(written, has_length(1))
+
+            # The snapshot is gone
+            os.remove(self.snapshot)
+            library.syncContentPackages()
+            assert_that(written, has_length(2))
+
+            # The package changed
+            toc = os.path.join(self.root, 'TestFilesystem', 'eclipse-toc.xml')
+            later = time.time() + 10
+            os.utime(toc, (later, later))
+            library.syncContentPackages()
+            assert_that(written, has_length(3))
+            assert_that(is_library_snapshot_current(library, self.snapshot),
+                        is_(True))
+        finally:
+            filesystem.write_library_snapshot = original
@@ -12,6 +12,7 @@ from hamcrest import is_
 from hamcrest import none
 from hamcrest import is_not
 from hamcrest import has_key
+from hamcrest import has_item
 from hamcrest import not_none
 from hamcrest import has_entry
 from hamcrest import has_length
@@ -48,6 +49,7 @@ from zope.site.interfaces import NewLocalSite
 from zope.schema.interfaces import IFieldUpdatedEvent
 
 from nti.contentlibrary import filesystem
+from nti.contentlibrary import bundle as bundle_module
 from nti.contentlibrary import interfaces
 from nti.contentlibrary import subscribers
 
@@ -223,6 +225,11 @@ class TestSubscribers(ContentlibraryLayerTest):
                                                  has_entry('href', '/TestFilesystem/presentation-assets/shared/v1/')))
                                  ))
 
+        # we recorded the meta info stamps of what we synced
+        assert_that(bundle_lib._bundle_meta_stamps,
+                    has_entry('ABundle', has_item(bundle.ntiid)))
+        assert_that(bundle_lib._bundle_meta_stamps, has_length(2))
+
         # test update existing object
         bundle.lastModified = 0
         eventtesting.clearEvents()
@@ -252,3 +259,64 @@ class TestSubscribers(ContentlibraryLayerTest):
         assert_that(evts, has_length(0))
 
         # Note: we no longer remove bundles via sync.
+
+    def test_sync_bundle_skips_unchanged_meta(self):
+        site_factory = interfaces.ISiteLibraryFactory(self.global_library)
+
+        site = Folder()
+        site.__name__ = u'localsite'
+        sm = LocalSiteManager(site)
+        site.setSiteManager(sm)
+
+        site_factory.library_for_site_named(u'localsite')
+        eventtesting.clearEvents()
+        subscribers.install_site_content_library(sm, NewLocalSite(sm))
+
+        events = eventtesting.getEvents(
+            interfaces.IContentPackageBundleLibraryModifiedOnSyncEvent)
+        bundle_lib = events[0].object
+        bundle_bucket = events[0].bucket
+        syncer = interfaces.ISyncableContentPackageBundleLibrary(bundle_lib)
+
+        read = []
+        meta_info = bundle_module._ContentBundleMetaInfo
+
+        def _meta_info(key, *args, **kwargs):
+            read.append(key.__parent__.__name__)
+            return meta_info(key, *args, **kwargs)
+
+        meta_path = os.path.join(os.path.dirname(__file__), 'sites', 'localsite',
+                                 'ContentPackageBundles', 'RestrictedBundle',
+                                 'bundle_meta_info.json')
+        stat = os.stat(meta_path)
+        bundle_module._ContentBundleMetaInfo = _meta_info
+        try:
+            # Nothing changed, so no meta file is read
+            eventtesting.clearEvents()
+            syncer.syncFromBucket(bundle_bucket)
+            assert_that(read, is_empty())
+            assert_that(eventtesting.getEvents(IObjectModifiedEvent), is_empty())
+
+            # Once touched, only that one is read and updated
+            later = stat.st_mtime + 10
+            os.utime(meta_path, (later, later))
+            eventtesting.clearEvents()
+            syncer.syncFromBucket(bundle_bucket)
+            assert_that(read, is_([u'RestrictedBundle']))
+            restricted_ntiid = u'tag:nextthought.com,2011-10:NTI-Bundle-RestrictedBundle'
+            evts = eventtesting.getEvents(
+                IObjectModifiedEvent,
+                filter=lambda e: interfaces.IContentPackageBundle.providedBy(e.object))
+            assert_that(evts, has_length(1))
+            assert_that(evts[0].object, has_property('ntiid', restricted_ntiid))
+            assert_that(bundle_lib._bundle_meta_stamps,
+                        has_entry('RestrictedBundle',
+                                  is_((restricted_ntiid, int(later)))))
+
+            # and then skipped again
+            del read[:]
+            syncer.syncFromBucket(bundle_bucket)
+            assert_that(read, is_empty())
+        finally:
+            bundle_module._ContentBundleMetaInfo = meta_info
+            os.utime(meta_path, (stat.st_atime, stat.st_mtime))
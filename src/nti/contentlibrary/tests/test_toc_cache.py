@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import is_not
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import has_property
+
+import os
+import shutil
+import tempfile
+
+from zope import component
+
+from nti.contentlibrary import filesystem
+
+from nti.contentlibrary.contentunit import content_unit_table
+
+from nti.contentlibrary.eclipse import compile_toc
+from nti.contentlibrary.eclipse import is_compiled_toc
+
+from nti.contentlibrary.interfaces import ICompiledTOCCache
+
+from nti.contentlibrary.toc_cache import FilesystemCompiledTOCCache
+
+from nti.contentlibrary.tests import ContentlibraryLayerTest
+
+from nti.contentlibrary.walker import walk_pre_order
+
+
+def _build():
+    bucket = filesystem.FilesystemBucket(name=u'TestFilesystem')
+    bucket.absolute_path = os.path.join(os.path.dirname(__file__),
+                                        'TestFilesystem')
+    return filesystem._package_factory(bucket)
+
+
+def _describe(package):
+    return [(unit.ntiid, unit.href, unit.key, unit.ordinal,
+             getattr(unit.__parent__, 'ntiid', None),
+             getattr(unit, 'embeddedContainerNTIIDs', None),
+             getattr(unit, 'sharedWith', None))
+            for unit in walk_pre_order(package)]
+
+
+class TestCompiledTOCCache(ContentlibraryLayerTest):
+
+    def setUp(self):
+        super(TestCompiledTOCCache, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = FilesystemCompiledTOCCache(os.path.join(self.tmpdir, 'tocs'))
+
+    def tearDown(self):
+        component.getGlobalSiteManager().unregisterUtility(self.cache,
+                                                           ICompiledTOCCache)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(TestCompiledTOCCache, self).tearDown()
+
+    def test_compiled_package(self):
+        expected = _build()
+
+        component.getGlobalSiteManager().registerUtility(self.cache,
+                                                         ICompiledTOCCache)
+        # Compiled and stored on the first parse...
+        package = _build()
+        assert_that(os.listdir(self.cache.directory), has_length(1))
+        assert_that(package.children[0], has_property('_v_toc_node',
+                                                      is_not(none())))
+
+        # ...and used without the XML from then on
+        package = _build()
+        assert_that(package.children[0].__dict__.get('_v_toc_node'),
+                    is_(none()))
+        assert_that(_describe(package), is_(_describe(expected)))
+        assert_that(package.ntiid, is_(expected.ntiid))
+        assert_that(package.PlatformPresentationResources, has_length(3))
+
+        table = content_unit_table(package)
+        assert_that(table.parents, is_(content_unit_table(expected).parents))
+        assert_that(table.units[0], is_(package))
+
+    def test_cache(self):
+        toc = os.path.join(os.path.dirname(__file__),
+                           'TestFilesystem', 'eclipse-toc.xml')
+        key = filesystem.FilesystemKey(name=u'eclipse-toc.xml')
+        key.absolute_path = toc
+        compiled = compile_toc(key.readContentsAsETree())
+        assert_that(is_compiled_toc(compiled), is_(True))
+
+        assert_that(self.cache.get('abc'), is_(none()))
+        self.cache.set('abc', compiled)
+        assert_that(self.cache.get('abc'), is_(compiled))
+
+        # Corrupt files are ignored
+        with open(self.cache._path('abc'), 'wb') as f:
+            f.write(b'\x00')
+        assert_that(self.cache.get('abc'), is_(none()))
@@ -9,15 +9,41 @@ from __future__ import absolute_import
 # pylint: disable=W0212,R0904
 
 from hamcrest import is_
+from hamcrest import none
 from hamcrest import is_not
 from hamcrest import assert_that
+from hamcrest import contains_inanyorder
 
 import os
 import shutil
 import tempfile
 
+from zope import component
+
+from zope.catalog.interfaces import ICatalog
+
+from nti.contentlibrary import utils
+
+from nti.contentlibrary.bundle import PersistentContentPackageBundle
+
+from nti.contentlibrary.filesystem import EnumerateOnceFilesystemLibrary
+from nti.contentlibrary.filesystem import GlobalFilesystemContentPackageLibrary
+
+from nti.contentlibrary.index import IX_TITLE
+from nti.contentlibrary.index import IX_LASTMODIFIED
+from nti.contentlibrary.index import CONTENT_BUNDLES_CATALOG_NAME
+from nti.contentlibrary.index import create_contentbundle_catalog
+
+from nti.contentlibrary.interfaces import IContentPackageBundle
+from nti.contentlibrary.interfaces import IContentPackageLibrary
+
 from nti.contentlibrary.tests import ContentlibraryLayerTest
 
+from nti.site.interfaces import IHostPolicyFolder
+
+from nti.contentlibrary.utils import get_bundles_page
+from nti.contentlibrary.utils import bundles_for_package
+from nti.contentlibrary.utils import content_package_fingerprint
 from nti.contentlibrary.utils import is_valid_presentation_assets_source
 
 
@@ -49,3 +75,158 @@ class TestUtils(ContentlibraryLayerTest):
         
         result = is_valid_presentation_assets_source(None)
         assert_that(result, is_(False))
+
+    def test_content_package_fingerprint(self):
+        library = EnumerateOnceFilesystemLibrary(os.path.dirname(__file__))
+        library.syncContentPackages()
+        package = library[0]
+
+        fingerprint = content_package_fingerprint(package)
+        assert_that(fingerprint, is_not(none()))
+        assert_that(content_package_fingerprint(package), is_(fingerprint))
+
+        toc_only = content_package_fingerprint(package,
+                                               names=('eclipse-toc.xml',))
+        assert_that(toc_only, is_not(fingerprint))
+        assert_that(content_package_fingerprint(package, names=('missing',)),
+                    is_(none()))
+
+
+class _IntIds(object):
+
+    def __init__(self):
+        self.objects = {}
+
+    def queryObject(self, doc_id, default=None):
+        return self.objects.get(doc_id, default)
+
+
+class _SiteFolder(object):
+
+    def __init__(self, name):
+        self.__name__ = name
+
+
+class TestBundleQueries(ContentlibraryLayerTest):
+
+    pkg_ntiid = u'tag:nextthought.com,2011-10:USSC-HTML-Cohen.cohen_v._california.'
+
+    def setUp(self):
+        gsm = component.getGlobalSiteManager()
+        self.global_library = GlobalFilesystemContentPackageLibrary(os.path.dirname(__file__))
+        self.global_library.syncContentPackages()
+        gsm.registerUtility(self.global_library, provided=IContentPackageLibrary)
+
+        self.catalog = create_contentbundle_catalog()
+        gsm.registerUtility(self.catalog, provided=ICatalog,
+                            name=CONTENT_BUNDLES_CATALOG_NAME)
+        # A bundle's site is the name of its host policy folder
+        self.sites = {}
+        gsm.registerAdapter(self._site_folder,
+                            required=(IContentPackageBundle,),
+                            provided=IHostPolicyFolder)
+        self.intids = _IntIds()
+        # Lowest site first
+        self._hierarchy = utils.get_component_hierarchy_names
+        utils.get_component_hierarchy_names = lambda *unused: [u'child', u'parent']
+
+    def tearDown(self):
+        utils.get_component_hierarchy_names = self._hierarchy
+        gsm = component.getGlobalSiteManager()
+        gsm.unregisterAdapter(self._site_folder,
+                              required=(IContentPackageBundle,),
+                              provided=IHostPolicyFolder)
+        gsm.unregisterUtility(self.catalog, provided=ICatalog,
+                              name=CONTENT_BUNDLES_CATALOG_NAME)
+        gsm.unregisterUtility(self.global_library, provided=IContentPackageLibrary)
+
+    def _site_folder(self, bundle):
+        site = self.sites.get(id(bundle))
+        return _SiteFolder(site) if site is not None else None
+
+    def _bundle(self, doc_id, name, site, packages=True, **kwargs):
+        bundle = PersistentContentPackageBundle()
+        bundle.ntiid = u'tag:nextthought.com,2011-10:NTI-Bundle-' + name
+        bundle.title = kwargs.pop('title', name)
+        bundle.createdTime = bundle.lastModified = kwargs.pop('lastModified', doc_id)
+        if packages:
+            bundle.ContentPackages = (self.global_library[self.pkg_ntiid],)
+        self.sites[id(bundle)] = site
+        self.intids.objects[doc_id] = bundle
+        self.catalog.index_doc(doc_id, bundle)
+        return bundle
+
+    def test_bundles_for_package(self):
+        parent = self._bundle(1, u'Parent', u'parent')
+        # Overridden in the child by a bundle without the package
+        self._bundle(2, u'Overridden', u'parent')
+        self._bundle(3, u'Overridden', u'child', packages=False)
+        # Not in our hierarchy
+        self._bundle(4, u'Other', u'other')
+        # In no site at all, as with the global bundle library
+        unsited = self._bundle(5, u'Global', None)
+
+        result = bundles_for_package(self.pkg_ntiid, intids=self.intids)
+        assert_that(result, contains_inanyorder(parent, unsited))
+        package = self.global_library[self.pkg_ntiid]
+        assert_that(bundles_for_package(package, intids=self.intids),
+                    contains_inanyorder(parent, unsited))
+        assert_that(bundles_for_package(u'tag:nextthought.com,2011-10:missing',
+                                        intids=self.intids),
+                    is_([]))
+
+        # An unsited bundle is overridden by one in a site
+        self._bundle(6, u'Parent', None)
+        assert_that(bundles_for_package(self.pkg_ntiid, intids=self.intids),
+                    contains_inanyorder(parent, unsited))
+
+    def test_bundles_for_package_no_catalog(self):
+        component.getGlobalSiteManager().unregisterUtility(self.catalog, provided=ICatalog,
+                                                           name=CONTENT_BUNDLES_CATALOG_NAME)
+        assert_that(bundles_for_package(self.pkg_ntiid), is_([]))
+
+    def _titles(self, bundles):
+        return [getattr(x, 'title', None) for x in bundles]
+
+    def test_get_bundles_page(self):
+        self._bundle(1, u'Beta', u'parent')
+        self._bundle(2, u'Alpha', u'parent')
+        self._bundle(3, u'Gamma', u'child')
+        # Overridden in the child, under a new title
+        self._bundle(4, u'Delta', u'parent')
+        self._bundle(5, u'Delta', u'child', title=u'Zeta')
+        self._bundle(6, u'Other', u'other')
+
+        page = get_bundles_page(intids=self.intids)
+        assert_that(self._titles(page),
+                    is_([u'Alpha', u'Beta', u'Gamma', u'Zeta']))
+        page = get_bundles_page(batch_start=1, batch_size=2, intids=self.intids)
+        assert_that(self._titles(page), is_([u'Beta', u'Gamma']))
+        page = get_bundles_page(reverse=True, batch_size=3, intids=self.intids)
+        assert_that(self._titles(page), is_([u'Zeta', u'Gamma', u'Beta']))
+        page = get_bundles_page(sort_on=IX_LASTMODIFIED, reverse=True,
+                                intids=self.intids)
+        assert_that(self._titles(page),
+                    is_([u'Zeta', u'Gamma', u'Alpha', u'Beta']))
+        # Only the child site
+        page = get_bundles_page(parents=False, intids=self.intids)
+        assert_that(self._titles(page), is_([u'Gamma', u'Zeta']))
+
+    def test_get_bundles_page_invalid_sort(self):
+        # Raised by the call, before iterating
+        with self.assertRaises(ValueError):
+            get_bundles_page(sort_on=u'bogus')
+
+    def test_get_bundles_page_old_catalog(self):
+        self._bundle(1, u'Beta', u'parent')
+        self._bundle(2, u'Alpha', u'parent')
+        self._bundle(3, u'Gamma', u'child')
+        # A bundle object without a title
+        self._bundle(4, u'Untitled', u'child')
+        self.intids.objects[4] = _SiteFolder(u'untitled')
+        del self.catalog[IX_TITLE]
+
+        page = get_bundles_page(intids=self.intids)
+        assert_that(self._titles(page), is_([u'Alpha', u'Beta', u'Gamma', None]))
+        page = get_bundles_page(reverse=True, batch_size=2, intids=self.intids)
+        assert_that(self._titles(page), is_([u'Gamma', u'Beta']))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import calling
+from hamcrest import raises
+from hamcrest import assert_that
+
+import unittest
+
+from nti.contentlibrary.walker import POST_ORDER
+
+from nti.contentlibrary.walker import walk
+from nti.contentlibrary.walker import walk_events
+
+
+class Unit(object):
+
+    def __init__(self, ntiid, children=()):
+        self.ntiid = ntiid
+        self.children = children
+
+
+class TestWalker(unittest.TestCase):
+
+    def _tree(self):
+        return Unit('a', (Unit('b', (Unit('c'), Unit('d'))),
+                          Unit('e', None)))
+
+    def test_orders(self):
+        tree = self._tree()
+        assert_that([x.ntiid for x in walk(tree)],
+                     is_(['a', 'b', 'c', 'd', 'e']))
+        assert_that([x.ntiid for x in walk(tree, POST_ORDER)],
+                     is_(['c', 'd', 'b', 'e', 'a']))
+        assert_that([(x.ntiid, entering) for x, entering in walk_events(tree)],
+                     is_([('a', True), ('b', True), ('c', True), ('c', False),
+                          ('d', True), ('d', False), ('b', False),
+                          ('e', True), ('e', False), ('a', False)]))
+        assert_that(calling(walk).with_args(tree, 'level'),
+                    raises(ValueError))
+
+    def test_deep(self):
+        root = unit = Unit('0')
+        for i in range(1, 50000):
+            child = Unit(str(i))
+            unit.children = (child,)
+            unit = child
+        assert_that(sum(1 for _ in walk(root, POST_ORDER)), is_(50000))
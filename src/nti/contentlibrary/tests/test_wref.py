@@ -9,12 +9,18 @@ from __future__ import absolute_import
 # pylint: disable=W0212,R0904
 
 from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_length
 from hamcrest import assert_that
 from hamcrest import has_properties
 
+import gc
 import os
 
 import pickle
+
+import transaction
+
 from zope import component
 
 from nti.contentlibrary import filesystem
@@ -24,7 +30,10 @@ from nti.contentlibrary.interfaces import IContentPackageLibrary
 
 from nti.contentlibrary.tests import ContentlibraryLayerTest
 
+from nti.contentlibrary.wref import _resolution_cache
 from nti.contentlibrary.wref import ContentUnitWeakRef
+from nti.contentlibrary.wref import resolve_content_unit_wrefs
+from nti.contentlibrary.wref import contentunit_wref_to_missing_ntiid
 
 from nti.wref.interfaces import IWeakRef
 
@@ -76,3 +85,35 @@ class TestWref(ContentlibraryLayerTest):
 
         wref = IWeakRef(unit)
         assert_that(wref(), is_(lib_unit))
+
+    def test_resolve_wrefs(self):
+        lib = component.getUtility(interfaces.IContentPackageLibrary)
+
+        ntiid = u'tag:nextthought.com,2011-10:USSC-HTML-Cohen.cohen_v._california.'
+        unit = lib[ntiid]
+        missing = contentunit_wref_to_missing_ntiid(u'tag:nextthought.com,2011-10:NTI-HTML-missing')
+
+        result = resolve_content_unit_wrefs((IWeakRef(unit), missing))
+        assert_that(result, is_([unit, None]))
+
+        # Changing the library is seen by cached lookups
+        package = lib.contentPackages[0]
+        lib.remove(package, event=False, unregister=False)
+        try:
+            assert_that(IWeakRef(unit)(), is_(none()))
+        finally:
+            lib.add(package, event=False)
+        assert_that(IWeakRef(unit)(), is_(unit))
+
+    def test_resolution_cache_ends_with_transaction(self):
+        lib = component.getUtility(interfaces.IContentPackageLibrary)
+        ntiid = u'tag:nextthought.com,2011-10:USSC-HTML-Cohen.cohen_v._california.'
+        unit = lib[ntiid]
+
+        _resolution_cache.clear()
+        transaction.begin()
+        assert_that(IWeakRef(unit)(), is_(unit))
+        assert_that(_resolution_cache.data, has_length(1))
+        transaction.abort()
+        gc.collect()
+        assert_that(_resolution_cache.data, has_length(0))
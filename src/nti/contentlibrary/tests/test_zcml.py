@@ -25,6 +25,7 @@ from zope.configuration import config
 from zope.configuration import xmlconfig
 
 from nti.contentlibrary.interfaces import IS3Key
+from nti.contentlibrary.interfaces import ICompiledTOCCache
 from nti.contentlibrary.interfaces import IContentPackageLibrary
 from nti.contentlibrary.interfaces import IAbsoluteContentUnitHrefMapper
 
@@ -63,6 +64,13 @@ BOTO_ZCML_STRING = HEAD_ZCML_STRING + u"""
         </configure>
         """
 
+TOC_CACHE_ZCML_STRING = HEAD_ZCML_STRING + u"""
+            <lib:compiledTOCCache
+                directory="/tmp/compiled-tocs"
+                />
+        </configure>
+        """
+
 
 class TestZcml(nti.testing.base.ConfiguringTestBase):
 
@@ -103,3 +111,14 @@ class TestZcml(nti.testing.base.ConfiguringTestBase):
 
         mapper = component.getAdapter(Key(), IAbsoluteContentUnitHrefMapper)
         assert_that(mapper, has_property('href', '//cdnname/my.key'))
+
+    def test_register_compiled_toc_cache(self):
+        context = config.ConfigurationMachine()
+        context.package = self.get_configuration_package()
+        xmlconfig.registerCommonDirectives(context)
+
+        xmlconfig.string(TOC_CACHE_ZCML_STRING, context)
+
+        cache = component.getUtility(ICompiledTOCCache)
+        assert_that(cache, verifiably_provides(ICompiledTOCCache))
+        assert_that(cache, has_property('directory', '/tmp/compiled-tocs'))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Storage of compiled TOCs.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import marshal
+import tempfile
+
+from zope import interface
+
+from nti.contentlibrary.eclipse import COMPILED_TOC_VERSION
+
+from nti.contentlibrary.interfaces import ICompiledTOCCache
+
+#: The suffix of the files of compiled TOCs. The :mod:`marshal`
+#: format is specific to the major version of Python.
+COMPILED_TOC_SUFFIX = '.py%d.v%d.ntitoc' % (sys.version_info[0],
+                                            COMPILED_TOC_VERSION)
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@interface.implementer(ICompiledTOCCache)
+class FilesystemCompiledTOCCache(object):
+    """
+    Stores each compiled TOC in a :mod:`marshal` file of `directory`,
+    named for the digest of its TOC. The directory is created as
+    needed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __repr__(self):
+        return "<%s '%s'>" % (type(self).__name__, self.directory)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + COMPILED_TOC_SUFFIX)
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return marshal.loads(f.read())
+        except (IOError, OSError):
+            return None
+        except (EOFError, ValueError, TypeError):
+            logger.warning("Ignoring invalid compiled TOC %s",
+                           self._path(digest))
+            return None
+
+    def set(self, digest, compiled):
+        tmp = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmp = tempfile.mkstemp(prefix='.' + digest,
+                                       dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(marshal.dumps(compiled))
+            os.rename(tmp, self._path(digest))
+        except (IOError, OSError, ValueError):
+            logger.exception("Failed to store compiled TOC %s in %s",
+                             digest, self.directory)
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
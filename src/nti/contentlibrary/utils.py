@@ -12,6 +12,8 @@ import os
 import re
 import time
 import zlib
+import heapq
+import hashlib
 import base64
 import shutil
 import zipfile
@@ -21,6 +23,8 @@ from collections import namedtuple
 
 from PIL import Image
 
+import repoze.lru
+
 import six
 
 from zope import component
@@ -34,16 +38,36 @@ from nti.coremetadata.interfaces import SYSTEM_USER_NAME
 from nti.contentlibrary import NTI
 from nti.contentlibrary import HTML
 from nti.contentlibrary import BUNDLE
+from nti.contentlibrary import VENDOR_INFO_NAME
 from nti.contentlibrary import ALL_CONTENT_PACKAGE_MIME_TYPES
 
+from nti.contentlibrary.dublincore import DCMETA_FILENAME
+
+from nti.contentlibrary.eclipse import TOC_FILENAME
+
+from nti.contentlibrary.existence import exists_many
+
 from nti.contentlibrary.index import IX_SITE
+from nti.contentlibrary.index import IX_NTIID
+from nti.contentlibrary.index import IX_TITLE
 from nti.contentlibrary.index import IX_MIMETYPE
+from nti.contentlibrary.index import IX_PACKAGES
+from nti.contentlibrary.index import IX_CREATEDTIME
+from nti.contentlibrary.index import IX_LASTMODIFIED
+from nti.contentlibrary.index import get_contentbundle_catalog
 from nti.contentlibrary.index import get_contentlibrary_catalog
 
+from nti.contentlibrary.indexed_data.index import iter_objects
+from nti.contentlibrary.indexed_data.index import committed_generation
+
+from nti.contentlibrary.indexed_data.interfaces import CONTAINER_IFACES
+from nti.contentlibrary.indexed_data.interfaces import TAG_NAMESPACE_FILE
+
 from nti.contentlibrary.interfaces import IContentUnit
 from nti.contentlibrary.interfaces import IContentPackage
 from nti.contentlibrary.interfaces import IContentOperator
 from nti.contentlibrary.interfaces import IContentVendorInfo
+from nti.contentlibrary.interfaces import IDelimitedHierarchyEntry
 from nti.contentlibrary.interfaces import IEditableContentPackage
 from nti.contentlibrary.interfaces import IRenderableContentPackage
 from nti.contentlibrary.interfaces import IContentPackageExporterDecorator
@@ -66,6 +90,8 @@ from nti.recorder.interfaces import ITransactionRecordHistory
 
 from nti.recorder.utils import decompress
 
+from nti.site.hostpolicy import get_host_site
+
 from nti.site.interfaces import IHostPolicyFolder
 
 from nti.site.site import get_component_hierarchy_names
@@ -81,10 +107,48 @@ INTERNAL_NTIID = StandardInternalFields.NTIID
 logger = __import__('logging').getLogger(__name__)
 
 
-def get_content_packages(sites=(), mime_types=None):
+#: Candidate doc ids of :func:`get_content_packages` queries, keyed by
+#: catalog, catalog generation, sites and mime types
+_content_packages_cache = repoze.lru.LRUCache(100)
+
+try:
+    import zope.testing.cleanup
+except ImportError:  # pragma: no cover
+    pass
+else:
+    zope.testing.cleanup.addCleanUp(_content_packages_cache.clear)
+
+
+def _content_package_candidates(catalog, sites, mime_types):
+    """
+    Run a single catalog query across all the sites and return a list
+    with, for each package NTIID, the doc ids carrying it, in the order
+    they should be tried: lowest site first, then doc id order.
+    Only index values are consulted; no packages are loaded.
+    """
+    query = {
+        IX_SITE: {'any_of': sites},
+        IX_MIMETYPE: {'any_of': mime_types},
+    }
+    site_values = catalog[IX_SITE].documents_to_values
+    ntiid_values = catalog[IX_NTIID].documents_to_values
+    rank = {name: idx for idx, name in enumerate(sites)}
+    docs = sorted((rank.get(site_values.get(doc_id), len(rank)), doc_id)
+                  for doc_id in catalog.apply(query) or ())
+    candidates = dict()
+    for _, doc_id in docs:
+        candidates.setdefault(ntiid_values.get(doc_id), []).append(doc_id)
+    return [tuple(x) for x in candidates.values()]
+
+
+def get_content_packages(sites=(), mime_types=None, cached=False):
     """
     Return a list of :class:`.IContentPackage` objects
     based on the sites and mime types
+
+    :param cached: If true, reuse the result of an earlier query of the
+        same committed catalog state; the packages are always loaded
+        from the current connection.
     """
     if not sites:
         sites = get_component_hierarchy_names()
@@ -93,22 +157,204 @@ def get_content_packages(sites=(), mime_types=None):
     if not mime_types:
         mime_types = ALL_CONTENT_PACKAGE_MIME_TYPES
 
-    result = dict()
     intids = component.getUtility(IIntIds)
     catalog = get_contentlibrary_catalog()
     if catalog is None:  # tests
         return ()
-    for site in sites:
-        query = {
-            IX_SITE: {'any_of': (site,)},
-            IX_MIMETYPE: {'any_of': mime_types},
-        }
-        for doc_id in catalog.apply(query) or ():
+
+    sites = tuple(sites)
+    mime_types = tuple(mime_types)
+    key = None
+    candidates = None
+    generation = committed_generation(catalog) if cached else None
+    if generation is not None:
+        # pylint: disable=protected-access
+        key = (getattr(catalog, '_p_oid', None) or id(catalog),
+               generation, sites, mime_types)
+        candidates = _content_packages_cache.get(key)
+    if candidates is None:
+        candidates = _content_package_candidates(catalog, sites, mime_types)
+        if key is not None:
+            _content_packages_cache.put(key, candidates)
+
+    # Resolve the first choice for every NTIID in batches, and only
+    # fall back to the others when it is not a package
+    result = []
+    firsts = {x[0]: x for x in candidates}
+    for doc_id, context in iter_objects(sorted(firsts), intids):
+        if IContentPackage.providedBy(context):
+            result.append(context)
+            del firsts[doc_id]
+    for doc_ids in firsts.values():
+        for doc_id in doc_ids[1:]:
             context = intids.queryObject(doc_id)
-            if      IContentPackage.providedBy(context) \
-                and context.ntiid not in result:
-                result[context.ntiid] = context
-    return list(result.values())
+            if IContentPackage.providedBy(context):
+                result.append(context)
+                break
+    return result
+
+
+def _bundle_sites(site=None, parents=True):
+    if isinstance(site, six.string_types):
+        site = get_host_site(site)
+    # lowest site first
+    sites = get_component_hierarchy_names(site)
+    return sites if parents else sites[:1]
+
+
+def _visible_bundle_doc_ids(catalog, sites, ntiids=None, unsited=True):
+    """
+    Return a map from bundle NTIID to the doc id of the bundle with
+    that NTIID that is visible in the given site hierarchy (lowest
+    site first). Only index values are consulted; no bundles are loaded.
+
+    Bundles with no site value, such as those of the global bundle
+    library, rank beneath all of the sites; they are only included
+    if `unsited` is true.
+    """
+    query = {IX_SITE: {'any_of': sites}}
+    if ntiids is not None:
+        query[IX_NTIID] = {'any_of': ntiids}
+    site_values = catalog[IX_SITE].documents_to_values
+    ntiid_values = catalog[IX_NTIID].documents_to_values
+    doc_ids = list(catalog.apply(query) or ())
+    if unsited:
+        if ntiids is not None:
+            candidates = catalog.apply({IX_NTIID: {'any_of': ntiids}}) or ()
+        else:
+            candidates = ntiid_values.keys()
+        doc_ids.extend(x for x in candidates if x not in site_values)
+    rank = {name: idx for idx, name in enumerate(sites)}
+    visible = dict()
+    for doc_id in doc_ids:
+        bundle_ntiid = ntiid_values.get(doc_id)
+        if bundle_ntiid is None:
+            continue
+        doc_rank = rank.get(site_values.get(doc_id), len(rank))
+        if     bundle_ntiid not in visible \
+            or doc_rank < visible[bundle_ntiid][0]:
+            visible[bundle_ntiid] = (doc_rank, doc_id)
+    return {k: v[1] for k, v in visible.items()}
+
+
+def bundles_for_package(package, site=None, intids=None):
+    """
+    Return a list of the :class:`.IContentPackageBundle` objects that
+    contain the given package (or package ntiid), as visible from
+    the given site (or site name; defaults to the current site).
+
+    This uses the bundle catalog and so only loads the bundles that
+    are returned. As with :meth:`.IContentPackageBundleLibrary.getBundles`,
+    a bundle in a lower site overrides a bundle with the same NTIID in
+    a parent site, even if the lower bundle does not contain the package.
+    Indexed bundles that are in no site (those of the global bundle
+    library) are visible beneath every site.
+    """
+    catalog = get_contentbundle_catalog()
+    if catalog is None:  # tests
+        return []
+    sites = _bundle_sites(site)
+    ntiid = getattr(package, 'ntiid', package)
+    intids = component.getUtility(IIntIds) if intids is None else intids
+
+    # Which sites these are in is decided below
+    matches = catalog.apply({IX_PACKAGES: {'any_of': (ntiid,)}})
+    if not matches:
+        return []
+
+    # Find any bundle with the same NTIIDs in our site hierarchy; only
+    # the one in the lowest site is visible
+    ntiid_values = catalog[IX_NTIID].documents_to_values
+    bundle_ntiids = {ntiid_values.get(x) for x in matches}
+    bundle_ntiids.discard(None)
+    visible = _visible_bundle_doc_ids(catalog, sites, bundle_ntiids)
+
+    result = []
+    for doc_id in visible.values():
+        if doc_id in matches:
+            context = intids.queryObject(doc_id)
+            if context is not None:
+                result.append(context)
+    return result
+get_bundles_for_package = bundles_for_package
+
+
+#: The bundle catalog indexes that bundles can be sorted on,
+#: and the attribute each one indexes
+BUNDLE_SORT_INDEXES = {
+    IX_TITLE: 'title',
+    IX_CREATEDTIME: 'createdTime',
+    IX_LASTMODIFIED: 'lastModified',
+}
+
+
+def _missing_last(value, reverse):
+    # A sort key for values that may be missing (None), which sort
+    # last in either direction without being compared to the others
+    return (value is None) != reverse, value
+
+
+def get_bundles_page(sort_on=IX_TITLE, reverse=False, batch_start=0,
+                     batch_size=None, site=None, parents=True, intids=None):
+    """
+    Iterate the :class:`.IContentPackageBundle` objects visible from the
+    given site (or site name; defaults to the current site), sorted
+    on one of :const:`BUNDLE_SORT_INDEXES` and limited to the given page.
+    Bundles missing the sorted value come last.
+
+    Lower sites override higher ones as in
+    :meth:`.IContentPackageBundleLibrary.getBundles`. Overrides and
+    sorting are computed from the bundle catalog, so only the bundles
+    on the requested page are loaded.
+
+    :raises ValueError: If `sort_on` is not a sortable index. This is
+        raised by the call itself, not when iterating.
+    """
+    if sort_on not in BUNDLE_SORT_INDEXES:
+        raise ValueError("Cannot sort bundles on %s" % sort_on)
+    return _iter_bundles_page(sort_on, reverse, batch_start, batch_size,
+                              site, parents, intids)
+
+
+def _iter_bundles_page(sort_on, reverse, batch_start, batch_size,
+                       site, parents, intids):
+    catalog = get_contentbundle_catalog()
+    if catalog is None:  # tests
+        return
+    intids = component.getUtility(IIntIds) if intids is None else intids
+    doc_ids = list(_visible_bundle_doc_ids(catalog,
+                                           _bundle_sites(site, parents),
+                                           unsited=parents).values())
+    batch_end = None if batch_size is None else batch_start + batch_size
+
+    index = catalog.get(sort_on)
+    if index is None:
+        # An older catalog without this index; sort the objects
+        attr = BUNDLE_SORT_INDEXES[sort_on]
+        bundles = (intids.queryObject(x) for x in doc_ids)
+        bundles = sorted((x for x in bundles if x is not None),
+                         key=lambda x: _missing_last(getattr(x, attr, None),
+                                                     reverse),
+                         reverse=reverse)
+        for bundle in bundles[batch_start:batch_end]:
+            yield bundle
+        return
+
+    # Wrapped indexes keep their values in the raw index
+    values = getattr(index, 'index', index).documents_to_values
+
+    def sort_key(doc_id):
+        return _missing_last(values.get(doc_id), reverse)
+
+    if batch_end is not None:
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        doc_ids = select(batch_end, doc_ids, key=sort_key)
+    else:
+        doc_ids.sort(key=sort_key, reverse=reverse)
+    for doc_id in doc_ids[batch_start:batch_end]:
+        bundle = intids.queryObject(doc_id)
+        if bundle is not None:
+            yield bundle
 
 
 def _include_record(record, publish_time):
@@ -455,3 +701,46 @@ def export_content_package(package, backup=False, salt=None, filer=None):
     if 'salt' not in ext_obj:
         ext_obj['salt'] = salt
     return ext_obj
+
+
+#: The files of a rendered package hashed by
+#: :func:`content_package_fingerprint`
+FINGERPRINT_FILES = (TOC_FILENAME,
+                     DCMETA_FILENAME,
+                     VENDOR_INFO_NAME,
+                     u'course_info.json',
+                     u'nti_default_presentation_properties.json') \
+                  + tuple(iface.getTaggedValue(TAG_NAMESPACE_FILE)
+                          for iface in CONTAINER_IFACES)
+
+
+def content_package_fingerprint(package, names=FINGERPRINT_FILES):
+    """
+    Return a digest of the files that define the rendered `package`:
+    its TOC, Dublin Core metadata and indexed asset data. Keys that
+    carry an ``etag`` (S3) contribute that instead of their
+    contents. Returns `None` if none of the files can be found.
+
+    The files are looked up together through the hierarchy entry of
+    the key of the package, not the longer cached
+    ``does_sibling_entry_exist`` of the package; the :mod:`.existence`
+    cache of the entry is cleared when a library syncs.
+    """
+    entry = IDelimitedHierarchyEntry(getattr(package, 'key', None), None)
+    if entry is None:
+        return None
+    found = False
+    digest = hashlib.sha1()
+    existing = exists_many(entry, names)
+    for name in names:
+        key = existing[name]
+        if not key:
+            continue
+        found = True
+        data = getattr(key, 'etag', None) \
+            or entry.read_contents_of_sibling_entry(name)
+        digest.update(bytes_(name))
+        digest.update(b'\0')
+        digest.update(bytes_(data or b''))
+        digest.update(b'\0')
+    return digest.hexdigest() if found else None
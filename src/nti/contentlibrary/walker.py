@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Iterative traversal of content unit hierarchies.
+
+Content generated from deeply nested sources can exceed the
+interpreter's recursion limit, so these walkers keep an explicit
+stack of pending nodes instead of recursing. They are generators;
+the stack holds at most the unvisited siblings along the current path.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+#: Visit a node before its children
+PRE_ORDER = 'pre'
+
+#: Visit a node after its children
+POST_ORDER = 'post'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def unit_children(unit):
+    return unit.children or ()
+
+
+def _reversed(nodes):
+    try:
+        return reversed(nodes)
+    except TypeError:  # an iterator
+        return reversed(list(nodes))
+
+
+def walk_pre_order(root, children=unit_children):
+    """
+    Yield `root` and its descendants, each node before its children.
+    """
+    stack = [root]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        node = pop()
+        yield node
+        nodes = children(node)
+        if nodes:
+            extend(_reversed(nodes))
+
+
+def walk_post_order(root, children=unit_children):
+    """
+    Yield `root` and its descendants, each node after its children.
+    """
+    stack = [(root, False)]
+    pop = stack.pop
+    append = stack.append
+    while stack:
+        node, expanded = pop()
+        if expanded:
+            yield node
+            continue
+        nodes = children(node)
+        if nodes:
+            append((node, True))
+            for child in _reversed(nodes):
+                append((child, False))
+        else:
+            yield node
+
+
+def walk_events(root, children=unit_children):
+    """
+    Yield ``(node, entering)`` pairs: each node is yielded with
+    `True` before its children and with `False` after them. This
+    serves walks that do work on both sides of the children.
+
+    The children of a node are only requested after it has been
+    yielded as entered, so callers can prepare them there.
+    """
+    stack = [(root, True)]
+    pop = stack.pop
+    append = stack.append
+    while stack:
+        node, entering = pop()
+        yield node, entering
+        if entering:
+            append((node, False))
+            nodes = children(node)
+            if nodes:
+                for child in _reversed(nodes):
+                    append((child, True))
+
+
+def walk(root, order=PRE_ORDER, children=unit_children):
+    """
+    Walk the tree under `root` (inclusive) in the given order.
+    """
+    if order == PRE_ORDER:
+        return walk_pre_order(root, children)
+    if order == POST_ORDER:
+        return walk_post_order(root, children)
+    raise ValueError("Unknown traversal order", order)
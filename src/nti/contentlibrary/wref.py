@@ -10,8 +10,12 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import weakref
+import threading
 from functools import total_ordering
 
+import transaction
+
 from zope import component
 from zope import interface
 
@@ -29,6 +33,41 @@ from nti.wref.interfaces import IWeakRef
 logger = __import__('logging').getLogger(__name__)
 
 
+class _ResolutionCache(threading.local):
+    """
+    A per-thread cache of ntiid lookups, by transaction and then by
+    library. Transactions are held weakly, so the lookups, and the
+    objects they loaded, go away with their transaction. Lookups are
+    only valid for the library generation they were made in.
+    """
+
+    def __init__(self):
+        self.data = weakref.WeakKeyDictionary()
+
+    def for_library(self, lib):
+        # Imported here to avoid a bundle -> wref -> library import cycle
+        from nti.contentlibrary.library import library_generation
+        txn = transaction.get()
+        generation = library_generation()
+        entry = self.data.get(txn)
+        if entry is None or entry[0] != generation:
+            entry = self.data[txn] = (generation, {})
+        return entry[1].setdefault(lib, {})
+
+    def clear(self):
+        self.data.clear()
+
+_resolution_cache = _ResolutionCache()
+
+
+def _resolve(ntiid, lib, cache):
+    try:
+        return cache[ntiid]
+    except KeyError:
+        result = cache[ntiid] = lib.get(ntiid)
+        return result
+
+
 @total_ordering
 @EqHash('_ntiid')
 @component.adapter(IContentUnit)
@@ -45,10 +84,13 @@ class ContentUnitWeakRef(object):
 
     def __call__(self):
         # We're not a caching weak ref, we need to pick
-        # up on changes that happen in the library
+        # up on changes that happen in the library; we do
+        # share lookups for the duration of a transaction, though,
+        # as long as no library has changed
         lib = component.queryUtility(IContentPackageLibrary)
         if lib is not None:
-            return lib.get(self._ntiid)
+            cache = _resolution_cache.for_library(lib)
+            return _resolve(self._ntiid, lib, cache)
         return None
 
     def __lt__(self, other):
@@ -92,3 +134,37 @@ def contentunit_wref_to_missing_ntiid(ntiid):
     wref = ContentUnitWeakRef.__new__(ContentUnitWeakRef)
     wref._ntiid = ntiid  # pylint: disable=protected-access
     return wref
+
+
+def resolve_content_unit_wrefs(wrefs, library=None):
+    """
+    Resolve each of the given weak refs against the library, returning
+    a list of the results in the same order. Missing entries are
+    returned as `None`. Weak refs that are not :class:`ContentUnitWeakRef`
+    objects are simply called.
+
+    :keyword library: The library to use. If not given, the current
+        :class:`.IContentPackageLibrary` utility is used.
+    """
+    if library is None:
+        library = component.queryUtility(IContentPackageLibrary)
+    if library is None:
+        return [None if isinstance(x, ContentUnitWeakRef) else x()
+                for x in wrefs]
+    result = []
+    cache = _resolution_cache.for_library(library)
+    for wref in wrefs:
+        if isinstance(wref, ContentUnitWeakRef):
+            # pylint: disable=protected-access
+            result.append(_resolve(wref._ntiid, library, cache))
+        else:
+            result.append(wref())
+    return result
+
+
+try:
+    import zope.testing.cleanup
+except ImportError:  # pragma: no cover
+    pass
+else:
+    zope.testing.cleanup.addCleanUp(_resolution_cache.clear)
@@ -30,11 +30,14 @@ from nti.base._compat import text_
 from nti.contentlibrary.boto_s3 import NameEqualityBucket
 from nti.contentlibrary.boto_s3 import BotoS3BucketContentLibrary
 
+from nti.contentlibrary.interfaces import ICompiledTOCCache
 from nti.contentlibrary.interfaces import IContentPackageLibrary
 from nti.contentlibrary.filesystem import GlobalFilesystemContentPackageLibrary
 
 from nti.contentlibrary.externalization import map_all_buckets_to
 
+from nti.contentlibrary.toc_cache import FilesystemCompiledTOCCache
+
 from nti.schema.field import ValidTextLine
 
 logger = __import__('logging').getLogger(__name__)
@@ -65,8 +68,15 @@ class IFilesystemLibrary(interface.Interface):
         required=False,
         default=u"")
 
+    snapshot = zope.configuration.fields.Path(
+        title=u"Path to a snapshot file of the content packages.",
+        description=u"""If given, the library writes its content packages to this
+            file when it syncs, and processes starting later load them from it
+            instead of parsing the content, as long as nothing changed.""",
+        required=False)
+
 
-def registerFilesystemLibrary(_context, directory=None, prefix=""):
+def registerFilesystemLibrary(_context, directory=None, prefix="", snapshot=None):
     if not directory or not os.path.isdir(directory):
         raise ConfigurationError("Must give the path of a readable directory")
 
@@ -78,7 +88,8 @@ def registerFilesystemLibrary(_context, directory=None, prefix=""):
 
     factory = functools.partial(GlobalFilesystemContentPackageLibrary,
                                 root=text_(directory),
-                                prefix=text_(prefix))
+                                prefix=text_(prefix),
+                                snapshot=text_(snapshot) if snapshot else None)
     utility(_context, factory=factory, provides=IContentPackageLibrary)
 register_filesystem_library = registerFilesystemLibrary
 
@@ -134,3 +145,22 @@ def registerS3Library(_context, bucket, cdn_name=None):
             kw={'_global': False}
         )
 register_s3_library = registerS3Library
+
+
+class ICompiledTOCCacheDirective(interface.Interface):
+    """
+    Store compiled TOCs in a directory, so content packages are
+    built without parsing their TOC XML once it has been seen.
+    """
+
+    directory = zope.configuration.fields.Path(
+        title=u"Path to the directory of the compiled TOCs.",
+        description=u"It is created if it does not exist.",
+        required=True
+    )
+
+
+def registerCompiledTOCCache(_context, directory):
+    cache = FilesystemCompiledTOCCache(text_(directory))
+    utility(_context, component=cache, provides=ICompiledTOCCache)
+register_compiled_toc_cache = registerCompiledTOCCache